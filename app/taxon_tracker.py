@@ -1,19 +1,24 @@
 import logging
 import pandas
 import datetime
-import math
 import pytz
 import sqlalchemy
+import threading
+import time
 
-from typing import Callable
+from typing import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy.orm import Session
-from time import sleep
-from requests import request
 
 from taxon_tracker import filters
+from taxon_tracker.ena import ENA_Error, get_client
+from taxon_tracker.pipeline import prefetch
+from taxon_tracker.scheduler import Scheduler, TaxonState
+from taxon_tracker.listener import Event, Listener
+from taxon_tracker.leases import LeaseUnavailable, get_leases
 from taxon_tracker.settings import Settings
 from taxon_tracker.logging import DatabaseHandler, stream_handler, log_format
-from taxon_tracker.database import Tables, COLUMNS, get_engine
+from taxon_tracker.database import Tables, COLUMNS, get_engine, copy_dataframe, copy_upsert, prepare_details
 
 
 logger = logging.getLogger(__file__)
@@ -23,49 +28,194 @@ logger.addHandler(DatabaseHandler())
 logger.setLevel(logging.DEBUG)
 
 
-class ENA_Error(BaseException):
-    pass
+def chunks(list_like: any, size: int) -> Iterator:
+    """
+    Lazily yield successive slices of list_like of at most size items.
+    DataFrames are sliced by row position.
+    """
+    rows = getattr(list_like, 'iloc', list_like)
+    for i in range(0, len(list_like), size):
+        yield rows[i:i + size]
 
 
-def rate_limit(list_like: list, fun: Callable, rate: int) -> any:
+def rate_limit(list_like: any, fun: Callable, rate: int) -> Iterator:
     """
-    Apply a function to a list in segments of rate length.
-    fun() should return a list when handed a list.
+    Apply a function to a list in segments of rate length, lazily yielding the results.
+    fun() should return an iterable when handed a list.
     """
-    processed_list = []
-    for i in range(math.ceil(len(list_like) / rate)):
-        list_slice = list_like[i * rate:(i + 1) * rate]
-        processed_list = [*processed_list, *fun(list_slice)]
-
-    return processed_list
+    for list_slice in chunks(list_like, rate):
+        yield from fun(list_slice)
 
 
-def get_taxons_to_check() -> pandas.DataFrame:
-    taxon_id = COLUMNS[Tables.TAXON].ID.value
+def get_taxon_schedule(counts: dict, recount: set = None) -> tuple:
+    """
+    Return the database time the schedule was read at, and the scheduling state of every taxon id
+    not leased by another crawler: seconds since it was last updated, records fetched for it over
+    the last update period, and records waiting to be assembled.
+    Record counts are kept in counts, a dict of taxon id to (recent yield, backlog) held by the caller
+    between reads. Only taxon ids in recount, or not counted yet, are recounted, through the records'
+    taxon_id indexes, so a read costs little when few taxon ids have changed.
+    If recount is None every taxon id is recounted in one pass over the records.
+    """
+    lease_owner = COLUMNS[Tables.TAXON].LEASE_OWNER.value
+    lease_expires_at = COLUMNS[Tables.TAXON].LEASE_EXPIRES_AT.value
+    t_id = COLUMNS[Tables.TAXON].ID.value
     last_updated = COLUMNS[Tables.TAXON].LAST_UPDATED.value
-    # Fetch records for outdated taxon_ids
+    r_taxon = COLUMNS[Tables.RECORD].TAXON.value
+    time_fetched = COLUMNS[Tables.RECORD].TIME_FETCHED.value
+    passed_filter = COLUMNS[Tables.RECORD].PASSED_FILTER.value
+    assembly_result = COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value
     with get_engine().connect() as conn:
-        df = pandas.read_sql(
-            sql=sqlalchemy.text((
-                f"SELECT {taxon_id} FROM {Tables.TAXON.value} WHERE "
-                f"{last_updated} IS NULL OR "
-                # Updated over a week ago
-                f"DATE_PART('{Settings.TAXON_UPDATE_UNITS.value}', NOW() - {last_updated}) >= "
-                f"{Settings.TAXON_UPDATE_N.value}"
-            )),
-            con=conn
+        read_at = conn.execute(sqlalchemy.text("SELECT NOW()")).scalar()
+        taxa = conn.execute(sqlalchemy.text((
+            f"SELECT {t_id}, EXTRACT(EPOCH FROM NOW() - {last_updated}) FROM {Tables.TAXON.value} "
+            f"WHERE {lease_owner} IS NULL OR {lease_owner} = :owner OR {lease_expires_at} < NOW()"
+        )), {'owner': get_leases().owner}).all()
+
+        if recount is None:
+            stale = [int(row[0]) for row in taxa]
+        else:
+            stale = [int(row[0]) for row in taxa if row[0] in recount or row[0] not in counts]
+        if len(stale) > 0:
+            rows = conn.execute(sqlalchemy.text((
+                f"SELECT {r_taxon}, "
+                f"COUNT(*) FILTER (WHERE {time_fetched} > NOW() - INTERVAL '{update_interval()}'), "
+                f"COUNT(*) FILTER (WHERE {passed_filter} AND {assembly_result} IS NULL) "
+                f"FROM {Tables.RECORD.value} " +
+                ("" if recount is None else f"WHERE {r_taxon} = ANY(:taxon_ids) ") +
+                f"GROUP BY {r_taxon}"
+            )), {'taxon_ids': stale}).all()
+            counts.update({taxon_id: (0, 0) for taxon_id in stale})
+            counts.update({int(row[0]): (int(row[1]), int(row[2])) for row in rows})
+
+    return read_at, [
+        TaxonState(
+            taxon_id=int(row[0]),
+            age=None if row[1] is None else float(row[1]),
+            recent_yield=counts[int(row[0])][0],
+            backlog=counts[int(row[0])][1]
         )
-    return df
+        for row in taxa
+    ]
 
 
-def update_taxons(taxon_ids: pandas.DataFrame) -> None:
-    if len(taxon_ids) == 0:
-        logger.debug("No taxon ids need checking.")
-        return
+def update_interval() -> str:
+    return f"{Settings.TAXON_UPDATE_N.value} {Settings.TAXON_UPDATE_UNITS.value}"
+
+
+def crawl(scheduler: Scheduler, listener: Listener = None, stop: threading.Event = None) -> None:
+    """
+    Sync taxon ids with ENA as the scheduler finds them due, and release stale records.
+    At most CRAWLER_WORKERS taxon ids are processed at once.
+    A failure for one taxon id is logged and does not affect the others;
+    that taxon id keeps its old last_updated value and is retried after SCHEDULER_RETRY_SECONDS.
+    A taxon id leased by another instance, or updated by one since the schedule was read, is skipped
+    until the schedule is read again.
+    The loop sleeps until the next taxon id is due, the next claimed record expires, a sync finishes,
+    or the listener passes on a notification from the web API.
+    While the listener is connected the taxon list is re-read when something changes,
+    and otherwise every SCHEDULER_IDLE_SECONDS; without it, it is polled every SCHEDULER_POLL_SECONDS.
+    Record counts are only recounted for taxon ids whose sync has finished or that had an assembly reported
+    since the last read,
+    and for every taxon id once every SCHEDULER_RECOUNT_SECONDS, which also lets recent yields age.
+    If stop is given, crawling ends once it is set and running syncs have finished;
+    call scheduler.notify() after setting it to stop without waiting for the next wake-up.
+    """
+    workers = max(1, Settings.CRAWLER_WORKERS.value)
+    refresh = threading.Event()
+    refresh.set()
+    schedule_read_at = None
+    refreshed_at = None
+    counts = {}
+    recount = set()
+    recount_lock = threading.Lock()
+    counted_at = None
+
+    def finished(taxon_id: int, future) -> None:
+        with recount_lock:
+            recount.add(taxon_id)
+        refresh.set()
+        try:
+            future.result()
+        except LeaseUnavailable as e:
+            logger.debug(e)
+            scheduler.done(taxon_id, retry_after=Settings.TAXON_LEASE_SECONDS.value)
+        except BaseException as e:
+            logger.error(f"Error updating taxon id {taxon_id}. It will be retried later. Error: {e}")
+            scheduler.done(taxon_id, retry_after=Settings.SCHEDULER_RETRY_SECONDS.value)
+        else:
+            scheduler.done(taxon_id)
+
+    def taxons_changed(*_) -> None:
+        refresh.set()
+        scheduler.notify()
+
+    def assembly_reported(message: dict) -> None:
+        # A report only shifts its taxon's backlog, so only that taxon's records are recounted
+        if isinstance(message.get('taxon_id'), int):
+            with recount_lock:
+                recount.add(message['taxon_id'])
+        taxons_changed()
+
+    if listener is not None:
+        listener.handlers.update({
+            Event.TAXON_ADDED.value: taxons_changed,
+            Event.RECORD_CLAIMED.value: lambda _: scheduler.notify(),
+            Event.ASSEMBLY_REPORTED.value: assembly_reported
+        })
+        listener.on_reconnect = taxons_changed
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crawler') as executor:
+        while stop is None or not stop.is_set():
+            listening = listener is not None and listener.connected.is_set()
+            release_due = None
+            # While listening the schedule is still re-read every SCHEDULER_IDLE_SECONDS,
+            # picking up changes no notification was sent for
+            if refreshed_at is None or time.monotonic() - refreshed_at >= Settings.SCHEDULER_IDLE_SECONDS.value:
+                refresh.set()
+            try:
+                if refresh.is_set() or not listening:
+                    refresh.clear()
+                    refreshed_at = time.monotonic()
+                    count_all = counted_at is None or \
+                        time.monotonic() - counted_at >= Settings.SCHEDULER_RECOUNT_SECONDS.value
+                    with recount_lock:
+                        changed = set(recount)
+                    schedule_read_at, schedule = get_taxon_schedule(counts, None if count_all else changed)
+                    # Taxon ids that finished while reading stay marked for the next read
+                    with recount_lock:
+                        recount.difference_update(changed)
+                    if count_all:
+                        counted_at = time.monotonic()
+                    scheduler.update(schedule)
+                for taxon_id in scheduler.pop_due(workers - scheduler.running):
+                    future = executor.submit(update_taxon, taxon_id, schedule_read_at)
+                    future.add_done_callback(lambda f, t=taxon_id: finished(t, f))
+
+                # Release records that were requested but not acknowledged
+                release_records()
+                release_due = next_release()
 
+            except BaseException as e:
+                logger.error(e)
+
+            timeout = Settings.SCHEDULER_IDLE_SECONDS.value if listening else Settings.SCHEDULER_POLL_SECONDS.value
+            if release_due is not None:
+                timeout = min(timeout, release_due)
+            scheduler.wait(timeout=timeout)
+
+
+def update_taxon(taxon_id: int, updated_before: datetime.datetime = None) -> None:
+    """
+    Sync taxon_id with ENA while holding its lease, so no other crawler instance syncs it at the same time.
+    Raises LeaseUnavailable if another instance holds the lease, or if updated_before is given
+    and taxon_id has been updated since then.
+    """
     t_id = COLUMNS[Tables.TAXON].ID.value
     last_updated = COLUMNS[Tables.TAXON].LAST_UPDATED.value
-    for taxon_id in taxon_ids[t_id]:
+    leases = get_leases()
+    leases.claim(taxon_id, updated_before=updated_before)
+    try:
         update_records(taxon_id)
         # mark id as updated
         with Session(get_engine()) as session:
@@ -73,6 +223,8 @@ def update_taxons(taxon_ids: pandas.DataFrame) -> None:
                 f"UPDATE {Tables.TAXON.value} SET {last_updated}=NOW() WHERE {t_id}={taxon_id}"
             )))
             session.commit()
+    finally:
+        leases.release(taxon_id)
 
 
 def update_records(taxon_id: int) -> None:
@@ -81,74 +233,188 @@ def update_records(taxon_id: int) -> None:
     query_ENA(taxon_id)
 
     # Filter new records for suitability
-    filter_records()
+    filter_records(taxon_id)
 
 
 def query_ENA(taxon_id: int) -> None:
-    logger.info(f"Fetching ENA record numbers for taxon id {taxon_id}.")
-    records = None
+    """
+    Fetch details for any ENA records for taxon_id that are not held locally.
+    Listing, diffing and detail fetching run as a pipeline: each page of run accessions is
+    diffed against the local table and its missing records fetched while later pages are still
+    being listed, so records are saved as soon as their page arrives.
+
+    Normally only records ENA has updated after the taxon's watermark day are listed.
+    These are all fetched, so changed metadata for records held locally is merged in too.
+    The full subtree is listed instead when there is no watermark yet, or when the
+    last full reconciliation is older than FULL_SYNC_N FULL_SYNC_UNITS.
+    """
+    watermark, full_sync = get_sync_state(taxon_id)
+    if full_sync:
+        logger.info(f"Fetching all ENA record numbers for taxon id {taxon_id}.")
+        listing = iter_ENA_runs(taxon_id)
+    else:
+        logger.info(f"Fetching ENA record numbers updated after {watermark} for taxon id {taxon_id}.")
+        listing = iter_ENA_updates(taxon_id, watermark)
+
+    depth = Settings.ENA_PIPELINE_DEPTH.value
+    n_remote = 0
+    n_wanted = 0
+    n_saved = 0
+    pages = prefetch(listing, depth)
+    if full_sync:
+        # Fetch records if they don't already exist.
+        pages = ((p, get_missing_records(p, taxon_id)) for p in pages)
+    else:
+        pages = ((p, p) for p in pages)
+    for page, wanted in prefetch(pages, depth):
+        n_remote += len(page)
+        n_wanted += len(wanted)
+        if len(wanted) > 0:
+            n_saved += fetch_ENA_records(wanted, taxon_id)
+
+    logger.debug(f"Found {n_remote} record numbers for taxon_id {taxon_id}.")
+    if full_sync:
+        logger.info(f"{n_remote - n_wanted}/{n_remote} ENA records exist locally.")
+
+    # Only move the watermark on if nothing was left behind, so failed records are listed again next time
+    if n_saved == n_wanted:
+        save_sync_state(taxon_id, full_sync)
+
+
+def get_sync_state(taxon_id: int) -> tuple:
+    """
+    Return the ENA watermark for taxon_id and whether a full reconciliation is due.
+    """
+    t_id = COLUMNS[Tables.TAXON].ID.value
+    watermark = COLUMNS[Tables.TAXON].ENA_WATERMARK.value
+    last_full_sync = COLUMNS[Tables.TAXON].LAST_FULL_SYNC.value
+    with get_engine().connect() as conn:
+        state = conn.execute(sqlalchemy.text((
+            f"SELECT {watermark}, "
+            f"{watermark} IS NULL OR {last_full_sync} IS NULL OR "
+            f"{last_full_sync} < NOW() - INTERVAL '{Settings.FULL_SYNC_N.value} {Settings.FULL_SYNC_UNITS.value}' "
+            f"FROM {Tables.TAXON.value} WHERE {t_id} = {taxon_id}"
+        ))).one()
+    return state[0], state[1]
+
+
+def save_sync_state(taxon_id: int, full_sync: bool) -> None:
+    """
+    Set the ENA watermark for taxon_id to the latest ENA last_updated date held locally,
+    but no later than yesterday: ENA may still update records today after this pass,
+    so only days that are over count as fully processed.
+    """
+    t_id = COLUMNS[Tables.TAXON].ID.value
+    watermark = COLUMNS[Tables.TAXON].ENA_WATERMARK.value
+    last_full_sync = COLUMNS[Tables.TAXON].LAST_FULL_SYNC.value
+    with Session(get_engine()) as session:
+        session.execute(sqlalchemy.text((
+            f"UPDATE {Tables.TAXON.value} SET {watermark} = COALESCE(("
+            f"  SELECT LEAST(MAX(d.{COLUMNS[Tables.RECORD_DETAILS].LAST_UPDATED.value}), CURRENT_DATE - 1) "
+            f"  FROM {Tables.RECORD_DETAILS.value} d "
+            f"  JOIN {Tables.RECORD.value} r ON r.{COLUMNS[Tables.RECORD].ID.value} = "
+            f"d.{COLUMNS[Tables.RECORD_DETAILS].RECORD.value} "
+            f"  WHERE r.{COLUMNS[Tables.RECORD].TAXON.value} = {taxon_id}"
+            f"), {watermark})" +
+            (f", {last_full_sync} = NOW()" if full_sync else "") +
+            f" WHERE {t_id} = {taxon_id}"
+        )))
+        session.commit()
+
+
+def iter_ENA_pages(path: str, params: dict) -> Iterator[pandas.DataFrame]:
+    """
+    Yield the results of an ENA query one page at a time.
+    """
     offset = 0
     limit = Settings.ENA_REQUEST_LIMIT.value
     while True:
-        url = (
-            f"https://www.ebi.ac.uk/ena/portal/api/links/taxon?"
-            f"accession={taxon_id}"
-            f"&format=json"
-            f"&limit={limit}"
-            f"&offset={offset}"
-            f"&result=read_run"
-            f"&subtree=true"
-        )
-        logger.debug(url)
-        result = request('GET', url)
+        logger.debug(f"Fetching {path} results {offset}:{offset + limit} for {params}")
+        result = get_client().get(path, params={**params, 'format': 'json', 'limit': limit, 'offset': offset})
 
         if result.status_code == 204:
             # Undocumented, but ENA sends 204 when asking for out-of-range results
-            break
+            return
         if result.status_code != 200:
             raise ENA_Error(result.text)
 
         df = pandas.read_json(result.text)
 
-        if type(df) is not pandas.DataFrame:
-            break
-        if records is None:
-            records = df
-        else:
-            records = pandas.concat([df, records], ignore_index=True)
+        if type(df) is not pandas.DataFrame or len(df) == 0:
+            return
+
+        yield df
 
         if len(df) >= limit:
             offset = offset + limit
         else:
-            break
+            return
 
-    logger.debug(f"Found {len(records)} record numbers for taxon_id {taxon_id}.")
 
-    t_id = COLUMNS[Tables.RECORD].TAXON.value
+def iter_ENA_runs(taxon_id: int) -> Iterator[pandas.DataFrame]:
+    """
+    Yield the run accessions for taxon_id (including its subtree) one page at a time.
+    """
+    return iter_ENA_pages('links/taxon', {
+        'accession': taxon_id,
+        'result': 'read_run',
+        'subtree': 'true'
+    })
+
+
+def iter_ENA_updates(taxon_id: int, since: datetime.date) -> Iterator[pandas.DataFrame]:
+    """
+    Yield the run accessions for taxon_id (including its subtree) that ENA
+    has updated after since, one page at a time.
+    """
     run_accession = COLUMNS[Tables.RECORD].RUN_ACCESSION.value
+    return iter_ENA_pages('search', {
+        'query': f"tax_tree({taxon_id}) AND last_updated>{since.isoformat()}",
+        'result': 'read_run',
+        'fields': f"{run_accession},last_updated"
+    })
 
-    with get_engine().connect() as conn:
-        existing_records = pandas.read_sql(sqlalchemy.text((
-            f"SELECT {run_accession} FROM {Tables.RECORD.value} WHERE {t_id} = {taxon_id}"
-        )), con=conn)
 
-    missing = records.loc[~records[run_accession].isin(existing_records[run_accession])]
+def get_missing_records(records: pandas.DataFrame, taxon_id: int) -> pandas.DataFrame:
+    """
+    Return the run accessions in records that are not yet held locally for taxon_id.
+    The accessions are copied into a temporary table and diffed with an anti-join,
+    so only the missing accessions are sent back from the database.
+    """
+    t_id = COLUMNS[Tables.RECORD].TAXON.value
+    run_accession = COLUMNS[Tables.RECORD].RUN_ACCESSION.value
 
-    logger.info(f"{len(existing_records)}/{len(records)} ENA records exist locally.")
+    with get_engine().begin() as conn:
+        conn.execute(sqlalchemy.text((
+            f"CREATE TEMPORARY TABLE remote_accessions ({run_accession} TEXT) ON COMMIT DROP"
+        )))
+        copy_dataframe(conn, records[[run_accession]], 'remote_accessions')
+        missing = pandas.read_sql(
+            sql=sqlalchemy.text((
+                f"SELECT DISTINCT ra.{run_accession} FROM remote_accessions ra "
+                f"WHERE NOT EXISTS ("
+                f"  SELECT 1 FROM {Tables.RECORD.value} r "
+                f"  WHERE r.{t_id} = {taxon_id} AND r.{run_accession} = ra.{run_accession}"
+                f")"
+            )),
+            con=conn
+        )
 
-    # Fetch records if they don't already exist.
-    if len(missing) > 0:
-        fetch_ENA_records(missing, taxon_id)
+    return missing
 
 
-def fetch_ENA_records(records: pandas.DataFrame, taxon_id: int) -> None:
+def fetch_ENA_records(records: pandas.DataFrame, taxon_id: int) -> int:
+    """
+    Fetch and save the ENA details for records.
+    Records already held locally are updated if ENA's metadata for them has changed.
+    Returns the number of records saved.
+    """
     logger.info(f"Fetching records for {len(records)} records.")
+    n_records = len(records)
     limit = Settings.ENA_REQUEST_LIMIT.value
     response_limit = 0
-    successes = []
-    for i in range(math.ceil(len(records) / limit)):
-        ans = records.iloc[i * limit:(i + 1) * limit]
-        url = "https://www.ebi.ac.uk/ena/portal/api/search"
+    n_saved = 0
+    for i, ans in enumerate(chunks(records, limit)):
         data = {
             'includeAccessions': f"{','.join(ans[COLUMNS[Tables.RECORD].RUN_ACCESSION.value])}",
             'result': 'read_run',
@@ -157,33 +423,26 @@ def fetch_ENA_records(records: pandas.DataFrame, taxon_id: int) -> None:
             'fields': 'all'
         }
         logger.debug(f"Fetching records {i * limit}:{(i + 1) * limit}")
-
-        # TODO: remove debugging fwrite
-        with open('.request', 'w+') as f:
-            f.write(f"POST {url}\n\n{data}")
-        result = request('POST', url=url, data=data)
+        result = get_client().post('search', data=data)
         if result.status_code != 200:
             logger.warning((
                 f"Error retrieving ENA record details. They will be retrieved later. API Error: {result.text}"
             ))
         else:
             try:
-                records = pandas.read_json(result.text)
+                records = pandas.read_json(result.text, dtype=False, convert_dates=False)
                 if len(records) == 0:
                     logger.warning(f"Empty result set retrieved.")
                     continue
 
                 # Tidy up a couple of columns
-                record_ids = []
-                for r in range(len(records)):
-                    row = records.iloc[r].to_dict()
-                    record_ids.append((
-                        f"{row[COLUMNS[Tables.RECORD_DETAILS].SAMPLE_ACCESSION.value]}_"
-                        f"{row[COLUMNS[Tables.RECORD_DETAILS].EXPERIMENT_ACCESSION.value]}_"
-                        f"{row[COLUMNS[Tables.RECORD_DETAILS].RUN_ACCESSION.value]}"
-                    ))
-                records[COLUMNS[Tables.RECORD_DETAILS].RECORD.value] = record_ids
+                records[COLUMNS[Tables.RECORD_DETAILS].RECORD.value] = (
+                    records[COLUMNS[Tables.RECORD_DETAILS].SAMPLE_ACCESSION.value].astype(str) + '_' +
+                    records[COLUMNS[Tables.RECORD_DETAILS].EXPERIMENT_ACCESSION.value].astype(str) + '_' +
+                    records[COLUMNS[Tables.RECORD_DETAILS].RUN_ACCESSION.value].astype(str)
+                )
                 records[COLUMNS[Tables.RECORD_DETAILS].TIME_FETCHED.value] = datetime.datetime.now(tz=pytz.UTC)
+                records = prepare_details(records)
 
                 # Slim table for saving space
                 slim_records = records.filter(items=[
@@ -211,148 +470,312 @@ def fetch_ENA_records(records: pandas.DataFrame, taxon_id: int) -> None:
                 })
                 slim_records[COLUMNS[Tables.RECORD].TAXON.value] = taxon_id
 
-                with get_engine().connect() as conn:
-                    records.to_sql(
-                        name=Tables.RECORD_DETAILS.value,
-                        con=conn,
-                        if_exists='append',
-                        index=False
+                # Save both tables in one transaction, merging into any rows that already exist.
+                # Records whose metadata has changed lose their filter decision, so they are filtered again.
+                with get_engine().begin() as conn:
+                    copy_upsert(
+                        conn,
+                        slim_records,
+                        Tables.RECORD,
+                        key_column=COLUMNS[Tables.RECORD].ID.value,
+                        insert_only_columns=[COLUMNS[Tables.RECORD].TAXON.value],
+                        uncompared_columns=[COLUMNS[Tables.RECORD].TIME_FETCHED.value],
+                        reset_columns=[
+                            COLUMNS[Tables.RECORD].PASSED_FILTER.value,
+                            COLUMNS[Tables.RECORD].FILTER_HASH.value
+                        ]
                     )
-                    slim_records.to_sql(
-                        name=Tables.RECORD.value,
-                        con=conn,
-                        if_exists='append',
-                        index=False
+                    inserted, updated, unchanged = copy_upsert(
+                        conn,
+                        records,
+                        Tables.RECORD_DETAILS,
+                        key_column=COLUMNS[Tables.RECORD_DETAILS].RECORD.value,
+                        uncompared_columns=[COLUMNS[Tables.RECORD_DETAILS].TIME_FETCHED.value]
                     )
-                    conn.commit()
+                    reset_filter_decisions(conn, updated)
+                logger.debug((
+                    f"Saved record details: {len(inserted)} new, {len(updated)} updated, {unchanged} unchanged."
+                ))
 
-                successes = [*successes, *ans]
+                n_saved += len(ans)
 
             except BaseException as e:
                 logger.error((
                     f"Error saving ENA record details. They will be retrieved later. Error: {e}"
                 ))
 
-    logger.info(f"Fetched {len(successes)}/{len(records)} record details.")
+    logger.info(f"Fetched {n_saved}/{n_records} record details.")
+    return n_saved
 
 
-def filter_records() -> None:
+def filter_records(taxon_id: int = None) -> None:
     """
-    Fetch records for any record numbers without a passed_filter decision and apply filters.
+    Apply the taxon's pre-assembly filters to its records.
+    Records are filtered if they have no passed_filter decision yet, or if they are not yet assembled and
+    their decision was made under a different filter specification, so changing a taxon's filters only
+    re-evaluates the records the change can affect.
+    If every filter has an SQL form the whole pass runs as one UPDATE inside the database.
+    Otherwise pending records are streamed from a server-side cursor in batches of FILTER_BATCH_SIZE and
+    each batch's results are saved before the next is read, so memory use stays bounded
+    however many records are waiting. Only the details columns the filters read are fetched.
+    If taxon_id is not specified, records for all taxon ids are filtered.
     """
+    if taxon_id is None:
+        with get_engine().connect() as conn:
+            taxon_ids = conn.execute(sqlalchemy.text(
+                f"SELECT {COLUMNS[Tables.TAXON].ID.value} FROM {Tables.TAXON.value}"
+            )).scalars().all()
+        for t in taxon_ids:
+            filter_records(t)
+        return
+
     record = COLUMNS[Tables.RECORD].ID.value
+    t_id = COLUMNS[Tables.RECORD].TAXON.value
     r_id = COLUMNS[Tables.RECORD_DETAILS].RECORD.value
     passed_filter = COLUMNS[Tables.RECORD].PASSED_FILTER.value
     filter_failed = COLUMNS[Tables.RECORD].FILTER_FAILED.value
-    waiting_since = COLUMNS[Tables.RECORD].WAITING_SINCE.value
-    with get_engine().connect() as conn:
-        records = pandas.read_sql(
-            sql=sqlalchemy.text((
-                f"SELECT {record}, {passed_filter} FROM {Tables.RECORD.value} WHERE "
-                f"{passed_filter} IS NULL"
-            )),
-            con=conn
-        )
-
-    if len(records) == 0:
+    pipeline = get_filter_pipeline(taxon_id)
+    pushed_down = pipeline.sql('d')
+    if pushed_down is not None:
+        n_records, n_passed = filter_records_in_database(taxon_id, pipeline.hash, *pushed_down)
+        if n_records > 0:
+            logger.info(f"{n_passed}/{n_records} new records acceptable for assembly.")
         return
-    else:
-        logger.info(f"Found {len(records)} records awaiting filtering.")
 
-    # Check records against filters
+    n_records = 0
+    n_passed = 0
     with get_engine().connect() as conn:
-        records = pandas.read_sql(
-            sql=sqlalchemy.text((
-                f"SELECT * FROM {Tables.RECORD_DETAILS.value} WHERE "
-                f"{r_id} IN "
-                f"{tuple(records[record])}"
+        pending = conn.execution_options(stream_results=True).execute(
+            sqlalchemy.text((
+                f"SELECT {record} FROM {Tables.RECORD.value} AS r "
+                f"WHERE {t_id} = {taxon_id} AND {pending_filter('r')}"
             )),
-            con=conn
+            {'filter_hash': pipeline.hash}
         )
+        for batch in pending.scalars().partitions(Settings.FILTER_BATCH_SIZE.value):
+            with get_engine().connect() as details_conn:
+                records = pandas.read_sql(
+                    sql=sqlalchemy.text((
+                        f"SELECT {', '.join([r_id, *pipeline.fields])} FROM {Tables.RECORD_DETAILS.value} "
+                        f"WHERE {r_id} = ANY(:ids)"
+                    )),
+                    con=details_conn,
+                    params={'ids': list(batch)}
+                )
+            if len(records) == 0:
+                continue
+
+            # Check records against filters
+            pipeline.apply(records=records, col_name_passed=passed_filter, col_name_failed=filter_failed)
+            save_filter_results(records[[r_id, passed_filter, filter_failed]], pipeline.hash)
+            n_records += len(records)
+            n_passed += int(records[passed_filter].sum())
+            logger.debug(f"Filtered {n_records} records.")
+
+    if n_records > 0:
+        logger.info(f"{n_passed}/{n_records} new records acceptable for assembly.")
+
+
+def get_filter_pipeline(taxon_id: int) -> filters.FilterPipeline:
+    """
+    Get the compiled pre-assembly filters for taxon_id.
+    Taxons without pre_assembly_filters use the default filters.
+    """
+    t_id = COLUMNS[Tables.TAXON].ID.value
+    spec = COLUMNS[Tables.TAXON].PRE_ASSEMBLY_FILTERS.value
+    with get_engine().connect() as conn:
+        taxon_filters = conn.execute(sqlalchemy.text(
+            f"SELECT {spec} FROM {Tables.TAXON.value} WHERE {t_id} = {taxon_id}"
+        )).scalar()
+    return filters.get_pipeline(taxon_filters)
 
-    filters.apply_filters(records=records, col_name_passed=passed_filter, col_name_failed=filter_failed)
 
-    # Save results
-    # rename record number
-    new_records = records[[r_id, passed_filter, filter_failed]]
-    with Session(get_engine()) as session:
-        session.execute(
+def pending_filter(table: str) -> str:
+    """
+    SQL condition for records in table needing a decision from the filters with hash :filter_hash.
+    """
+    passed_filter = COLUMNS[Tables.RECORD].PASSED_FILTER.value
+    filter_hash = COLUMNS[Tables.RECORD].FILTER_HASH.value
+    assembly_result = COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value
+    return (
+        f"({table}.{passed_filter} IS NULL OR ("
+        f"{table}.{filter_hash} IS DISTINCT FROM :filter_hash AND {table}.{assembly_result} IS NULL"
+        f"))"
+    )
+
+
+def filter_records_in_database(taxon_id: int, filter_hash: str, passed: str, failed: str, params: dict) -> tuple:
+    """
+    Set filter decisions for pending records with a single UPDATE,
+    using the SQL expressions produced by FilterPipeline.sql for a record details table aliased as d.
+    Newly filtered records are marked as waiting, letting the API know they are available.
+    Returns counts of (records filtered, records passed).
+    """
+    record = COLUMNS[Tables.RECORD].ID.value
+    t_id = COLUMNS[Tables.RECORD].TAXON.value
+    r_id = COLUMNS[Tables.RECORD_DETAILS].RECORD.value
+    passed_filter = COLUMNS[Tables.RECORD].PASSED_FILTER.value
+    filter_failed = COLUMNS[Tables.RECORD].FILTER_FAILED.value
+    filter_hash_col = COLUMNS[Tables.RECORD].FILTER_HASH.value
+    waiting_since = COLUMNS[Tables.RECORD].WAITING_SINCE.value
+    with get_engine().begin() as conn:
+        counts = conn.execute(
             sqlalchemy.text((
-                f"UPDATE {Tables.RECORD.value} "
-                f"SET "
-                f"{record}=:an, {passed_filter}=:fltr, {filter_failed}=:fail, {waiting_since} = NOW() "
-                f"WHERE {record}=:an"
+                f"WITH filtered AS ("
+                f"  UPDATE {Tables.RECORD.value} AS r "
+                f"  SET {passed_filter} = {passed}, {filter_failed} = {failed}, "
+                f"  {filter_hash_col} = :filter_hash, {waiting_since} = COALESCE(r.{waiting_since}, NOW()) "
+                f"  FROM {Tables.RECORD_DETAILS.value} AS d "
+                f"  WHERE d.{r_id} = r.{record} AND r.{t_id} = {taxon_id} AND {pending_filter('r')}"
+                f"  RETURNING r.{passed_filter}"
+                f") "
+                f"SELECT COUNT(*), COUNT(*) FILTER (WHERE {passed_filter}) FROM filtered"
             )),
-            [{'an': x[0], 'fltr': x[1], 'fail': x[2]} for x in new_records.itertuples(index=False)]
-        )
-        session.commit()
-        # Let the api know the records are waiting
-        session.execute(
+            {**params, 'filter_hash': filter_hash}
+        ).one()
+    return counts[0], counts[1]
+
+
+def save_filter_results(results: pandas.DataFrame, filter_hash: str) -> None:
+    """
+    Save filter decisions with a single UPDATE ... FROM (VALUES ...).
+    results should hold record ids, passed_filter and filter_failed values, in that order.
+    filter_hash identifies the filters that made the decisions.
+    Newly filtered records are marked as waiting, letting the API know they are available.
+    """
+    record = COLUMNS[Tables.RECORD].ID.value
+    passed_filter = COLUMNS[Tables.RECORD].PASSED_FILTER.value
+    filter_failed = COLUMNS[Tables.RECORD].FILTER_FAILED.value
+    filter_hash_col = COLUMNS[Tables.RECORD].FILTER_HASH.value
+    waiting_since = COLUMNS[Tables.RECORD].WAITING_SINCE.value
+    values = []
+    params = {'filter_hash': filter_hash}
+    for i, (record_id, passed, failed) in enumerate(results.itertuples(index=False)):
+        values.append(f"(:id_{i}, CAST(:passed_{i} AS BOOLEAN), :failed_{i})")
+        params[f"id_{i}"] = record_id
+        params[f"passed_{i}"] = bool(passed)
+        params[f"failed_{i}"] = failed
+    if len(values) == 0:
+        return
+
+    with get_engine().begin() as conn:
+        conn.execute(
             sqlalchemy.text((
-                f"UPDATE {Tables.RECORD.value} "
-                f"SET {waiting_since} = NOW() "
-                f" WHERE {passed_filter} = True AND {waiting_since} IS NULL"
-            ))
+                f"UPDATE {Tables.RECORD.value} AS r "
+                f"SET {passed_filter} = v.passed, {filter_failed} = v.failed, "
+                f"{filter_hash_col} = :filter_hash, {waiting_since} = COALESCE(r.{waiting_since}, NOW()) "
+                f"FROM (VALUES {', '.join(values)}) AS v(id, passed, failed) "
+                f"WHERE r.{record} = v.id"
+            )),
+            params
         )
-        session.commit()
 
-    if len(records) > 0:
-        logger.info(f"{len(records.loc[records[passed_filter]])}/{len(records)} new records acceptable for assembly.")
+
+def reset_filter_decisions(conn: sqlalchemy.engine.Connection, record_ids: list) -> None:
+    """
+    Clear the filter decisions of record_ids, so their changed details are filtered again.
+    """
+    if len(record_ids) == 0:
+        return
+    record = COLUMNS[Tables.RECORD].ID.value
+    passed_filter = COLUMNS[Tables.RECORD].PASSED_FILTER.value
+    filter_hash = COLUMNS[Tables.RECORD].FILTER_HASH.value
+    conn.execute(
+        sqlalchemy.text((
+            f"UPDATE {Tables.RECORD.value} SET {passed_filter} = NULL, {filter_hash} = NULL "
+            f"WHERE {record} = ANY(:record_ids)"
+        )),
+        {'record_ids': list(record_ids)}
+    )
 
 
 def release_records() -> None:
     """
     When the web API is called up to request a new record record to assemble the
-    record is marked as 'under consideration'.
-    The requester should confirm their request within the time specified in the CONSIDERATION_PERIOD envvars,
-    otherwise the record will be made available to other requesters for assembly.
-    This function resets the stale records to make them available again.
-
-    Additionally, any records whose assembly results have not been reported after
-    the time specified in the ASSEMBLY_PERIOD envvars are marked as available again.
+    record is marked as 'under consideration' and leased for the CONSIDERATION_PERIOD.
+    Confirming the request extends the lease to the ASSEMBLY_PERIOD, and assemblers may
+    renew it while they work, so long assemblies are not released.
+    Records whose leases expire are made available to other requesters again.
+
+    Expired leases are found through the lease expiry index and released in batches of
+    RELEASE_BATCH_SIZE, each in its own transaction, so a large backlog never holds locks for long.
+    Rows locked by a concurrent confirmation or report are skipped and picked up next time.
     """
-    with Session(get_engine()) as session:
-        session.execute(
-            sqlalchemy.text((
-                f"UPDATE {Tables.RECORD.value} "
-                f"SET {COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value} = NULL, "
-                f"{COLUMNS[Tables.RECORD].WAITING_SINCE.value} = NOW() "
-                f"WHERE {COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value} = 'under consideration' "
-                f"AND date_part("
-                f"  '{Settings.CONSIDERATION_PERIOD_UNITS.value}', "
-                f"  NOW() - {COLUMNS[Tables.RECORD].WAITING_SINCE.value}"
-                f") >= {Settings.CONSIDERATION_PERIOD_N.value}"
-            ))
-        )
-        session.execute(
-            sqlalchemy.text((
+    record_id = COLUMNS[Tables.RECORD].ID.value
+    assembly_result = COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value
+    waiting_since = COLUMNS[Tables.RECORD].WAITING_SINCE.value
+    lease_expires_at = COLUMNS[Tables.RECORD].LEASE_EXPIRES_AT.value
+    batch_size = Settings.RELEASE_BATCH_SIZE.value
+    while True:
+        with get_engine().begin() as conn:
+            released = conn.execute(sqlalchemy.text((
                 f"UPDATE {Tables.RECORD.value} "
-                f"SET {COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value} = NULL, "
-                f"{COLUMNS[Tables.RECORD].WAITING_SINCE.value} = NOW() "
-                f"WHERE {COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value} = 'in progress' "
-                f"AND date_part("
-                f"  '{Settings.ASSEMBLY_PERIOD_UNITS.value}', "
-                f"  NOW() - {COLUMNS[Tables.RECORD].WAITING_SINCE.value}"
-                f") >= {Settings.ASSEMBLY_PERIOD_N.value}"
-            ))
-        )
-        session.commit()
+                f"SET {assembly_result} = NULL, {waiting_since} = NOW(), {lease_expires_at} = NULL "
+                f"WHERE {record_id} IN ("
+                f"  SELECT {record_id} FROM {Tables.RECORD.value} "
+                f"  WHERE {lease_expires_at} < NOW() "
+                f"  ORDER BY {lease_expires_at} LIMIT :batch_size FOR UPDATE SKIP LOCKED"
+                f")"
+            )), {'batch_size': batch_size}).rowcount
+        if released > 0:
+            logger.info(f"Released {released} records with expired leases.")
+        if released < batch_size:
+            return
 
 
-if __name__ == '__main__':
+def consideration_period() -> str:
+    return f"{Settings.CONSIDERATION_PERIOD_N.value} {Settings.CONSIDERATION_PERIOD_UNITS.value}"
+
+
+def assembly_period() -> str:
+    return f"{Settings.ASSEMBLY_PERIOD_N.value} {Settings.ASSEMBLY_PERIOD_UNITS.value}"
+
+
+def backfill_record_leases() -> None:
     """
-    Run the next job in the queue and return the amount of time to sleep after completing.
+    Give records claimed before leases existed a lease ending where their old period would have,
+    so release_records can find them.
     """
-    while True:
-        try:
-            # Update taxon records
-            taxon_ids = get_taxons_to_check()
-            update_taxons(taxon_ids)
+    assembly_result = COLUMNS[Tables.RECORD].ASSEMBLY_RESULT.value
+    waiting_since = COLUMNS[Tables.RECORD].WAITING_SINCE.value
+    lease_expires_at = COLUMNS[Tables.RECORD].LEASE_EXPIRES_AT.value
+    with get_engine().begin() as conn:
+        for status, period in [
+            ('under consideration', consideration_period()),
+            ('in progress', assembly_period())
+        ]:
+            conn.execute(sqlalchemy.text((
+                f"UPDATE {Tables.RECORD.value} "
+                f"SET {lease_expires_at} = {waiting_since} + INTERVAL '{period}' "
+                f"WHERE {assembly_result} = '{status}' AND {lease_expires_at} IS NULL"
+            )))
 
-            # Release records that were requested but not acknowledged
-            release_records()
 
-        except BaseException as e:
-            logger.error(e)
+def next_release() -> float:
+    """
+    Seconds until the next record lease expires, or None if no records are leased.
+    """
+    lease_expires_at = COLUMNS[Tables.RECORD].LEASE_EXPIRES_AT.value
+    with get_engine().connect() as conn:
+        seconds = conn.execute(sqlalchemy.text(
+            f"SELECT EXTRACT(EPOCH FROM MIN({lease_expires_at}) - NOW()) FROM {Tables.RECORD.value} "
+            f"WHERE {lease_expires_at} > NOW()"
+        )).scalar()
+    return None if seconds is None else float(seconds)
 
-        sleep(30)
+
+if __name__ == '__main__':
+    """
+    Keep taxon records up to date, syncing each taxon id when the scheduler finds it due.
+    """
+    backfill_record_leases()
+    notifications = Listener(channel=Settings.NOTIFY_CHANNEL.value, handlers={})
+    notifications.start()
+    crawl(
+        Scheduler(
+            period=datetime.timedelta(
+                **{Settings.TAXON_UPDATE_UNITS.value: Settings.TAXON_UPDATE_N.value}
+            ).total_seconds()
+        ),
+        listener=notifications
+    )
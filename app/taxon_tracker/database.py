@@ -1,9 +1,17 @@
 from enum import Enum
+import io
+import json
+import pandas
 import sqlalchemy
+import threading
 import os
 
+from .settings import Settings
+
 
 DB = None
+_DB_LOCK = threading.Lock()
+TABLE_COLUMNS = {}
 
 
 # Columns and tables are defined in web/webserver/models.py
@@ -19,6 +27,11 @@ class TaxonCols(Enum):
     ID = 'id'
     LAST_UPDATED = 'last_updated'
     TIME_ADDED = 'time_added'
+    ENA_WATERMARK = 'ena_watermark'
+    LAST_FULL_SYNC = 'last_full_sync'
+    PRE_ASSEMBLY_FILTERS = 'pre_assembly_filters'
+    LEASE_OWNER = 'lease_owner'
+    LEASE_EXPIRES_AT = 'lease_expires_at'
 
 
 class RecordCols(Enum):
@@ -30,9 +43,11 @@ class RecordCols(Enum):
     FASTQ_FTP = 'fastq_ftp'
     PASSED_FILTER = 'passed_filter'
     FILTER_FAILED = 'filter_failed'
+    FILTER_HASH = 'filter_hash'
     TIME_FETCHED = 'time_fetched'
     WAITING_SINCE = 'waiting_since'
     ASSEMBLY_RESULT = 'assembly_result'
+    LEASE_EXPIRES_AT = 'lease_expires_at'
 
 
 class DetailCols(Enum):
@@ -42,6 +57,9 @@ class DetailCols(Enum):
     EXPERIMENT_ACCESSION = 'experiment_accession'
     RUN_ACCESSION = 'run_accession'
     FASTQ_FTP = 'fastq_ftp'
+    LAST_UPDATED = 'last_updated'
+    BASE_COUNT = 'base_count'
+    EXTRA = 'extra'
 
 
 COLUMNS = {
@@ -51,26 +69,159 @@ COLUMNS = {
 }
 
 
+class ColumnType(Enum):
+    INTEGER = 'Int64'
+    FLOAT = 'float64'
+    DATE = 'date'
+
+
+# RecordDetails fields stored with native types; ENA sends everything as text
+DETAIL_TYPES = {
+    'base_count': ColumnType.INTEGER,
+    'read_count': ColumnType.INTEGER,
+    'nominal_length': ColumnType.INTEGER,
+    'tax_id': ColumnType.INTEGER,
+    'lat': ColumnType.FLOAT,
+    'lon': ColumnType.FLOAT,
+    'nominal_sdev': ColumnType.FLOAT,
+    'completeness_score': ColumnType.FLOAT,
+    'contamination_score': ColumnType.FLOAT,
+    'first_created': ColumnType.DATE,
+    'first_public': ColumnType.DATE,
+    'last_updated': ColumnType.DATE
+}
+
+
 def get_engine() -> sqlalchemy.engine.Engine:
     """
     Get the database connection, opening it if necessary.
+    The engine is shared by all crawler workers, so its connection pool is sized to match.
     """
     global DB
-    db_status = 0
-    try:
-        db_status = DB.status
-    except AttributeError:
-        pass
-
-    if not db_status:
-        # postgresql+psycopg2://postgres:postgres@db:5432/postgres
-        db_uri = (
-            f"postgresql+psycopg2://"
-            f"{os.environ.get('POSTGRES_USER')}:"
-            f"{os.environ.get('POSTGRES_PASSWORD')}@"
-            f"db:5432/"  # set in docker-compose.yml
-            f"{os.environ.get('POSTGRES_DB')}"
-        )
-        DB = sqlalchemy.create_engine(db_uri, future=True)
+    with _DB_LOCK:
+        if DB is None:
+            # postgresql+psycopg2://postgres:postgres@db:5432/postgres
+            db_uri = (
+                f"postgresql+psycopg2://"
+                f"{os.environ.get('POSTGRES_USER')}:"
+                f"{os.environ.get('POSTGRES_PASSWORD')}@"
+                f"{os.environ.get('POSTGRES_HOST', 'db')}:"  # set in docker-compose.yml
+                f"{os.environ.get('POSTGRES_PORT', '5432')}/"
+                f"{os.environ.get('POSTGRES_DB')}"
+            )
+            DB = sqlalchemy.create_engine(
+                db_uri,
+                future=True,
+                pool_size=Settings.CRAWLER_WORKERS.value + 1,
+                pool_pre_ping=True
+            )
 
     return DB
+
+
+def copy_dataframe(conn: sqlalchemy.engine.Connection, df: pandas.DataFrame, table: str) -> None:
+    """
+    Bulk-load df into table using COPY FROM STDIN.
+    The column names of df are used as the target columns; missing values are loaded as NULL.
+    """
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    columns = ', '.join(df.columns)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def get_table_columns(table: Tables) -> list:
+    """
+    List the column names of table, as reported by the database.
+    """
+    if table not in TABLE_COLUMNS:
+        with get_engine().connect() as conn:
+            TABLE_COLUMNS[table] = list(conn.execute(
+                sqlalchemy.text(
+                    "SELECT column_name FROM information_schema.columns WHERE table_name = :table"
+                ),
+                {'table': table.value}
+            ).scalars())
+    return TABLE_COLUMNS[table]
+
+
+def copy_upsert(
+        conn: sqlalchemy.engine.Connection,
+        df: pandas.DataFrame,
+        table: Tables,
+        key_column: str,
+        insert_only_columns: list = (),
+        uncompared_columns: list = (),
+        reset_columns: list = ()
+) -> tuple:
+    """
+    Insert the rows of df into table, merging rows that already exist with the same key_column value.
+    Existing rows are only rewritten if one of their compared columns has changed.
+    insert_only_columns are written for new rows but never overwritten.
+    uncompared_columns are overwritten when a row changes but do not count as a change themselves.
+    reset_columns are set to NULL when an existing row changes.
+    Where df holds a key more than once, its last row is the one saved.
+    Rows are loaded into a temporary staging table with COPY and merged with one INSERT ... ON CONFLICT.
+    Columns of df that table does not have are ignored.
+    Returns the keys of the inserted rows, the keys of the updated rows and the number of unchanged keys.
+    """
+    df = df.drop_duplicates(subset=key_column, keep='last')
+    columns = [c for c in df.columns if c in get_table_columns(table)]
+    update_columns = [c for c in columns if c != key_column and c not in insert_only_columns]
+    compared_columns = [c for c in update_columns if c not in uncompared_columns]
+    column_list = ', '.join(columns)
+    staging = f"staging_{table.value}"
+    conn.execute(sqlalchemy.text((
+        f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS "
+        f"SELECT {column_list} FROM {table.value} WITH NO DATA"
+    )))
+    copy_dataframe(conn, df[columns], staging)
+    if len(compared_columns) > 0:
+        assignments = [f"{c} = EXCLUDED.{c}" for c in update_columns] + [f"{c} = NULL" for c in reset_columns]
+        on_conflict = (
+            f"DO UPDATE SET {', '.join(assignments)} "
+            f"WHERE ({', '.join(f'{table.value}.{c}' for c in compared_columns)}) IS DISTINCT FROM "
+            f"({', '.join(f'EXCLUDED.{c}' for c in compared_columns)})"
+        )
+    else:
+        on_conflict = "DO NOTHING"
+    # xmax is only zero for freshly inserted rows
+    result = conn.execute(sqlalchemy.text((
+        f"INSERT INTO {table.value} ({column_list}) "
+        f"SELECT {column_list} FROM {staging} "
+        f"ON CONFLICT ({key_column}) {on_conflict} "
+        f"RETURNING {key_column}, (xmax = 0) AS inserted"
+    ))).all()
+    conn.execute(sqlalchemy.text(f"DROP TABLE {staging}"))
+    inserted = [key for key, is_new in result if is_new]
+    updated = [key for key, is_new in result if not is_new]
+    return inserted, updated, len(df) - len(inserted) - len(updated)
+
+
+def prepare_details(df: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Convert a frame of ENA record details, as returned by the ENA API, to the RecordDetails layout.
+    Typed fields are parsed (unparseable values become missing) and any fields
+    without a RecordDetails column are gathered into a JSON object in the extra column.
+    """
+    df = df.copy()
+    for column, column_type in DETAIL_TYPES.items():
+        if column not in df.columns:
+            continue
+        if column_type == ColumnType.DATE:
+            df[column] = pandas.to_datetime(df[column], errors='coerce', format='%Y-%m-%d').dt.date
+        else:
+            df[column] = pandas.to_numeric(df[column], errors='coerce').astype(column_type.value)
+
+    table_columns = get_table_columns(Tables.RECORD_DETAILS)
+    extra_columns = [c for c in df.columns if c not in table_columns]
+    if len(extra_columns) > 0:
+        extra = df[extra_columns].replace({'': None})
+        df[DetailCols.EXTRA.value] = [
+            json.dumps({k: v for k, v in row.items() if pandas.notna(v)})
+            for row in extra.to_dict(orient='records')
+        ]
+        df = df.drop(columns=extra_columns)
+    return df
@@ -0,0 +1,135 @@
+import datetime
+import email.utils
+import logging
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from time import sleep
+
+from .settings import Settings
+from .throttle import TokenBucket
+
+
+logger = logging.getLogger(__file__)
+
+CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+# Responses worth trying again after a pause
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class ENA_Error(BaseException):
+    pass
+
+
+class ENAClient:
+    """
+    HTTP client for the ENA portal API.
+    Connections are kept alive in a pool shared by all crawler workers.
+    Every attempt, including retries, first takes a token from the shared rate limiter.
+    Requests that time out, fail to connect, or receive a RETRY_STATUSES response are retried with
+    jittered exponential backoff, waiting at least as long as any Retry-After header asks.
+    """
+    def __init__(
+            self,
+            base_url: str,
+            pool_size: int,
+            connect_timeout: float,
+            read_timeout: float,
+            max_retries: int,
+            backoff_base: float,
+            backoff_max: float,
+            rate_limiter: TokenBucket = None
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Seconds to wait before retry number attempt, using 'full jitter'.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(response: requests.Response) -> float:
+        """
+        Seconds requested by a Retry-After header, or 0 if there is no usable header.
+        """
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return 0
+        try:
+            return max(0., float(value))
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0., (when - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return 0
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Send a request to path (relative to the API root) and return the response.
+        Raises ENA_Error if no response could be obtained.
+        A response with a retryable status is returned as-is once retries are exhausted.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise ENA_Error(f"{method} {url} failed after {attempt + 1} attempts: {e}")
+                delay = self.backoff(attempt)
+                logger.debug(f"{method} {url} failed ({e}), retrying in {delay:.1f}s.")
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = max(self.backoff(attempt), self.retry_after(response))
+                logger.debug(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s.")
+            attempt += 1
+            sleep(delay)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+
+def get_client() -> ENAClient:
+    """
+    Get the ENA client, creating it if necessary.
+    """
+    global CLIENT
+    with _CLIENT_LOCK:
+        if CLIENT is None:
+            CLIENT = ENAClient(
+                base_url=Settings.ENA_API_URL.value,
+                pool_size=Settings.ENA_POOL_SIZE.value,
+                connect_timeout=Settings.ENA_CONNECT_TIMEOUT.value,
+                read_timeout=Settings.ENA_READ_TIMEOUT.value,
+                max_retries=Settings.ENA_MAX_RETRIES.value,
+                backoff_base=Settings.ENA_BACKOFF_BASE.value,
+                backoff_max=Settings.ENA_BACKOFF_MAX.value,
+                rate_limiter=TokenBucket(
+                    rate=Settings.ENA_REQUESTS_PER_SECOND.value,
+                    burst=Settings.ENA_BURST.value
+                )
+            )
+
+    return CLIENT
@@ -1,13 +1,21 @@
+import datetime
+import hashlib
+import json
 import pandas
 import os
-import pandas as pd
 import numpy as np
-import pickle
 # import mapbox
 import sys
 from html import unescape
 from typing import Callable
 import logging
+import re
+import threading
+import sqlalchemy
+
+from .database import ColumnType, DETAIL_TYPES, get_engine
+from .settings import Settings
+from .geolocation import get_location_index
 
 logger = logging.getLogger(__file__)
 
@@ -19,10 +27,84 @@ class FilterImplementationException(Exception):
     pass
 
 
+class FilterSpecException(Exception):
+    pass
+
+
+def check_spec(spec: any) -> None:
+    """
+    Check a taxon's filter specification against the rules the web API applies when it is set,
+    the database function webserver_filter_spec_error.
+    Raises FilterSpecException describing the first problem.
+    """
+    with get_engine().connect() as conn:
+        error = conn.execute(
+            sqlalchemy.text("SELECT webserver_filter_spec_error(CAST(:spec AS jsonb))"),
+            {'spec': json.dumps(spec)}
+        ).scalar()
+    if error is not None:
+        raise FilterSpecException(error)
+
+
+def check_field(field: any) -> str:
+    """
+    Check field can name a record details column.
+    Fields are written into SQL, so anything but a plain column name is refused
+    even if the specification was never checked with check_spec.
+    """
+    if not isinstance(field, str) or re.fullmatch(r'[a-z_][a-z0-9_]*', field) is None:
+        raise FilterSpecException(f"Invalid field {field!r}.")
+    return field
+
+
+def typed_values(field: str, values: list) -> list:
+    """
+    Convert the date strings given for date fields to dates, so they compare with the column's values.
+    """
+    if DETAIL_TYPES.get(field) != ColumnType.DATE:
+        return values
+    try:
+        return [datetime.date.fromisoformat(v) for v in values]
+    except (TypeError, ValueError):
+        raise FilterSpecException(f"Invalid dates {values} for field {field}.")
+
+
 class Filter:
-    def __init__(self, name: str, lambda_fun: Callable[[pandas.DataFrame], pandas.Series]):
+    def __init__(
+            self,
+            name: str,
+            lambda_fun: Callable[[pandas.DataFrame], pandas.Series],
+            sql_fun: Callable[[str, str], tuple] = None,
+            fields: list = ()
+    ):
+        """
+        lambda_fun evaluates the filter over a DataFrame of record details.
+        sql_fun, if given, returns an equivalent SQL predicate and its bound parameters as a tuple,
+        given the alias of the record details table and a prefix for parameter names.
+        fields are the record details columns lambda_fun reads.
+        """
         self.name = name
+        self.fields = list(fields)
         self._fun = lambda_fun
+        self._sql_fun = sql_fun
+
+    def sql(self, table: str, param: str) -> tuple:
+        """
+        Return (predicate, params) for evaluating the filter in the database, or None if it cannot be.
+        """
+        if self._sql_fun is None:
+            return None
+        return self._sql_fun(table, param)
+
+    def mask(self, df: pandas.DataFrame) -> np.ndarray:
+        """
+        Apply the Filter's function to df, returning a boolean array that is True for rows that pass.
+        Rows the function cannot decide (missing values) fail.
+        """
+        result = self._fun(df)
+        if isinstance(result, pandas.Series):
+            return result.fillna(False).to_numpy(dtype=bool)
+        return np.broadcast_to(np.asarray(result, dtype=bool), (len(df),))
 
     def do(self, df: pandas.DataFrame, col_names: list) -> pandas.DataFrame:
         """
@@ -30,88 +112,248 @@ class Filter:
         col_names[0] is set by applying the Filter's function to df
         col_names[1] is set as the Filter's name if the filter is failed, otherwise to the empty string
         """
-        df[col_names[0]] = self._fun(df)
-        df[col_names[1]] = np.where(df[col_names[0]], '', self.name)
+        passed = self.mask(df)
+        df[col_names[0]] = passed
+        df[col_names[1]] = np.where(passed, '', self.name)
         return df
 
 
 class FilterNA(Filter):
     def __init__(self, name: str, field: str):
+        field = check_field(field)
+
         def lambda_fun(df: pandas.DataFrame) -> pandas.Series:
             return df[field].notna()
-        super(FilterNA, self).__init__(name=name, lambda_fun=lambda_fun)
+
+        def sql_fun(table: str, param: str) -> tuple:
+            return f"{table}.{field} IS NOT NULL", {}
+
+        super(FilterNA, self).__init__(name=name, lambda_fun=lambda_fun, sql_fun=sql_fun, fields=[field])
 
 
 class FilterMatch(Filter):
     def __init__(self, name: str, field: str, value: any):
+        field = check_field(field)
         if type(value) is not list:
             value = [value]
+        value = typed_values(field, value)
 
         def lambda_fun(df: pandas.DataFrame) -> pandas.Series:
             return df[field].isin(value)
 
-        super(FilterMatch, self).__init__(name=name, lambda_fun=lambda_fun)
+        def sql_fun(table: str, param: str) -> tuple:
+            return f"{table}.{field} = ANY(:{param})", {param: value}
 
+        super(FilterMatch, self).__init__(name=name, lambda_fun=lambda_fun, sql_fun=sql_fun, fields=[field])
 
-def f_genome_size(df: pandas.DataFrame) -> pandas.Series:
-    size = os.environ.get('FILTER_GENOME_SIZE', None)
-    if size is None:
-        raise FilterImplementationException('Environment variable FILTER_GENOME_SIZE is not defined.')
-    depth = os.environ.get('FILTER_X_DEPTH', None)
-    if depth is None:
-        raise FilterImplementationException('Environment variable FILTER_X_DEPTH is not defined.')
-    return df.genome_size >= int(size) * int(depth)
+
+class FilterMinBaseCount(Filter):
+    def __init__(self, name: str, genome_size: int, x_depth: int):
+        if genome_size is None:
+            raise FilterImplementationException('No genome size defined (FILTER_GENOME_SIZE).')
+        if x_depth is None:
+            raise FilterImplementationException('No sequencing depth defined (FILTER_X_DEPTH).')
+        min_base_count = int(genome_size) * int(x_depth)
+
+        def lambda_fun(df: pandas.DataFrame) -> pandas.Series:
+            return df.base_count >= min_base_count
+
+        def sql_fun(table: str, param: str) -> tuple:
+            return f"{table}.base_count >= :{param}", {param: min_base_count}
+
+        super(FilterMinBaseCount, self).__init__(
+            name=name, lambda_fun=lambda_fun, sql_fun=sql_fun, fields=['base_count']
+        )
 
 
 def f_location_or_date(df: pandas.DataFrame) -> pandas.Series:
-    # 1. Filter out entries with no lat nor lon 17,655/116,246
-    has_lat_lon_df = df[df["lon"].notna()&df["lat"].notna()]
-    # 2. Select entries with no lat or lon 98,591/116,246
-    no_lat_lon_df = df[df["lon"].isna()|df["lat"].isna()]
-    # 3. Select entries without lat or lon but with country 93,058/98,591
-    has_country_df = no_lat_lon_df[no_lat_lon_df["country"].notna()]
-    no_country_no_ll_df = no_lat_lon_df[no_lat_lon_df["country"].isna()]
-    # 4. Load 'location' dictionary from pickle
-    with open('locations.pkl', 'rb') as handle:
-        locations = pickle.load(handle)
-
-    # 5. Go through 'country' values and find their geo coordinates if
-    #    not in 'location' dictionary.
-    # for i in has_country_df.country.unique():
-    #     if i not in locations:
-    #         locations[i] = mapbox.get_lat_lon(MABPOX_URL, unescape(i), MABPOX_KEY)
-
-    # 6. Save updated 'location' to pickle
-    with open('locations.pkl', 'wb') as handle:
-        pickle.dump(locations, handle, protocol=pickle.HIGHEST_PROTOCOL)
-
-    # 7. Prepare to map geo coordinates back to
-    lat = {k: v[0] for k, v in locations.items()}
-    lon = {k: v[1] for k, v in locations.items()}
-
-    # 8. Map geo coordinates to pandas dataframe
-    has_country_df = has_country_df.copy()
-    has_country_df['lat'] = has_country_df['country'].map(lat)
-    has_country_df['lon'] = has_country_df['country'].map(lon)
-
-    # 9. Concatenate entries with lat_lon and with country
-    final_df = pd.concat([has_country_df, has_lat_lon_df, no_country_no_ll_df])
-
-    # Select rows with at least either location or date
-    return df in final_df[~(final_df["collection_date"].isna() & (final_df["lat"].isna() & final_df["lon"].isna()))]
-
-
-FILTERS = [
-    FilterMatch('library_strategy=WGS', 'library_strategy', 'WGS'),
-    FilterMatch('instrument_platform=ILLUMINA', 'instrument_platform', 'ILLUMINA'),
-    FilterMatch('library_source=GENOMIC', 'library_source', 'GENOMIC'),
-    FilterMatch('library_layout=PAIRED', 'library_layout', 'PAIRED'),
-    Filter('base_count size', f_genome_size),
-    FilterMatch('date acceptable', 'collection_date', ["1000-01-01","1800-01-01"]),
-    # Filter('location or date', f_location_or_date)
+    """
+    Pass records with a collection date, with coordinates, or with a country we can locate.
+    """
+    # Countries can be added to the index with get_location_index().add(country, lat, lon), but nothing
+    # geolocates them yet: the mapbox package in requirements.txt does not import on Python 3.10
+    lat, lon = get_location_index().lookup(df["country"])
+    has_lat_lon = (df["lat"].notna() & df["lon"].notna()).to_numpy() | (~np.isnan(lat) & ~np.isnan(lon))
+    return df["collection_date"].notna() | has_lat_lon
+
+
+def sql_location_or_date(table: str, param: str) -> tuple:
+    return (
+        f"{table}.collection_date IS NOT NULL "
+        f"OR ({table}.lat IS NOT NULL AND {table}.lon IS NOT NULL) "
+        f"OR {table}.country = ANY(:{param})",
+        {param: get_location_index().countries()}
+    )
+
+
+# Filter types available to filter specifications, and the Filter each builds.
+# A specification is a list of objects holding a 'type', an optional 'name', and the type's arguments.
+FILTER_TYPES = {
+    'not_na': FilterNA,
+    'match': FilterMatch,
+    'min_base_count': FilterMinBaseCount,
+    'location_or_date': lambda name: Filter(
+        name, f_location_or_date, sql_location_or_date, fields=['country', 'lat', 'lon', 'collection_date']
+    )
+}
+
+# Filters used for taxons without their own pre_assembly_filters
+DEFAULT_FILTERS = [
+    {'type': 'match', 'name': 'library_strategy=WGS', 'field': 'library_strategy', 'value': 'WGS'},
+    {'type': 'match', 'name': 'instrument_platform=ILLUMINA', 'field': 'instrument_platform', 'value': 'ILLUMINA'},
+    {'type': 'match', 'name': 'library_source=GENOMIC', 'field': 'library_source', 'value': 'GENOMIC'},
+    {'type': 'match', 'name': 'library_layout=PAIRED', 'field': 'library_layout', 'value': 'PAIRED'},
+    {
+        'type': 'min_base_count',
+        'name': 'base_count size',
+        'genome_size': Settings.FILTER_GENOME_SIZE.value,
+        'x_depth': Settings.FILTER_X_DEPTH.value
+    },
+    {'type': 'match', 'name': 'date acceptable', 'field': 'collection_date', 'value': ["1000-01-01", "1800-01-01"]},
+    # Off by default: without a table at LOCATIONS_FILE no country can be located
+    # {'type': 'location_or_date', 'name': 'location or date'},
 ]
 
 
+class FilterPipeline:
+    """
+    A list of filters evaluated together over whole columns.
+    Each filter produces a boolean mask over all rows; the masks are combined to decide which rows pass,
+    and np.select attributes each failing row to the first filter it failed.
+    Evaluation stops early once every row has failed.
+    """
+    def __init__(self, filters: list, spec_hash: str = None):
+        self.filters = list(filters)
+        self.hash = spec_hash
+
+    @property
+    def fields(self) -> list:
+        """
+        The record details columns read by any of the filters.
+        """
+        return sorted({field for f in self.filters for field in f.fields})
+
+    def evaluate(self, df: pandas.DataFrame) -> tuple:
+        """
+        Return arrays of (passed, failed) for the rows of df.
+        passed is True if all filters were passed, False otherwise.
+        failed is the name of the first failed filter, or the empty string.
+        """
+        passed = np.ones(len(df), dtype=bool)
+        failures = []
+        names = []
+        for f in self.filters:
+            try:
+                mask = f.mask(df)
+            except FilterImplementationException as e:
+                logger.warning(f"Failed to implement filter {f.name}: {e}")
+                continue
+            failures.append(~mask)
+            names.append(f.name)
+            passed &= mask
+            if not passed.any():
+                break
+
+        if len(failures) == 0:
+            return passed, np.full(len(df), '', dtype=object)
+        return passed, np.select(failures, names, default='').astype(object)
+
+    def sql(self, table: str) -> tuple:
+        """
+        Compile the filters into SQL expressions over the record details table aliased as table.
+        Returns (passed, failed, params), where passed is a boolean expression that is true if all filters
+        are passed and failed is a CASE expression giving the name of the first failed filter, or ''.
+        Returns None if any filter can only be evaluated in Python.
+        """
+        predicates = []
+        params = {}
+        for i, f in enumerate(self.filters):
+            try:
+                compiled = f.sql(table, f"filter_{i}")
+            except FilterImplementationException as e:
+                logger.warning(f"Failed to implement filter {f.name}: {e}")
+                continue
+            if compiled is None:
+                return None
+            predicate, filter_params = compiled
+            # Filters fail rows they cannot decide, as in Filter.mask
+            predicates.append((f"COALESCE(({predicate}), FALSE)", f"filter_name_{i}"))
+            params.update(filter_params)
+            params[f"filter_name_{i}"] = f.name
+
+        if len(predicates) == 0:
+            return "TRUE", "''", params
+        passed = ' AND '.join(p for p, _ in predicates)
+        failed = f"CASE {' '.join(f'WHEN NOT {p} THEN :{n}' for p, n in predicates)} ELSE '' END"
+        return passed, failed, params
+
+    def apply(
+            self,
+            records: pandas.DataFrame,
+            col_name_passed: str = 'passed_filter',
+            col_name_failed: str = 'filter_failed'
+    ) -> pandas.DataFrame:
+        passed, failed = self.evaluate(records)
+        records[col_name_passed] = passed
+        records[col_name_failed] = failed
+        return records
+
+
+def spec_hash(spec: list) -> str:
+    """
+    Hash identifying a filter specification, stored against each record's decision.
+    """
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def compile_filters(spec: list) -> FilterPipeline:
+    """
+    Build a FilterPipeline from a filter specification.
+    Filters that cannot be implemented (e.g. missing settings) are skipped with a warning.
+    Raises FilterSpecException for a specification that cannot be compiled;
+    check_spec applies the full rules, including fields' existence and types.
+    """
+    if not isinstance(spec, list):
+        raise FilterSpecException(f"Filter specification should be a list, not {type(spec).__name__}.")
+    compiled = []
+    for item in spec:
+        if not isinstance(item, dict) or item.get('type') not in FILTER_TYPES:
+            raise FilterSpecException(f"Unrecognised filter {item}.")
+        kwargs = {k: v for k, v in item.items() if k != 'type'}
+        kwargs.setdefault('name', item['type'])
+        try:
+            compiled.append(FILTER_TYPES[item['type']](**kwargs))
+        except FilterImplementationException as e:
+            logger.warning(f"Failed to implement filter {kwargs['name']}: {e}")
+        except (TypeError, ValueError) as e:
+            raise FilterSpecException(f"Invalid arguments for filter {item}: {e}")
+    return FilterPipeline(compiled, spec_hash=spec_hash(spec))
+
+
+def get_pipeline(spec: list = None) -> FilterPipeline:
+    """
+    Get the compiled FilterPipeline for a taxon's filter specification, or for DEFAULT_FILTERS if spec is None.
+    A taxon's own filters are checked with check_spec before they are first compiled.
+    Pipelines are compiled once and cached by specification hash.
+    """
+    # DEFAULT_FILTERS are compiled at import, before the database is needed, so they are not checked
+    if spec is None:
+        spec = DEFAULT_FILTERS
+    elif spec_hash(spec) not in PIPELINES:
+        check_spec(spec)
+    key = spec_hash(spec)
+    with _PIPELINES_LOCK:
+        if key not in PIPELINES:
+            PIPELINES[key] = compile_filters(spec)
+        return PIPELINES[key]
+
+
+PIPELINES = {}
+_PIPELINES_LOCK = threading.Lock()
+PIPELINE = get_pipeline()
+FILTERS = PIPELINE.filters
+
+
 def apply_filters(
         records: pandas.DataFrame,
         col_name_passed: str = 'passed_filter',
@@ -123,16 +365,4 @@ def apply_filters(
     col_name_passed will be True if all filters were passed, False otherwise.
     col_name_failed will be the name of the first failed filter, or the empty string
     """
-    # Drop non-WGS experiments
-    records[col_name_passed] = False
-    okay = records
-    for f in FILTERS:
-        try:
-            okay = f.do(df=okay, col_names=[col_name_passed, col_name_failed])
-            okay = okay.loc[okay[col_name_passed]]
-            if len(okay) == 0:
-                break
-        except FilterImplementationException as e:
-            logger.warning(f"Failed to implement filter {f.name}: {e}")
-
-    return records
+    return PIPELINE.apply(records=records, col_name_passed=col_name_passed, col_name_failed=col_name_failed)
@@ -0,0 +1,126 @@
+import atexit
+import logging
+import os
+import pickle
+import threading
+import numpy as np
+import pandas
+
+from .settings import Settings
+
+
+logger = logging.getLogger(__file__)
+
+INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+class LocationIndex:
+    """
+    Lookup table from country names to (lat, lon), loaded once from a pickled dict.
+    Names are held in a pandas.Index with coordinates in parallel arrays, so a whole column of
+    countries is looked up with a single vectorised get_indexer call.
+    New locations are available immediately and written back to disk in the background once
+    flush_every have been added, and when the process exits.
+    """
+    def __init__(self, path: str, flush_every: int = 50):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self._lock = threading.Lock()
+        self._flushing = threading.Lock()
+        self._locations = self._load()
+        self._pending = 0
+        self._build()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, 'rb') as handle:
+                return dict(pickle.load(handle))
+        except FileNotFoundError:
+            logger.warning(f"No locations file at {self.path}; starting with an empty location index.")
+            return {}
+
+    def _build(self) -> None:
+        countries = list(self._locations.keys())
+        coordinates = np.array([self._locations[c] for c in countries], dtype=float).reshape(-1, 2)
+        # Swap in a complete new index so concurrent lookups never see a partial update
+        self._index = (pandas.Index(countries, dtype=object), coordinates[:, 0], coordinates[:, 1])
+
+    def __contains__(self, country: str) -> bool:
+        return country in self._locations
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def countries(self) -> list:
+        """
+        Countries with known coordinates.
+        """
+        countries, lat, lon = self._index
+        return list(countries[~(np.isnan(lat) | np.isnan(lon))])
+
+    def lookup(self, countries: pandas.Series) -> tuple:
+        """
+        Return arrays of (lat, lon) for each entry in countries, NaN where the country is unknown.
+        """
+        index, lat, lon = self._index
+        positions = index.get_indexer(countries)
+        missing = positions < 0
+        positions[missing] = 0
+        if len(index) == 0:
+            nan = np.full(len(countries), np.nan)
+            return nan, nan.copy()
+        found_lat = lat[positions]
+        found_lon = lon[positions]
+        found_lat[missing] = np.nan
+        found_lon[missing] = np.nan
+        return found_lat, found_lon
+
+    def add(self, country: str, lat: float, lon: float) -> None:
+        """
+        Add or replace the coordinates for country.
+        """
+        with self._lock:
+            self._locations[country] = (lat, lon)
+            self._build()
+            self._pending += 1
+            flush = self._pending >= self.flush_every
+        if flush:
+            threading.Thread(target=self.flush, name='locations-flush', daemon=True).start()
+
+    def flush(self) -> None:
+        """
+        Write the locations back to disk if any have been added since the last write.
+        The file is replaced atomically so readers never see a partial file.
+        """
+        with self._flushing:
+            with self._lock:
+                if self._pending == 0:
+                    return
+                locations = dict(self._locations)
+                self._pending = 0
+            tmp = f"{self.path}.tmp"
+            try:
+                with open(tmp, 'wb') as handle:
+                    pickle.dump(locations, handle, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.warning(f"Failed to save locations to {self.path}: {e}")
+                with self._lock:
+                    self._pending += 1
+
+
+def get_location_index() -> LocationIndex:
+    """
+    Get the location index, loading it if necessary.
+    """
+    global INDEX
+    with _INDEX_LOCK:
+        if INDEX is None:
+            INDEX = LocationIndex(
+                path=Settings.LOCATIONS_FILE.value,
+                flush_every=Settings.LOCATIONS_FLUSH_EVERY.value
+            )
+            atexit.register(INDEX.flush)
+
+    return INDEX
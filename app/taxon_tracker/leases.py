@@ -0,0 +1,141 @@
+import datetime
+import logging
+import os
+import socket
+import sqlalchemy
+import threading
+from time import sleep
+
+from .database import Tables, COLUMNS, get_engine
+from .settings import Settings
+
+
+logger = logging.getLogger(__file__)
+
+LEASES = None
+_LEASES_LOCK = threading.Lock()
+
+
+class LeaseUnavailable(Exception):
+    pass
+
+
+class TaxonLeases:
+    """
+    Short leases giving one crawler instance at a time ownership of a taxon id.
+    A lease is claimed before syncing a taxon id and released afterwards.
+    While any leases are held a heartbeat thread renews them every third of the lease duration,
+    so a crawler that dies only blocks its taxon ids until their leases expire.
+    Claims use FOR UPDATE SKIP LOCKED, so instances racing for the same taxon id never wait on each other.
+    """
+    def __init__(self, owner: str, duration: float):
+        self.owner = owner
+        self.duration = duration
+        self._held = set()
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def _execute(self, sql: str, params: dict) -> list:
+        with get_engine().begin() as conn:
+            result = conn.execute(
+                sqlalchemy.text(sql),
+                {'owner': self.owner, 'duration': self.duration, **params}
+            )
+            return result.all() if result.returns_rows else []
+
+    def claim(self, taxon_id: int, updated_before: datetime.datetime = None) -> None:
+        """
+        Take the lease for taxon_id, or raise LeaseUnavailable if another instance holds it.
+        If updated_before is given, LeaseUnavailable is also raised if taxon_id was last updated at or after then,
+        so a taxon id another instance synced since this one read its schedule is not synced again.
+        """
+        t_id = COLUMNS[Tables.TAXON].ID.value
+        lease_owner = COLUMNS[Tables.TAXON].LEASE_OWNER.value
+        lease_expires_at = COLUMNS[Tables.TAXON].LEASE_EXPIRES_AT.value
+        last_updated = COLUMNS[Tables.TAXON].LAST_UPDATED.value
+        claimed = self._execute((
+            f"UPDATE {Tables.TAXON.value} "
+            f"SET {lease_owner} = :owner, {lease_expires_at} = NOW() + make_interval(secs => :duration) "
+            f"WHERE {t_id} = ("
+            f"  SELECT {t_id} FROM {Tables.TAXON.value} "
+            f"  WHERE {t_id} = :taxon_id AND ("
+            f"    {lease_owner} IS NULL OR {lease_owner} = :owner OR {lease_expires_at} < NOW()"
+            f"  ) AND ("
+            f"    CAST(:updated_before AS timestamptz) IS NULL OR {last_updated} IS NULL OR "
+            f"    {last_updated} < :updated_before"
+            f"  ) FOR UPDATE SKIP LOCKED"
+            f") RETURNING {t_id}"
+        ), {'taxon_id': taxon_id, 'updated_before': updated_before})
+        if len(claimed) == 0:
+            if updated_before is None:
+                raise LeaseUnavailable(f"Taxon id {taxon_id} is leased by another crawler.")
+            raise LeaseUnavailable(
+                f"Taxon id {taxon_id} is leased by another crawler or was updated since {updated_before}."
+            )
+        with self._lock:
+            self._held.add(taxon_id)
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._renew_loop, name='lease-heartbeat', daemon=True)
+                self._heartbeat.start()
+
+    def release(self, taxon_id: int) -> None:
+        """
+        Give up the lease for taxon_id.
+        """
+        with self._lock:
+            self._held.discard(taxon_id)
+        t_id = COLUMNS[Tables.TAXON].ID.value
+        lease_owner = COLUMNS[Tables.TAXON].LEASE_OWNER.value
+        lease_expires_at = COLUMNS[Tables.TAXON].LEASE_EXPIRES_AT.value
+        self._execute((
+            f"UPDATE {Tables.TAXON.value} SET {lease_owner} = NULL, {lease_expires_at} = NULL "
+            f"WHERE {t_id} = :taxon_id AND {lease_owner} = :owner"
+        ), {'taxon_id': taxon_id})
+
+    def renew(self) -> None:
+        """
+        Extend all leases held by this instance, warning about any that have been lost.
+        """
+        with self._lock:
+            held = list(self._held)
+        if len(held) == 0:
+            return
+        t_id = COLUMNS[Tables.TAXON].ID.value
+        lease_owner = COLUMNS[Tables.TAXON].LEASE_OWNER.value
+        lease_expires_at = COLUMNS[Tables.TAXON].LEASE_EXPIRES_AT.value
+        renewed = self._execute((
+            f"UPDATE {Tables.TAXON.value} SET {lease_expires_at} = NOW() + make_interval(secs => :duration) "
+            f"WHERE {t_id} = ANY(:taxon_ids) AND {lease_owner} = :owner RETURNING {t_id}"
+        ), {'taxon_ids': held})
+        lost = set(held) - {row[0] for row in renewed}
+        with self._lock:
+            lost &= self._held
+        if lost:
+            logger.warning(f"Lost leases for taxon ids {sorted(lost)}; another crawler may be syncing them.")
+
+    def _renew_loop(self) -> None:
+        while True:
+            sleep(self.duration / 3)
+            with self._lock:
+                if len(self._held) == 0:
+                    self._heartbeat = None
+                    return
+            try:
+                self.renew()
+            except BaseException as e:
+                logger.warning(f"Failed to renew taxon leases: {e}")
+
+
+def get_leases() -> TaxonLeases:
+    """
+    Get this crawler instance's taxon leases, creating them if necessary.
+    """
+    global LEASES
+    with _LEASES_LOCK:
+        if LEASES is None:
+            LEASES = TaxonLeases(
+                owner=Settings.CRAWLER_ID.value or f"{socket.gethostname()}-{os.getpid()}",
+                duration=Settings.TAXON_LEASE_SECONDS.value
+            )
+
+    return LEASES
@@ -0,0 +1,94 @@
+import json
+import logging
+import select
+import threading
+import psycopg2
+import psycopg2.extensions
+from enum import Enum
+from typing import Callable
+
+from .database import get_engine
+
+
+logger = logging.getLogger(__file__)
+
+
+# Events sent by the web API, see web/webserver/notifications.py
+class Event(Enum):
+    TAXON_ADDED = 'taxon added'
+    RECORD_CLAIMED = 'record claimed'
+    ASSEMBLY_REPORTED = 'assembly reported'
+
+
+class Listener(threading.Thread):
+    """
+    Background thread that LISTENs on a Postgres channel and passes each notification to a handler.
+    Notification payloads are JSON objects with an 'event' key; handlers are looked up by event name,
+    and events without a handler are ignored.
+    The listener keeps its own connection outside the engine's pool, and reconnects after
+    reconnect_delay seconds if the connection is lost.
+    While connected is not set, callers should fall back to polling.
+    """
+    def __init__(
+            self,
+            channel: str,
+            handlers: dict,
+            reconnect_delay: float = 5,
+            on_reconnect: Callable[[], None] = None
+    ):
+        super(Listener, self).__init__(name='listener', daemon=True)
+        self.channel = channel
+        self.handlers = handlers
+        self.reconnect_delay = reconnect_delay
+        self.on_reconnect = on_reconnect
+        self.connected = threading.Event()
+        self._stop = threading.Event()
+
+    def connect(self) -> psycopg2.extensions.connection:
+        args = get_engine().url.translate_connect_args(username='user', database='dbname')
+        conn = psycopg2.connect(**args)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def dispatch(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            handler = self.handlers.get(message.get('event'))
+        except (ValueError, AttributeError):
+            logger.warning(f"Ignoring malformed notification '{payload}'.")
+            return
+        if handler is not None:
+            try:
+                handler(message)
+            except BaseException as e:
+                logger.error(f"Error handling notification '{payload}': {e}")
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                conn = self.connect()
+            except psycopg2.Error as e:
+                logger.warning(f"Cannot listen for notifications, retrying in {self.reconnect_delay}s: {e}")
+                self._stop.wait(self.reconnect_delay)
+                continue
+            self.connected.set()
+            # Notifications may have been missed while disconnected
+            if self.on_reconnect is not None:
+                self.on_reconnect()
+            try:
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.dispatch(conn.notifies.pop(0).payload)
+            except (psycopg2.Error, OSError) as e:
+                logger.warning(f"Lost notification connection: {e}")
+            finally:
+                self.connected.clear()
+                conn.close()
+
+    def stop(self) -> None:
+        self._stop.set()
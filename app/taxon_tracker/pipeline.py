@@ -0,0 +1,52 @@
+import queue
+import threading
+from typing import Iterable, Iterator
+
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable, depth: int) -> Iterator:
+    """
+    Iterate over iterable in a background thread, yielding its items through a queue holding at most depth items.
+    Chaining calls gives a pipeline whose stages run concurrently with bounded buffers between them.
+    Exceptions raised while iterating are re-raised in the consuming thread.
+    If the consumer stops early the background thread is stopped too.
+    """
+    items = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(item: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    thread = threading.Thread(target=produce, name=f"{threading.current_thread().name}-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,154 @@
+import heapq
+import math
+import threading
+import time
+from typing import Callable, Iterable, NamedTuple
+
+
+class TaxonState(NamedTuple):
+    """
+    What the scheduler knows about a taxon id.
+    age is seconds since the taxon was last updated, or None if it never has been.
+    recent_yield is the number of records fetched for it over the last update period.
+    backlog is the number of its records waiting to be assembled.
+    """
+    taxon_id: int
+    age: float
+    recent_yield: int
+    backlog: int
+
+
+class Scheduler:
+    """
+    Priority queue deciding when each taxon id is next synced with ENA.
+    Each taxon id is due one update period after its last update, scaled by
+    yield_weight (taxons that keep producing new records come round sooner) and
+    backlog_weight (taxons with plenty of records already waiting for assembly come round later).
+    Taxon ids never updated are due at once, and taxon ids whose sync failed are retried after a delay.
+    Otherwise due taxons are released no faster than one per period / (2 * number of taxons),
+    so refreshes spread out over the update window rather than all firing together,
+    while a backlog of overdue taxons still clears within half a window.
+    wait() sleeps until the next taxon is due, or until notify() is called.
+    """
+    MIN_FACTOR = .25
+    MAX_FACTOR = 2.
+
+    def __init__(
+            self,
+            period: float,
+            yield_weight: float = .1,
+            backlog_weight: float = .1,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.period = period
+        self.yield_weight = yield_weight
+        self.backlog_weight = backlog_weight
+        self._clock = clock
+        self._new = []
+        self._queue = []
+        self._gap = period
+        self._next_slot = clock()
+        self._running = set()
+        self._retry_at = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def interval(self, state: TaxonState) -> float:
+        """
+        Seconds between updates for a taxon id.
+        """
+        factor = (1 + self.backlog_weight * math.log1p(state.backlog)) / \
+                 (1 + self.yield_weight * math.log1p(state.recent_yield))
+        return self.period * min(self.MAX_FACTOR, max(self.MIN_FACTOR, factor))
+
+    def update(self, taxa: Iterable[TaxonState]) -> None:
+        """
+        Replace the queue with the current state of all taxon ids.
+        Taxon ids currently being synced are left out until done() is called for them.
+        """
+        now = self._clock()
+        with self._lock:
+            running = set(self._running)
+            retry_at = dict(self._retry_at)
+        new = []
+        queue = []
+        n_taxa = 0
+        for state in taxa:
+            n_taxa += 1
+            if state.taxon_id in running:
+                continue
+            if state.taxon_id in retry_at:
+                due = retry_at[state.taxon_id] if state.age is None else \
+                    max(retry_at[state.taxon_id], now + self.interval(state) - state.age)
+                queue.append((due, state.taxon_id))
+            elif state.age is None:
+                new.append(state.taxon_id)
+            else:
+                queue.append((now + self.interval(state) - state.age, state.taxon_id))
+        heapq.heapify(queue)
+        with self._lock:
+            self._new = new
+            self._queue = queue
+            self._gap = self.period / max(1, 2 * n_taxa)
+
+    def pop_due(self, limit: int) -> list:
+        """
+        Take up to limit taxon ids that are due now, new taxon ids then the most overdue, and mark them as running.
+        """
+        now = self._clock()
+        with self._lock:
+            due = self._new[:max(0, limit)]
+            self._new = self._new[len(due):]
+            while self._queue and len(due) < limit and self._queue[0][0] <= now and self._next_slot <= now:
+                _, taxon_id = heapq.heappop(self._queue)
+                self._next_slot = max(self._next_slot, now) + self._gap
+                due.append(taxon_id)
+            self._running.update(due)
+        return due
+
+    def done(self, taxon_id: int, retry_after: float = None) -> None:
+        """
+        Mark a taxon id as no longer running and wake the scheduler.
+        If the sync failed, retry_after gives the seconds to wait before it is tried again.
+        """
+        with self._lock:
+            self._running.discard(taxon_id)
+            if retry_after is None:
+                self._retry_at.pop(taxon_id, None)
+            else:
+                self._retry_at[taxon_id] = self._clock() + retry_after
+        self.notify()
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def next_due(self) -> float:
+        """
+        Seconds until the next taxon id is due, or None if none are queued.
+        """
+        with self._lock:
+            if self._new:
+                return 0.
+            if not self._queue:
+                return None
+            when = max(self._queue[0][0], self._next_slot)
+        return max(0., when - self._clock())
+
+    def notify(self) -> None:
+        """
+        Wake wait() early, e.g. because a taxon id was added or a sync finished.
+        """
+        self._wake.set()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleep until the next taxon id is due, notify() is called, or timeout seconds pass.
+        Returns True if woken by notify().
+        """
+        next_due = self.next_due()
+        if next_due is not None:
+            timeout = min(timeout, next_due)
+        woken = self._wake.wait(timeout)
+        self._wake.clear()
+        return woken
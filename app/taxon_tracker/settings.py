@@ -5,9 +5,38 @@ import os
 class Settings(Enum):
     TAXON_UPDATE_N = int(os.environ.get('TAXON_UPDATE_N', '7'))
     TAXON_UPDATE_UNITS = os.environ.get('TAXON_UPDATE_UNITS', 'days')
+    FULL_SYNC_N = int(os.environ.get('FULL_SYNC_N', '4'))
+    FULL_SYNC_UNITS = os.environ.get('FULL_SYNC_UNITS', 'weeks')
     CONSIDERATION_PERIOD_N = int(os.environ.get('CONSIDERATION_PERIOD_N', '10'))
     CONSIDERATION_PERIOD_UNITS = os.environ.get('CONSIDERATION_PERIOD_UNITS', 'minutes')
     ASSEMBLY_PERIOD_N = int(os.environ.get('ASSEMBLY_PERIOD_N', '7'))
     ASSEMBLY_PERIOD_UNITS = os.environ.get('ASSEMBLY_PERIOD_UNITS', 'days')
+    # Expired record claims are released this many at a time
+    RELEASE_BATCH_SIZE = int(os.environ.get('RELEASE_BATCH_SIZE', '1000'))
     ENA_REQUEST_LIMIT = int(os.environ.get('ENA_REQUEST_LIMIT', '1000'))
+    ENA_API_URL = os.environ.get('ENA_API_URL', 'https://www.ebi.ac.uk/ena/portal/api')
+    ENA_POOL_SIZE = int(os.environ.get('ENA_POOL_SIZE', '10'))
+    ENA_CONNECT_TIMEOUT = float(os.environ.get('ENA_CONNECT_TIMEOUT', '10'))
+    ENA_READ_TIMEOUT = float(os.environ.get('ENA_READ_TIMEOUT', '300'))
+    ENA_MAX_RETRIES = int(os.environ.get('ENA_MAX_RETRIES', '5'))
+    ENA_BACKOFF_BASE = float(os.environ.get('ENA_BACKOFF_BASE', '1'))
+    ENA_BACKOFF_MAX = float(os.environ.get('ENA_BACKOFF_MAX', '60'))
+    ENA_REQUESTS_PER_SECOND = float(os.environ.get('ENA_REQUESTS_PER_SECOND', '10'))
+    ENA_BURST = int(os.environ.get('ENA_BURST', '20'))
+    ENA_PIPELINE_DEPTH = int(os.environ.get('ENA_PIPELINE_DEPTH', '4'))
+    # Default genome size and sequencing depth for the base_count filter; no default values
+    FILTER_GENOME_SIZE = int(os.environ['FILTER_GENOME_SIZE']) if 'FILTER_GENOME_SIZE' in os.environ else None
+    FILTER_X_DEPTH = int(os.environ['FILTER_X_DEPTH']) if 'FILTER_X_DEPTH' in os.environ else None
+    FILTER_BATCH_SIZE = int(os.environ.get('FILTER_BATCH_SIZE', '1000'))
+    LOCATIONS_FILE = os.environ.get('LOCATIONS_FILE', 'locations.pkl')
+    LOCATIONS_FLUSH_EVERY = int(os.environ.get('LOCATIONS_FLUSH_EVERY', '50'))
+    CRAWLER_WORKERS = int(os.environ.get('CRAWLER_WORKERS', '4'))
+    # Identifies this crawler instance in taxon leases; defaults to hostname and process id
+    CRAWLER_ID = os.environ.get('CRAWLER_ID', '')
+    TAXON_LEASE_SECONDS = float(os.environ.get('TAXON_LEASE_SECONDS', '300'))
+    SCHEDULER_POLL_SECONDS = float(os.environ.get('SCHEDULER_POLL_SECONDS', '30'))
+    SCHEDULER_IDLE_SECONDS = float(os.environ.get('SCHEDULER_IDLE_SECONDS', '3600'))
+    SCHEDULER_RETRY_SECONDS = float(os.environ.get('SCHEDULER_RETRY_SECONDS', '300'))
+    SCHEDULER_RECOUNT_SECONDS = float(os.environ.get('SCHEDULER_RECOUNT_SECONDS', '3600'))
+    NOTIFY_CHANNEL = os.environ.get('NOTIFY_CHANNEL', 'taxon_tracker')
     MAX_DROPLETS = int(os.environ.get('MAX_DROPLETS', '10'))
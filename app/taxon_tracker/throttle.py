@@ -0,0 +1,60 @@
+import threading
+import time
+from typing import Callable
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting how often an action may happen.
+    Tokens are added at rate per second up to burst; each acquire() takes one, waiting if none are left.
+    A rate of zero or less disables limiting.
+    """
+    def __init__(
+            self,
+            rate: float,
+            burst: int,
+            clock: Callable[[], float] = time.monotonic,
+            sleep: Callable[[float], None] = time.sleep
+    ):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """
+        Take a token if one is available.
+        Returns 0 if a token was taken, otherwise the number of seconds until one will be.
+        """
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        """
+        Take a token if one is available, without waiting.
+        """
+        return self.rate <= 0 or self._take() == 0
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting until one is available.
+        Returns the number of seconds spent waiting.
+        """
+        if self.rate <= 0:
+            return 0
+        waited = 0.
+        wait = self._take()
+        while wait > 0:
+            self._sleep(wait)
+            waited += wait
+            wait = self._take()
+        return waited
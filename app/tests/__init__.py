@@ -0,0 +1,84 @@
+"""
+Crawler tests. Run from the app directory with `python -m unittest discover -s tests -t .`
+
+Tests that use the database expect the tables created by the web service's migrations,
+and the POSTGRES_* environment variables (POSTGRES_HOST defaults to 'db').
+Those tables are emptied before each test, so do not point them at a database you want to keep.
+"""
+import importlib.util
+import pathlib
+import unittest
+import sqlalchemy
+
+from taxon_tracker import ena
+from taxon_tracker.database import Tables, get_engine
+from .fake_ena import FakeENA
+
+CRAWLER = None
+
+
+def load_crawler():
+    """
+    Import app/taxon_tracker.py, which the taxon_tracker package shadows.
+    """
+    global CRAWLER
+    if CRAWLER is None:
+        path = pathlib.Path(__file__).resolve().parent.parent / 'taxon_tracker.py'
+        spec = importlib.util.spec_from_file_location('crawler', path)
+        CRAWLER = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(CRAWLER)
+    return CRAWLER
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Starts each test with empty taxon and record tables.
+    """
+    def setUp(self):
+        self.clear_tables()
+
+    def clear_tables(self) -> None:
+        with get_engine().begin() as conn:
+            conn.execute(sqlalchemy.text(
+                f"TRUNCATE {Tables.RECORD_DETAILS.value}, {Tables.RECORD.value}, {Tables.TAXON.value} CASCADE"
+            ))
+
+    def add_taxa(self, *taxon_ids: int) -> None:
+        with get_engine().begin() as conn:
+            for taxon_id in taxon_ids:
+                conn.execute(
+                    sqlalchemy.text(f"INSERT INTO {Tables.TAXON.value} (id, time_added) VALUES (:id, NOW())"),
+                    {'id': taxon_id}
+                )
+
+    def query(self, sql: str, **params) -> list:
+        with get_engine().connect() as conn:
+            return conn.execute(sqlalchemy.text(sql), params).all()
+
+    def query_update(self, sql: str, **params) -> None:
+        with get_engine().begin() as conn:
+            conn.execute(sqlalchemy.text(sql), params)
+
+
+class FakeENATestCase(DatabaseTestCase):
+    """
+    Points the crawler's ENA client at a FakeENA server for each test.
+    """
+    delay = 0
+
+    def setUp(self):
+        super(FakeENATestCase, self).setUp()
+        self.ena = FakeENA(delay=self.delay).start()
+        self.addCleanup(self.ena.stop)
+        client = ena.ENAClient(
+            base_url=self.ena.url,
+            pool_size=10,
+            connect_timeout=5,
+            read_timeout=30,
+            max_retries=1,
+            backoff_base=.01,
+            backoff_max=.01
+        )
+        previous = ena.CLIENT
+        ena.CLIENT = client
+        self.addCleanup(setattr, ena, 'CLIENT', previous)
@@ -0,0 +1,157 @@
+"""
+Timings of the crawler's bulk operations against the approaches they replace.
+Not collected with the tests; run from the app directory with `python -m unittest tests.benchmarks`.
+The sizes benchmarked can be set with BENCHMARK_SIZES, e.g. `BENCHMARK_SIZES=10000,100000 python -m unittest ...`
+"""
+import datetime
+import os
+import subprocess
+import time
+import timeit
+import types
+import unittest
+import warnings
+from unittest import mock
+import pandas
+import pytz
+import sqlalchemy
+
+from taxon_tracker import filters
+from taxon_tracker.database import Tables, COLUMNS, get_engine, copy_upsert, prepare_details
+from . import DatabaseTestCase
+from .fake_ena import run_accessions, run_details, random_details
+
+SIZES = [int(n) for n in os.environ.get('BENCHMARK_SIZES', '10000,100000,1000000').split(',')]
+TAXON_ID = 1
+
+
+def record_frames(n_records: int) -> tuple:
+    """
+    Frames of (records, details) as fetch_ENA_records builds them from n_records ENA results.
+    """
+    details = pandas.DataFrame([
+        run_details(run, '2022-01-01') for run in run_accessions(TAXON_ID, n_records)
+    ])
+    details_cols = COLUMNS[Tables.RECORD_DETAILS]
+    record_cols = COLUMNS[Tables.RECORD]
+    details[details_cols.RECORD.value] = (
+        details[details_cols.SAMPLE_ACCESSION.value] + '_' +
+        details[details_cols.EXPERIMENT_ACCESSION.value] + '_' +
+        details[details_cols.RUN_ACCESSION.value]
+    )
+    details[details_cols.TIME_FETCHED.value] = datetime.datetime.now(tz=pytz.UTC)
+    details = prepare_details(details)
+    records = details[[
+        details_cols.RECORD.value,
+        details_cols.SAMPLE_ACCESSION.value,
+        details_cols.RUN_ACCESSION.value,
+        details_cols.EXPERIMENT_ACCESSION.value,
+        details_cols.TIME_FETCHED.value,
+        details_cols.FASTQ_FTP.value
+    ]].rename(columns={details_cols.RECORD.value: record_cols.ID.value})
+    records[record_cols.TAXON.value] = TAXON_ID
+    return records, details
+
+
+class BulkLoadBenchmarks(DatabaseTestCase):
+    def setUp(self):
+        super(BulkLoadBenchmarks, self).setUp()
+        self.add_taxa(TAXON_ID)
+
+    def clear_records(self) -> None:
+        self.query_update(f"TRUNCATE {Tables.RECORD_DETAILS.value}, {Tables.RECORD.value} CASCADE")
+
+    def time(self, fun) -> float:
+        start = time.perf_counter()
+        with get_engine().begin() as conn:
+            fun(conn)
+        return time.perf_counter() - start
+
+    def test_copy_upsert(self):
+        for n_records in SIZES:
+            records, details = record_frames(n_records)
+
+            def to_sql(conn: sqlalchemy.engine.Connection) -> None:
+                records.to_sql(name=Tables.RECORD.value, con=conn, if_exists='append', index=False)
+                details.to_sql(name=Tables.RECORD_DETAILS.value, con=conn, if_exists='append', index=False)
+
+            def upsert(conn: sqlalchemy.engine.Connection) -> None:
+                copy_upsert(
+                    conn, records, Tables.RECORD,
+                    key_column=COLUMNS[Tables.RECORD].ID.value,
+                    insert_only_columns=[COLUMNS[Tables.RECORD].TAXON.value],
+                    uncompared_columns=[COLUMNS[Tables.RECORD].TIME_FETCHED.value]
+                )
+                copy_upsert(
+                    conn, details, Tables.RECORD_DETAILS,
+                    key_column=COLUMNS[Tables.RECORD_DETAILS].RECORD.value,
+                    uncompared_columns=[COLUMNS[Tables.RECORD_DETAILS].TIME_FETCHED.value]
+                )
+
+            self.clear_records()
+            to_sql_time = self.time(to_sql)
+            self.clear_records()
+            copy_time = self.time(upsert)
+            # Rows that are already saved and unchanged, which to_sql cannot load at all
+            recopy_time = self.time(upsert)
+            print(
+                f"\n{n_records} records: to_sql {to_sql_time:.2f}s, copy_upsert {copy_time:.2f}s "
+                f"({to_sql_time / copy_time:.1f}x), copy_upsert again {recopy_time:.2f}s"
+            )
+        self.clear_records()
+
+
+# The filters module before FilterPipeline, which applied the filters one at a time with apply_filters
+BASELINE_FILTERS = 'bf0e70f^:app/taxon_tracker/filters.py'
+GENOME_SIZE = 1_000_000
+X_DEPTH = 30
+
+
+def baseline_filters() -> types.ModuleType:
+    """
+    Load the filters module as it was before FilterPipeline, from the git history.
+    """
+    source = subprocess.run(
+        ['git', 'show', BASELINE_FILTERS],
+        cwd=os.path.dirname(__file__), capture_output=True, text=True, check=True
+    ).stdout
+    module = types.ModuleType('baseline_filters')
+    module.__file__ = BASELINE_FILTERS
+    exec(source, module.__dict__)
+    return module
+
+
+class FilterBenchmarks(unittest.TestCase):
+    repeat = 3
+
+    def test_apply(self):
+        """
+        Time FilterPipeline.apply against the old apply_filters over the same filters.
+        The old module reads the genome size and depth from the environment,
+        so the pipeline is given DEFAULT_FILTERS with the same settings.
+        Decisions are not compared: apply_filters only saved the first filter's decision on the frame.
+        """
+        baseline = baseline_filters()
+        spec = [
+            {**f, 'genome_size': GENOME_SIZE, 'x_depth': X_DEPTH} if f['type'] == 'min_base_count' else f
+            for f in filters.DEFAULT_FILTERS
+        ]
+        pipeline = filters.compile_filters(spec)
+        self.assertEqual([f.name for f in pipeline.filters], [f.name for f in baseline.FILTERS])
+        for n_records in SIZES:
+            df = random_details(n_records)
+            # Collection dates are text in the database
+            df['collection_date'] = df['collection_date'].map(lambda d: None if pandas.isna(d) else d.isoformat())
+
+            with mock.patch.dict(os.environ, {'FILTER_GENOME_SIZE': str(GENOME_SIZE), 'FILTER_X_DEPTH': str(X_DEPTH)}):
+                with warnings.catch_warnings():
+                    # apply_filters writes to slices of the frame
+                    warnings.simplefilter('ignore')
+                    baseline_time = min(timeit.repeat(
+                        lambda: baseline.apply_filters(df.copy()), number=1, repeat=self.repeat
+                    ))
+            pipeline_time = min(timeit.repeat(lambda: pipeline.apply(df.copy()), number=1, repeat=self.repeat))
+            print(
+                f"\n{n_records} records: apply_filters {baseline_time:.2f}s, "
+                f"FilterPipeline.apply {pipeline_time:.2f}s ({baseline_time / pipeline_time:.1f}x)"
+            )
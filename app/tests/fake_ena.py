@@ -0,0 +1,164 @@
+"""
+Local stand-in for the parts of the ENA portal API the crawler uses.
+"""
+import json
+import re
+import threading
+import time
+import urllib.parse
+import numpy as np
+import pandas
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def run_accessions(taxon_id: int, n_runs: int) -> list:
+    return [f"ERR{taxon_id}{i:06d}" for i in range(n_runs)]
+
+
+def run_details(run_accession: str, last_updated: str) -> dict:
+    """
+    The fields ENA returns for a read run, with values like ENA's (everything a string, blanks for missing values).
+    """
+    number = run_accession[3:]
+    return {
+        'run_accession': run_accession,
+        'sample_accession': f"SAMEA{number}",
+        'experiment_accession': f"ERX{number}",
+        'fastq_ftp': f"ftp.sra.ebi.ac.uk/{run_accession}_1.fastq.gz;ftp.sra.ebi.ac.uk/{run_accession}_2.fastq.gz",
+        'fastq_aspera': f"fasp.sra.ebi.ac.uk:/{run_accession}_1.fastq.gz",
+        'fastq_galaxy': '',
+        'library_strategy': 'WGS',
+        'instrument_platform': 'ILLUMINA',
+        'library_source': 'GENOMIC',
+        'library_layout': 'PAIRED',
+        'base_count': '300000000',
+        'read_count': '1000000',
+        'collection_date': '2019-05-01',
+        'country': 'United Kingdom',
+        'lat': '',
+        'lon': '',
+        'first_public': last_updated,
+        'last_updated': last_updated
+    }
+
+
+def random_details(n_records: int, seed: int = 0) -> pandas.DataFrame:
+    """
+    Record details as prepare_details leaves them, with the fields the filters use drawn at random
+    (including missing values), for exercising filters over many rows.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pandas.Series(pandas.to_datetime(['2019-05-01', '1800-01-01']).date)
+    return pandas.DataFrame({
+        'library_strategy': rng.choice(['WGS', 'AMPLICON', None], n_records, p=[.8, .15, .05]),
+        'instrument_platform': rng.choice(['ILLUMINA', 'OXFORD_NANOPORE'], n_records, p=[.9, .1]),
+        'library_source': rng.choice(['GENOMIC', 'METAGENOMIC'], n_records, p=[.95, .05]),
+        'library_layout': rng.choice(['PAIRED', 'SINGLE'], n_records, p=[.85, .15]),
+        'base_count': np.where(rng.random(n_records) < .05, np.nan, rng.integers(0, 10 ** 9, n_records)),
+        'collection_date': dates.sample(n_records, replace=True, random_state=seed).where(
+            rng.random(n_records) < .5
+        ).to_numpy(),
+        'country': rng.choice(['United Kingdom', 'Atlantis', None], n_records),
+        'lat': np.where(rng.random(n_records) < .7, np.nan, rng.uniform(-90, 90, n_records)),
+        'lon': np.where(rng.random(n_records) < .7, np.nan, rng.uniform(-180, 180, n_records))
+    })
+
+
+class FakeENA(ThreadingHTTPServer):
+    """
+    Serves links/taxon listings and search queries for the taxon ids in taxa, a dict of taxon id to number of runs.
+    Every request is counted by path in requests, and answered after delay seconds.
+    Any request mentioning a taxon id in failing_taxa gets a 500 response,
+    as do requests for run details while failing_details is set.
+    """
+    def __init__(self, delay: float = 0):
+        super(FakeENA, self).__init__(('127.0.0.1', 0), FakeENAHandler)
+        self.delay = delay
+        self.taxa = {}
+        self.last_updated = '2022-01-01'
+        self.failing_taxa = set()
+        self.failing_details = False
+        self.requests = {}
+        self.lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> 'FakeENA':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def count(self, path: str) -> int:
+        with self.lock:
+            return self.requests.get(path, 0)
+
+    def runs(self, taxon_id: int) -> list:
+        return run_accessions(taxon_id, self.taxa.get(taxon_id, 0))
+
+
+class FakeENAHandler(BaseHTTPRequestHandler):
+    server: FakeENA
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def send(self, status: int, rows: list = None) -> None:
+        body = b'' if rows is None else json.dumps(rows).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def page(self, rows: list, params: dict) -> None:
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 0)) or len(rows)
+        rows = rows[offset:offset + limit]
+        # ENA answers out-of-range pages with 204
+        self.send(200, rows) if rows else self.send(204)
+
+    def handle_request(self, params: dict) -> None:
+        path = urllib.parse.urlparse(self.path).path.strip('/')
+        with self.server.lock:
+            self.server.requests[path] = self.server.requests.get(path, 0) + 1
+        time.sleep(self.server.delay)
+
+        if path == 'links/taxon':
+            taxon_id = int(params['accession'])
+            if taxon_id in self.server.failing_taxa:
+                return self.send(500)
+            return self.page([{'run_accession': run} for run in self.server.runs(taxon_id)], params)
+
+        if path == 'search' and 'includeAccessions' in params:
+            if self.server.failing_details:
+                return self.send(500)
+            runs = [run for run in params['includeAccessions'].split(',') if run]
+            return self.send(200, [run_details(run, self.server.last_updated) for run in runs])
+
+        if path == 'search':
+            taxon_id = int(re.search(r'tax_tree\((\d+)\)', params['query']).group(1))
+            if taxon_id in self.server.failing_taxa:
+                return self.send(500)
+            since = re.search(r'last_updated>(\S+)', params['query'])
+            rows = [run_details(run, self.server.last_updated) for run in self.server.runs(taxon_id)]
+            if since is not None:
+                rows = [row for row in rows if row['last_updated'] > since.group(1)]
+            fields = params.get('fields', 'all')
+            if fields != 'all':
+                rows = [{field: row[field] for field in fields.split(',')} for row in rows]
+            return self.page(rows, params)
+
+        self.send(404)
+
+    def do_GET(self) -> None:
+        self.handle_request(dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query)))
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        self.handle_request(dict(urllib.parse.parse_qsl(self.rfile.read(length).decode())))
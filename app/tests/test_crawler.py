@@ -0,0 +1,92 @@
+import threading
+import time
+
+from taxon_tracker.scheduler import Scheduler
+from . import FakeENATestCase, load_crawler
+
+WEEK = 7 * 24 * 60 * 60
+
+
+class CrawlTests(FakeENATestCase):
+    # Slow enough that ENA round trips dominate, as they do for the real API
+    delay = .2
+
+    def setUp(self):
+        super(CrawlTests, self).setUp()
+        self.crawler = load_crawler()
+
+    def crawl_until(self, done, timeout: float = 60) -> float:
+        """
+        Run the crawler until done() returns True, returning the seconds taken.
+        """
+        scheduler = Scheduler(period=WEEK)
+        stop = threading.Event()
+        thread = threading.Thread(target=self.crawler.crawl, args=(scheduler,), kwargs={'stop': stop}, daemon=True)
+        start = time.monotonic()
+        thread.start()
+        try:
+            while not (done() and scheduler.running == 0):
+                self.assertLess(time.monotonic() - start, timeout, "Crawler did not finish in time")
+                time.sleep(.05)
+            return time.monotonic() - start
+        finally:
+            stop.set()
+            scheduler.notify()
+            thread.join(timeout)
+
+    def updated_taxa(self) -> set:
+        return {row[0] for row in self.query("SELECT id FROM webserver_taxons WHERE last_updated IS NOT NULL")}
+
+    def record_counts(self) -> dict:
+        return dict(self.query("SELECT taxon_id, COUNT(*) FROM webserver_records GROUP BY taxon_id"))
+
+    def test_taxa_are_synced_concurrently(self):
+        """
+        Ensure crawling syncs taxon ids in parallel, and faster than syncing them one after another.
+        """
+        taxa = list(range(1, 9))
+        self.ena.taxa = {taxon_id: 20 for taxon_id in taxa}
+
+        self.add_taxa(*taxa)
+        start = time.monotonic()
+        for taxon_id in taxa:
+            self.crawler.update_taxon(taxon_id)
+        sequential = time.monotonic() - start
+        self.assertEqual(self.record_counts(), {taxon_id: 20 for taxon_id in taxa})
+
+        self.clear_tables()
+        self.add_taxa(*taxa)
+        concurrent = self.crawl_until(lambda: self.updated_taxa() == set(taxa))
+        self.assertEqual(self.record_counts(), {taxon_id: 20 for taxon_id in taxa})
+        self.assertLess(concurrent, sequential / 2, f"{concurrent:.2f}s crawling vs {sequential:.2f}s sequentially")
+
+    def test_failures_are_isolated(self):
+        """
+        Ensure a taxon id that cannot be synced does not stop the others, and keeps its old last_updated.
+        """
+        taxa = [1, 2, 3, 4]
+        self.ena.taxa = {taxon_id: 5 for taxon_id in taxa}
+        self.ena.failing_taxa = {3}
+        self.add_taxa(*taxa)
+
+        self.crawl_until(lambda: self.updated_taxa() == {1, 2, 4} and self.ena.count('links/taxon') >= 4)
+        self.assertEqual(self.updated_taxa(), {1, 2, 4})
+        self.assertEqual(self.record_counts(), {1: 5, 2: 5, 4: 5})
+
+    def test_schedule_recounts_changed_taxa(self):
+        """
+        Ensure reading the schedule only recounts the records of taxon ids it is told have changed.
+        """
+        taxa = [1, 2]
+        self.ena.taxa = {taxon_id: 3 for taxon_id in taxa}
+        self.add_taxa(*taxa)
+        for taxon_id in taxa:
+            self.crawler.update_taxon(taxon_id)
+
+        counts = {}
+        _, schedule = self.crawler.get_taxon_schedule(counts)
+        self.assertEqual({s.taxon_id: s.recent_yield for s in schedule}, {1: 3, 2: 3})
+
+        self.query_update("UPDATE webserver_records SET time_fetched = NOW() - INTERVAL '1 year'")
+        _, schedule = self.crawler.get_taxon_schedule(counts, {2})
+        self.assertEqual({s.taxon_id: s.recent_yield for s in schedule}, {1: 3, 2: 0})
@@ -0,0 +1,121 @@
+import datetime
+import unittest
+import numpy as np
+import pandas
+
+from taxon_tracker import filters
+from . import DatabaseTestCase
+from .fake_ena import random_details
+
+SPEC = [
+    {'type': 'match', 'name': 'library_strategy=WGS', 'field': 'library_strategy', 'value': 'WGS'},
+    {'type': 'match', 'name': 'library_layout=PAIRED', 'field': 'library_layout', 'value': ['PAIRED']},
+    {'type': 'not_na', 'name': 'has base_count', 'field': 'base_count'},
+    {'type': 'min_base_count', 'name': 'base_count size', 'genome_size': 1_000_000, 'x_depth': 30},
+    {'type': 'location_or_date', 'name': 'location or date'}
+]
+
+
+def first_failure(pipeline: filters.FilterPipeline, row) -> str:
+    """
+    Name of the first filter a single-row frame fails, found by trying each filter in turn.
+    """
+    for f in pipeline.filters:
+        if not f.mask(row)[0]:
+            return f.name
+    return ''
+
+
+class FilterPipelineTests(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = filters.compile_filters(SPEC)
+        self.df = random_details(2000)
+
+    def test_evaluate_matches_row_by_row(self):
+        """
+        Ensure each row is attributed to the first filter it fails, as evaluating row by row would.
+        """
+        passed, failed = self.pipeline.evaluate(self.df)
+        expected = [first_failure(self.pipeline, self.df.iloc[[i]]) for i in range(len(self.df))]
+        self.assertEqual(list(failed), expected)
+        np.testing.assert_array_equal(passed, np.array(expected) == '')
+        # Every filter decides some rows, so the comparison covers them all
+        self.assertEqual(set(expected), {''} | {f['name'] for f in SPEC})
+
+    def test_stops_once_all_rows_fail(self):
+        """
+        Ensure filters after the point where every row has failed are not evaluated.
+        """
+        def unreachable(_):
+            raise AssertionError("Filter evaluated after every row failed")
+
+        pipeline = filters.FilterPipeline([
+            filters.FilterMatch('never', 'library_strategy', 'NONE'),
+            filters.Filter('unreachable', unreachable)
+        ])
+        passed, failed = pipeline.evaluate(self.df)
+        self.assertFalse(passed.any())
+        self.assertEqual(set(failed), {'never'})
+
+    def test_unimplemented_filters_skipped(self):
+        pipeline = filters.compile_filters([
+            {'type': 'min_base_count', 'genome_size': None, 'x_depth': 30},
+            SPEC[0]
+        ])
+        passed, failed = pipeline.evaluate(self.df)
+        np.testing.assert_array_equal(passed, (self.df.library_strategy == 'WGS').to_numpy())
+        self.assertEqual(set(failed), {'', 'library_strategy=WGS'})
+
+    def test_uncompilable_specs(self):
+        """
+        Ensure specifications that cannot be compiled are refused, and fields that are not plain names never are.
+        """
+        for spec in [
+            {'type': 'matc', 'field': 'library_strategy', 'value': 'WGS'},
+            {'type': 'match', 'field': 'library_strategy'},
+            {'type': 'not_na', 'field': 'lat IS NULL OR TRUE --'},
+            {'type': 'match', 'field': 'first_public', 'value': 'last week'},
+            {'type': 'min_base_count', 'genome_size': 'large', 'x_depth': 30}
+        ]:
+            with self.subTest(spec=spec), self.assertRaises(filters.FilterSpecException):
+                filters.compile_filters([spec])
+
+    def test_fields(self):
+        """
+        Ensure the pipeline lists every details column its filters read, and evaluates on those alone.
+        """
+        fields = ['base_count', 'collection_date', 'country', 'lat', 'library_layout', 'library_strategy', 'lon']
+        self.assertEqual(self.pipeline.fields, fields)
+        for expected, result in zip(self.pipeline.evaluate(self.df), self.pipeline.evaluate(self.df[fields])):
+            np.testing.assert_array_equal(result, expected)
+
+    def test_typed_values(self):
+        pipeline = filters.compile_filters([
+            {'type': 'match', 'field': 'base_count', 'value': [100, 200]},
+            {'type': 'match', 'field': 'first_public', 'value': '2022-01-01'}
+        ])
+        df = pandas.DataFrame({
+            'base_count': pandas.array([100, 200, 100, None], dtype='Int64'),
+            'first_public': [datetime.date(2022, 1, 1), datetime.date(2022, 1, 1), datetime.date(2022, 1, 2), None]
+        })
+        passed, _ = pipeline.evaluate(df)
+        self.assertEqual(list(passed), [True, True, False, False])
+
+
+class FilterSpecTests(DatabaseTestCase):
+    def test_check_spec(self):
+        """
+        Ensure specifications naming unknown columns, or comparing columns with values of the wrong type,
+        are refused by the rules the web API applies, and valid ones pass.
+        """
+        for spec in [
+            {'type': 'match', 'field': 'no_such_field', 'value': 'WGS'},
+            {'type': 'match', 'field': 'base_count', 'value': 'large'},
+            {'type': 'match', 'field': 'base_count', 'value': True},
+            {'type': 'match', 'field': 'library_strategy', 'value': 1},
+            {'type': 'match', 'field': 'first_public', 'value': '2022-02-30'},
+            {'type': 'min_base_count', 'genome_size': 0, 'x_depth': 30}
+        ]:
+            with self.subTest(spec=spec), self.assertRaises(filters.FilterSpecException):
+                filters.get_pipeline([spec])
+        filters.check_spec(SPEC)
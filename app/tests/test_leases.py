@@ -0,0 +1,42 @@
+import datetime
+
+from taxon_tracker.leases import TaxonLeases, LeaseUnavailable
+from . import DatabaseTestCase
+
+
+class TaxonLeaseTests(DatabaseTestCase):
+    def setUp(self):
+        super(TaxonLeaseTests, self).setUp()
+        self.add_taxa(1)
+        self.leases = TaxonLeases(owner='tests', duration=60)
+        self.other = TaxonLeases(owner='other', duration=60)
+
+    def release_all(self) -> None:
+        self.leases.release(1)
+        self.other.release(1)
+
+    def test_claim_excludes_other_owners(self):
+        self.leases.claim(1)
+        self.addCleanup(self.release_all)
+        with self.assertRaises(LeaseUnavailable):
+            self.other.claim(1)
+        self.leases.claim(1)
+        self.leases.release(1)
+        self.other.claim(1)
+
+    def test_claim_checks_still_due(self):
+        """
+        Ensure a taxon id updated since the scheduler read it is not claimed again.
+        """
+        self.addCleanup(self.release_all)
+        read_at = self.query("SELECT NOW()")[0][0]
+        self.leases.claim(1, updated_before=read_at)
+        self.leases.release(1)
+
+        self.query_update("UPDATE webserver_taxons SET last_updated = :at", at=read_at + datetime.timedelta(seconds=1))
+        with self.assertRaises(LeaseUnavailable):
+            self.other.claim(1, updated_before=read_at)
+        self.assertIsNone(self.query("SELECT lease_owner FROM webserver_taxons WHERE id = 1")[0][0])
+        self.other.claim(1, updated_before=read_at + datetime.timedelta(seconds=2))
+        self.other.release(1)
+        self.other.claim(1)
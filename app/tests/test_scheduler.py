@@ -0,0 +1,132 @@
+import unittest
+
+from taxon_tracker.scheduler import Scheduler, TaxonState
+
+PERIOD = 1000.
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def state(taxon_id: int, age: float = PERIOD, recent_yield: int = 0, backlog: int = 0) -> TaxonState:
+    return TaxonState(taxon_id=taxon_id, age=age, recent_yield=recent_yield, backlog=backlog)
+
+
+class SchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(period=PERIOD, clock=self.clock)
+
+    def test_interval_factors(self):
+        """
+        Ensure yield shortens and backlog lengthens the update interval, within MIN_FACTOR and MAX_FACTOR.
+        """
+        plain = self.scheduler.interval(state(1))
+        self.assertEqual(plain, PERIOD)
+        self.assertLess(self.scheduler.interval(state(1, recent_yield=100)), plain)
+        self.assertGreater(self.scheduler.interval(state(1, backlog=100)), plain)
+        self.assertEqual(self.scheduler.interval(state(1, recent_yield=10 ** 100)), PERIOD * Scheduler.MIN_FACTOR)
+        self.assertEqual(self.scheduler.interval(state(1, backlog=10 ** 100)), PERIOD * Scheduler.MAX_FACTOR)
+
+    def test_due_by_interval(self):
+        """
+        Ensure taxon ids come due one interval after their last update, productive ones first.
+        """
+        self.scheduler.update([
+            state(1, age=PERIOD / 2),
+            state(2, age=PERIOD / 2, recent_yield=100),
+            state(3, age=PERIOD / 2, backlog=100)
+        ])
+        self.assertEqual(self.scheduler.pop_due(3), [])
+        productive = self.scheduler.interval(state(2, recent_yield=100)) - PERIOD / 2
+        self.assertEqual(self.scheduler.next_due(), productive)
+
+        self.clock.now = productive
+        self.assertEqual(self.scheduler.pop_due(3), [2])
+        self.clock.now = PERIOD / 2
+        self.assertEqual(self.scheduler.pop_due(3), [1])
+        self.clock.now = PERIOD * .9
+        self.assertEqual(self.scheduler.pop_due(3), [])
+        self.clock.now = self.scheduler.interval(state(3, backlog=100)) - PERIOD / 2
+        self.assertEqual(self.scheduler.pop_due(3), [3])
+
+    def test_pacing_gap(self):
+        """
+        Ensure overdue taxon ids are released one per period / (2 * number of taxons).
+        """
+        self.scheduler.update([state(taxon_id, age=2 * PERIOD) for taxon_id in range(5)])
+        gap = PERIOD / 10
+        self.assertEqual(len(self.scheduler.pop_due(5)), 1)
+        self.clock.now = gap / 2
+        self.assertEqual(self.scheduler.pop_due(5), [])
+        self.assertEqual(self.scheduler.next_due(), gap / 2)
+        self.clock.now = gap
+        self.assertEqual(len(self.scheduler.pop_due(5)), 1)
+        # A backlog still clears within half a period
+        self.clock.now = PERIOD / 2
+        popped = []
+        while self.clock.now <= PERIOD / 2 + 3 * gap:
+            popped += self.scheduler.pop_due(5)
+            self.clock.now += gap
+        self.assertEqual(len(popped), 3)
+
+    def test_new_taxa_first(self):
+        """
+        Ensure taxon ids never updated are due at once, ahead of overdue ones and regardless of pacing.
+        """
+        self.scheduler.update([state(1, age=2 * PERIOD), state(2, age=None), state(3, age=None)])
+        self.assertEqual(self.scheduler.next_due(), 0)
+        self.assertEqual(self.scheduler.pop_due(2), [2, 3])
+        self.assertEqual(self.scheduler.pop_due(2), [1])
+
+        self.scheduler.update([state(1, age=2 * PERIOD), state(4, age=2 * PERIOD), state(5, age=None)])
+        self.assertEqual(self.scheduler.pop_due(2), [5])
+        self.assertEqual(self.scheduler.running, 4)
+
+    def test_running_taxa_skipped(self):
+        """
+        Ensure taxon ids being synced are not queued again until done.
+        """
+        self.scheduler.update([state(1, age=None)])
+        self.assertEqual(self.scheduler.pop_due(1), [1])
+        self.scheduler.update([state(1, age=None)])
+        self.assertEqual(self.scheduler.pop_due(1), [])
+        self.scheduler.done(1)
+        self.scheduler.update([state(1, age=None)])
+        self.assertEqual(self.scheduler.pop_due(1), [1])
+
+    def test_retry_after(self):
+        """
+        Ensure a failed taxon id is retried after retry_after seconds, even if it has never been updated.
+        """
+        self.scheduler.update([state(1, age=None)])
+        self.assertEqual(self.scheduler.pop_due(1), [1])
+        self.scheduler.done(1, retry_after=30)
+        self.scheduler.update([state(1, age=None)])
+        self.assertEqual(self.scheduler.pop_due(1), [])
+        self.assertEqual(self.scheduler.next_due(), 30)
+        self.clock.now = 30
+        self.assertEqual(self.scheduler.pop_due(1), [1])
+
+        # A retry never brings forward a taxon id that is not otherwise due
+        self.scheduler.done(1, retry_after=30)
+        self.scheduler.update([state(1, age=0)])
+        self.clock.now = 60
+        self.assertEqual(self.scheduler.pop_due(1), [])
+        self.clock.now = 30 + PERIOD
+        self.assertEqual(self.scheduler.pop_due(1), [1])
+
+        # Success clears the retry
+        self.scheduler.done(1)
+        self.scheduler.update([state(1, age=None)])
+        self.assertEqual(self.scheduler.pop_due(1), [1])
+
+    def test_notify_wakes_wait(self):
+        self.scheduler.notify()
+        self.assertTrue(self.scheduler.wait(timeout=10))
+        self.assertFalse(self.scheduler.wait(timeout=0))
@@ -0,0 +1,79 @@
+import datetime
+
+from . import FakeENATestCase, load_crawler
+
+
+class IncrementalSyncTests(FakeENATestCase):
+    def setUp(self):
+        super(IncrementalSyncTests, self).setUp()
+        self.crawler = load_crawler()
+        self.ena.taxa = {1: 30}
+        self.add_taxa(1)
+
+    def sync_state(self) -> tuple:
+        return self.query("SELECT ena_watermark, last_full_sync IS NOT NULL FROM webserver_taxons WHERE id = 1")[0]
+
+    def n_records(self) -> int:
+        return self.query("SELECT COUNT(*) FROM webserver_records WHERE taxon_id = 1")[0][0]
+
+    def test_second_pass_lists_updates_only(self):
+        """
+        Ensure only the first sync lists the whole subtree, and later syncs ask for records updated since the watermark.
+        """
+        self.crawler.update_taxon(1)
+        self.assertGreater(self.ena.count('links/taxon'), 0)
+        self.assertEqual(self.sync_state(), (datetime.date(2022, 1, 1), True))
+        self.assertEqual(self.n_records(), 30)
+
+        self.ena.requests.clear()
+        self.crawler.update_taxon(1)
+        self.assertEqual(self.ena.count('links/taxon'), 0)
+        # Nothing was updated after the watermark day, so only the listing is sent
+        self.assertEqual(self.ena.count('search'), 1)
+
+        # New and changed records are picked up and move the watermark on
+        self.ena.taxa = {1: 35}
+        self.ena.last_updated = '2022-02-01'
+        self.ena.requests.clear()
+        self.crawler.update_taxon(1)
+        self.assertEqual(self.ena.count('links/taxon'), 0)
+        self.assertEqual(self.n_records(), 35)
+        self.assertEqual(self.sync_state()[0], datetime.date(2022, 2, 1))
+
+    def test_failed_fetch_keeps_watermark(self):
+        """
+        Ensure the watermark only moves on once every wanted record has been saved.
+        """
+        self.ena.failing_details = True
+        self.crawler.update_taxon(1)
+        self.assertEqual(self.sync_state(), (None, False))
+
+        self.ena.failing_details = False
+        self.ena.requests.clear()
+        self.crawler.update_taxon(1)
+        self.assertGreater(self.ena.count('links/taxon'), 0)
+        self.assertEqual(self.n_records(), 30)
+        self.assertEqual(self.sync_state(), (datetime.date(2022, 1, 1), True))
+
+    def test_stale_full_sync_lists_everything(self):
+        """
+        Ensure the whole subtree is listed again once the last full sync is older than FULL_SYNC_N FULL_SYNC_UNITS.
+        """
+        self.crawler.update_taxon(1)
+        self.query_update("UPDATE webserver_taxons SET last_full_sync = NOW() - INTERVAL '1 year'")
+        self.ena.requests.clear()
+        self.crawler.update_taxon(1)
+        self.assertGreater(self.ena.count('links/taxon'), 0)
+
+    def test_changed_records_filtered_again(self):
+        """
+        Ensure records whose details ENA has changed lose their filter decision, and unchanged ones keep it.
+        """
+        self.crawler.update_taxon(1)
+        undecided = "SELECT COUNT(*) FROM webserver_records WHERE passed_filter IS NULL AND filter_hash IS NULL"
+        self.assertEqual(self.query(undecided)[0][0], 0)
+
+        self.ena.taxa = {1: 35}
+        self.ena.last_updated = '2022-02-01'
+        self.crawler.query_ENA(1)
+        self.assertEqual(self.query(undecided)[0][0], 35)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import datetime
 import os
 from pathlib import Path
 import sys
@@ -172,3 +173,22 @@ LOGGING = {
         },
     },
 }
+
+# Postgres NOTIFY channel the crawler listens on for changes made through the API
+NOTIFY_CHANNEL = os.environ.get('NOTIFY_CHANNEL', 'taxon_tracker')
+
+# How long assembly candidates are held: for confirmation once claimed, and for a result once confirmed.
+# These match the crawler's CONSIDERATION_PERIOD and ASSEMBLY_PERIOD settings.
+CONSIDERATION_PERIOD = datetime.timedelta(**{
+    os.environ.get('CONSIDERATION_PERIOD_UNITS', 'minutes'): int(os.environ.get('CONSIDERATION_PERIOD_N', '10'))
+})
+ASSEMBLY_PERIOD = datetime.timedelta(**{
+    os.environ.get('ASSEMBLY_PERIOD_UNITS', 'days'): int(os.environ.get('ASSEMBLY_PERIOD_N', '7'))
+})
+
+# Confirmed records are leased for a multiple of how long records with a similar base_count
+# have taken to assemble, once enough have been reported; ASSEMBLY_PERIOD is the upper bound.
+ASSEMBLY_TIMEOUT_QUANTILE = float(os.environ.get('ASSEMBLY_TIMEOUT_QUANTILE', '0.95'))
+ASSEMBLY_TIMEOUT_FACTOR = float(os.environ.get('ASSEMBLY_TIMEOUT_FACTOR', '2'))
+ASSEMBLY_TIMEOUT_MIN_SAMPLES = int(os.environ.get('ASSEMBLY_TIMEOUT_MIN_SAMPLES', '10'))
+ASSEMBLY_TIMEOUT_MIN = datetime.timedelta(seconds=float(os.environ.get('ASSEMBLY_TIMEOUT_MIN_SECONDS', '3600')))
@@ -0,0 +1,246 @@
+# Generated by Django 4.0.4 on 2026-10-17 03:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Taxons',
+            fields=[
+                ('id', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('last_updated', models.DateTimeField(null=True)),
+                ('time_added', models.DateTimeField(auto_now_add=True)),
+                ('post_assembly_filters', models.JSONField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Records',
+            fields=[
+                ('id', models.CharField(max_length=1024, primary_key=True, serialize=False)),
+                ('accession', models.CharField(max_length=40, null=True)),
+                ('experiment_accession', models.CharField(max_length=40, null=True)),
+                ('run_accession', models.CharField(max_length=40, null=True)),
+                ('sample_accession', models.CharField(max_length=40, null=True)),
+                ('secondary_sample_accession', models.CharField(max_length=40, null=True)),
+                ('fastq_ftp', models.CharField(max_length=4096, null=True)),
+                ('passed_filter', models.BooleanField(null=True)),
+                ('filter_failed', models.CharField(max_length=1024, null=True)),
+                ('time_fetched', models.DateTimeField(auto_now_add=True)),
+                ('waiting_since', models.DateTimeField(null=True)),
+                ('assembly_result', models.CharField(choices=[('under consideration', 'under consideration'), ('in progress', 'in progress'), ('fail', 'fail'), ('success', 'success')], max_length=40, null=True)),
+                ('assembled_genome_url', models.CharField(max_length=1024, null=True)),
+                ('assembly_error_report_url', models.CharField(max_length=1024, null=True)),
+                ('taxon', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='webserver.taxons')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecordDetails',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_fetched', models.DateTimeField(auto_now_add=True)),
+                ('accession', models.CharField(max_length=40, null=True)),
+                ('altitude', models.CharField(max_length=1024, null=True)),
+                ('assembly_quality', models.CharField(max_length=1024, null=True)),
+                ('assembly_software', models.CharField(max_length=1024, null=True)),
+                ('base_count', models.CharField(max_length=1024, null=True)),
+                ('binning_software', models.CharField(max_length=1024, null=True)),
+                ('bio_material', models.CharField(max_length=1024, null=True)),
+                ('broker_name', models.CharField(max_length=1024, null=True)),
+                ('cell_line', models.CharField(max_length=1024, null=True)),
+                ('cell_type', models.CharField(max_length=1024, null=True)),
+                ('center_name', models.CharField(max_length=1024, null=True)),
+                ('checklist', models.CharField(max_length=1024, null=True)),
+                ('collected_by', models.CharField(max_length=1024, null=True)),
+                ('collection_date', models.CharField(max_length=1024, null=True)),
+                ('collection_date_submitted', models.CharField(max_length=1024, null=True)),
+                ('completeness_score', models.CharField(max_length=1024, null=True)),
+                ('contamination_score', models.CharField(max_length=1024, null=True)),
+                ('country', models.CharField(max_length=1024, null=True)),
+                ('cram_index_ftp', models.CharField(max_length=4096, null=True)),
+                ('cram_index_aspera', models.CharField(max_length=4096, null=True)),
+                ('cram_index_galaxy', models.CharField(max_length=4096, null=True)),
+                ('cultivar', models.CharField(max_length=1024, null=True)),
+                ('culture_collection', models.CharField(max_length=1024, null=True)),
+                ('depth', models.CharField(max_length=1024, null=True)),
+                ('dev_stage', models.CharField(max_length=1024, null=True)),
+                ('description', models.CharField(max_length=4096, null=True)),
+                ('ecotype', models.CharField(max_length=1024, null=True)),
+                ('elevation', models.CharField(max_length=1024, null=True)),
+                ('environment_biome', models.CharField(max_length=1024, null=True)),
+                ('environment_feature', models.CharField(max_length=1024, null=True)),
+                ('environment_material', models.CharField(max_length=1024, null=True)),
+                ('environmental_package', models.CharField(max_length=1024, null=True)),
+                ('environmental_sample', models.CharField(max_length=1024, null=True)),
+                ('experiment_accession', models.CharField(max_length=40, null=True)),
+                ('experiment_alias', models.CharField(max_length=1024, null=True)),
+                ('experiment_title', models.CharField(max_length=4096, null=True)),
+                ('experimental_factor', models.CharField(max_length=1024, null=True)),
+                ('fastq_bytes', models.CharField(max_length=1024, null=True)),
+                ('fastq_md5', models.CharField(max_length=1024, null=True)),
+                ('fastq_ftp', models.CharField(max_length=4096, null=True)),
+                ('fastq_aspera', models.CharField(max_length=4096, null=True)),
+                ('fastq_galaxy', models.CharField(max_length=4096, null=True)),
+                ('first_created', models.CharField(max_length=1024, null=True)),
+                ('first_public', models.CharField(max_length=1024, null=True)),
+                ('germline', models.CharField(max_length=1024, null=True)),
+                ('host', models.CharField(max_length=1024, null=True)),
+                ('host_body_site', models.CharField(max_length=1024, null=True)),
+                ('host_genotype', models.CharField(max_length=1024, null=True)),
+                ('host_growth_conditions', models.CharField(max_length=1024, null=True)),
+                ('host_gravidity', models.CharField(max_length=1024, null=True)),
+                ('host_phenotype', models.CharField(max_length=1024, null=True)),
+                ('host_sex', models.CharField(max_length=1024, null=True)),
+                ('host_status', models.CharField(max_length=1024, null=True)),
+                ('host_tax_id', models.CharField(max_length=1024, null=True)),
+                ('identified_by', models.CharField(max_length=1024, null=True)),
+                ('instrument_model', models.CharField(max_length=1024, null=True)),
+                ('instrument_platform', models.CharField(max_length=1024, null=True)),
+                ('investigation_type', models.CharField(max_length=1024, null=True)),
+                ('isolate', models.CharField(max_length=1024, null=True)),
+                ('isolation_source', models.CharField(max_length=1024, null=True)),
+                ('last_updated', models.CharField(max_length=1024, null=True)),
+                ('lat', models.CharField(max_length=40, null=True)),
+                ('lon', models.CharField(max_length=40, null=True)),
+                ('library_construction_protocol', models.CharField(max_length=4096, null=True)),
+                ('library_layout', models.CharField(max_length=1024, null=True)),
+                ('library_name', models.CharField(max_length=1024, null=True)),
+                ('library_selection', models.CharField(max_length=1024, null=True)),
+                ('library_source', models.CharField(max_length=1024, null=True)),
+                ('library_strategy', models.CharField(max_length=1024, null=True)),
+                ('location', models.CharField(max_length=1024, null=True)),
+                ('mating_type', models.CharField(max_length=1024, null=True)),
+                ('nominal_length', models.CharField(max_length=1024, null=True)),
+                ('nominal_sdev', models.CharField(max_length=1024, null=True)),
+                ('parent_study', models.CharField(max_length=1024, null=True)),
+                ('ph', models.CharField(max_length=1024, null=True)),
+                ('project_name', models.CharField(max_length=1024, null=True)),
+                ('protocol_label', models.CharField(max_length=1024, null=True)),
+                ('read_count', models.CharField(max_length=1024, null=True)),
+                ('run_accession', models.CharField(max_length=1024, null=True)),
+                ('run_alias', models.CharField(max_length=1024, null=True)),
+                ('salinity', models.CharField(max_length=1024, null=True)),
+                ('sample_accession', models.CharField(max_length=40, null=True)),
+                ('sample_alias', models.CharField(max_length=1024, null=True)),
+                ('sample_capture_status', models.CharField(max_length=1024, null=True)),
+                ('sample_collection', models.CharField(max_length=1024, null=True)),
+                ('sample_description', models.CharField(max_length=4096, null=True)),
+                ('sample_material', models.CharField(max_length=1024, null=True)),
+                ('sample_title', models.CharField(max_length=4096, null=True)),
+                ('sampling_campaign', models.CharField(max_length=1024, null=True)),
+                ('sampling_platform', models.CharField(max_length=1024, null=True)),
+                ('sampling_site', models.CharField(max_length=1024, null=True)),
+                ('scientific_name', models.CharField(max_length=1024, null=True)),
+                ('secondary_sample_accession', models.CharField(max_length=40, null=True)),
+                ('secondary_study_accession', models.CharField(max_length=40, null=True)),
+                ('sequencing_method', models.CharField(max_length=1024, null=True)),
+                ('serotype', models.CharField(max_length=1024, null=True)),
+                ('serovar', models.CharField(max_length=1024, null=True)),
+                ('sex', models.CharField(max_length=1024, null=True)),
+                ('specimen_voucher', models.CharField(max_length=1024, null=True)),
+                ('sra_bytes', models.CharField(max_length=1024, null=True)),
+                ('sra_md5', models.CharField(max_length=1024, null=True)),
+                ('sra_ftp', models.CharField(max_length=4096, null=True)),
+                ('sra_aspera', models.CharField(max_length=4096, null=True)),
+                ('sra_galaxy', models.CharField(max_length=4096, null=True)),
+                ('strain', models.CharField(max_length=1024, null=True)),
+                ('study_accession', models.CharField(max_length=40, null=True)),
+                ('study_alias', models.CharField(max_length=1024, null=True)),
+                ('study_title', models.CharField(max_length=1024, null=True)),
+                ('sub_species', models.CharField(max_length=1024, null=True)),
+                ('sub_strain', models.CharField(max_length=1024, null=True)),
+                ('submission_accession', models.CharField(max_length=40, null=True)),
+                ('submission_tool', models.CharField(max_length=1024, null=True)),
+                ('submitted_bytes', models.CharField(max_length=1024, null=True)),
+                ('submitted_md5', models.CharField(max_length=1024, null=True)),
+                ('submitted_ftp', models.CharField(max_length=4096, null=True)),
+                ('submitted_aspera', models.CharField(max_length=4096, null=True)),
+                ('submitted_galaxy', models.CharField(max_length=4096, null=True)),
+                ('submitted_format', models.CharField(max_length=1024, null=True)),
+                ('submitted_host_sex', models.CharField(max_length=40, null=True)),
+                ('submitted_sex', models.CharField(max_length=40, null=True)),
+                ('target_gene', models.CharField(max_length=1024, null=True)),
+                ('taxonomic_classification', models.CharField(max_length=1024, null=True)),
+                ('taxonomic_identity_marker', models.CharField(max_length=1024, null=True)),
+                ('tax_id', models.CharField(max_length=1024, null=True)),
+                ('taxonomy', models.CharField(max_length=1024, null=True)),
+                ('temperature', models.CharField(max_length=1024, null=True)),
+                ('tissue_lib', models.CharField(max_length=1024, null=True)),
+                ('tissue_type', models.CharField(max_length=1024, null=True)),
+                ('variety', models.CharField(max_length=1024, null=True)),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='webserver.records')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QualifyrReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sample_name', models.CharField(max_length=256, null=True)),
+                ('result', models.CharField(max_length=256, null=True)),
+                ('bactinspector_result_metric_value', models.CharField(max_length=256, null=True)),
+                ('bactinspector_result_check_result', models.CharField(max_length=256, null=True)),
+                ('bactinspector_species_metric_value', models.CharField(max_length=256, null=True)),
+                ('bactinspector_species_check_result', models.CharField(max_length=256, null=True)),
+                ('confindr_contam_status_metric_value', models.CharField(max_length=256, null=True)),
+                ('confindr_contam_status_check_result', models.CharField(max_length=256, null=True)),
+                ('confindr_percentage_contamination_metric_value', models.CharField(max_length=256, null=True)),
+                ('confindr_percentage_contamination_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Adapter_Content_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Adapter_Content_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Basic_Statistics_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Basic_Statistics_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Overrepresented_sequences_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Overrepresented_sequences_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_base_N_content_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_base_N_content_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_base_sequence_quality_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_base_sequence_quality_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_sequence_GC_content_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_sequence_GC_content_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_sequence_quality_scores_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Per_sequence_quality_scores_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Sequence_Duplication_Levels_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Sequence_Duplication_Levels_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Sequence_Length_Distribution_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_1_Sequence_Length_Distribution_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Adapter_Content_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Adapter_Content_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Basic_Statistics_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Basic_Statistics_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Overrepresented_sequences_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Overrepresented_sequences_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_base_N_content_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_base_N_content_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_base_sequence_quality_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_base_sequence_quality_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_sequence_GC_content_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_sequence_GC_content_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_sequence_quality_scores_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Per_sequence_quality_scores_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Sequence_Duplication_Levels_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Sequence_Duplication_Levels_check_result', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Sequence_Length_Distribution_metric_value', models.CharField(max_length=256, null=True)),
+                ('fastqc_2_Sequence_Length_Distribution_check_result', models.CharField(max_length=256, null=True)),
+                ('file_size_check_size_metric_value', models.CharField(max_length=256, null=True)),
+                ('file_size_check_size_check_result', models.CharField(max_length=256, null=True)),
+                ('quast_Ns_per_100_kbp_metric_value', models.CharField(max_length=256, null=True)),
+                ('quast_Ns_per_100_kbp_check_result', models.CharField(max_length=256, null=True)),
+                ('quast_contigs_metric_value', models.CharField(max_length=256, null=True)),
+                ('quast_contigs_check_result', models.CharField(max_length=256, null=True)),
+                ('quast_GC_metric_value', models.CharField(max_length=256, null=True)),
+                ('quast_GC_check_result', models.CharField(max_length=256, null=True)),
+                ('quast_N50_metric_value', models.CharField(max_length=256, null=True)),
+                ('quast_N50_check_result', models.CharField(max_length=256, null=True)),
+                ('quast_Total_length_metric_value', models.CharField(max_length=256, null=True)),
+                ('quast_Total_length_check_result', models.CharField(max_length=256, null=True)),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='webserver.records')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.4 on 2026-10-17 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webserver', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taxons',
+            name='ena_watermark',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='taxons',
+            name='last_full_sync',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='records',
+            index=models.Index(fields=['taxon', 'run_accession'], name='records_taxon_run_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recorddetails',
+            constraint=models.UniqueConstraint(fields=('record',), name='recorddetails_unique_record'),
+        ),
+    ]
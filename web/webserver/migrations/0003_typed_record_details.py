@@ -0,0 +1,108 @@
+"""
+Give RecordDetails' numeric and date fields native types, and move the Aspera and Galaxy mirror links into extra.
+Written by hand: ENA sends missing values as empty strings, and legacy rows may hold other values a plain
+cast cannot convert, so values are only cast once they match their type's format and become NULL otherwise,
+as the crawler's prepare_details does. The mirror links are kept in extra rather than dropped with their columns.
+"""
+from django.db import migrations, models
+
+TABLE = 'webserver_recorddetails'
+
+MIRROR_COLUMNS = [
+    f"{prefix}_{mirror}"
+    for prefix in ['cram_index', 'fastq', 'sra', 'submitted']
+    for mirror in ['aspera', 'galaxy']
+]
+
+# Column: (new type, field, old varchar length)
+TYPED_COLUMNS = {
+    'base_count': ('bigint', models.BigIntegerField(null=True), 1024),
+    'read_count': ('bigint', models.BigIntegerField(null=True), 1024),
+    'nominal_length': ('bigint', models.BigIntegerField(null=True), 1024),
+    'tax_id': ('bigint', models.BigIntegerField(null=True), 1024),
+    'lat': ('double precision', models.FloatField(null=True), 40),
+    'lon': ('double precision', models.FloatField(null=True), 40),
+    'nominal_sdev': ('double precision', models.FloatField(null=True), 1024),
+    'completeness_score': ('double precision', models.FloatField(null=True), 1024),
+    'contamination_score': ('double precision', models.FloatField(null=True), 1024),
+    'first_created': ('date', models.DateField(null=True), 1024),
+    'first_public': ('date', models.DateField(null=True), 1024),
+    'last_updated': ('date', models.DateField(null=True), 1024),
+}
+
+# Formats each type's values are cast from, with digits bounded so a cast can never overflow
+NUMBER_FORMATS = {
+    'bigint': r'^\s*[-+]?\d{1,18}\s*$',
+    'double precision': r'^\s*[-+]?(\d{1,200}(\.\d{0,200})?|\.\d{1,200})([eE][-+]?\d{1,2})?\s*$',
+}
+DATE_FORMAT = r'^(?!0000)\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$'
+
+
+def cast(column: str, sql_type: str) -> str:
+    """
+    SQL casting column to sql_type, or to NULL if its value is not in the type's format.
+    Nested CASEs make Postgres check the format before it casts.
+    """
+    if sql_type == 'date':
+        # The format admits days the month does not have, e.g. 2022-02-30, so the day is checked too
+        month_end = f"EXTRACT(DAY FROM (LEFT({column}, 7) || '-01')::date + INTERVAL '1 month - 1 day')"
+        return (
+            f"CASE WHEN {column} ~ '{DATE_FORMAT}' THEN "
+            f"CASE WHEN RIGHT({column}, 2)::int <= {month_end} THEN {column}::date END END"
+        )
+    return f"CASE WHEN {column} ~ '{NUMBER_FORMATS[sql_type]}' THEN {column}::{sql_type} END"
+
+
+# Gather the non-empty mirror links of each row into extra, leaving extra NULL for rows without any
+MIRROR_LINKS = ', '.join(f"'{column}', NULLIF({column}, '')" for column in MIRROR_COLUMNS)
+COPY_MIRRORS_TO_EXTRA = (
+    f"UPDATE {TABLE} SET extra = links FROM ("
+    f"  SELECT id, jsonb_strip_nulls(jsonb_build_object({MIRROR_LINKS})) AS links FROM {TABLE}"
+    f") mirrors WHERE {TABLE}.id = mirrors.id AND links <> '{{}}'::jsonb"
+)
+
+MIRRORS_FROM_EXTRA = ', '.join(f"{column} = extra ->> '{column}'" for column in MIRROR_COLUMNS)
+COPY_EXTRA_TO_MIRRORS = f"UPDATE {TABLE} SET {MIRRORS_FROM_EXTRA} WHERE extra IS NOT NULL"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webserver', '0002_sync_state_and_record_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recorddetails',
+            name='extra',
+            field=models.JSONField(null=True),
+        ),
+        # Run the foreign key checks queued by the update straight away;
+        # Postgres refuses to alter a table with checks still pending
+        migrations.RunSQL(
+            [COPY_MIRRORS_TO_EXTRA, "SET CONSTRAINTS ALL IMMEDIATE"],
+            reverse_sql=[COPY_EXTRA_TO_MIRRORS, "SET CONSTRAINTS ALL IMMEDIATE"]
+        ),
+        *[
+            migrations.RemoveField(model_name='recorddetails', name=column)
+            for column in MIRROR_COLUMNS
+        ],
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    f"ALTER TABLE {TABLE} " + ', '.join(
+                        f"ALTER COLUMN {column} TYPE {sql_type} USING {cast(column, sql_type)}"
+                        for column, (sql_type, _, _) in TYPED_COLUMNS.items()
+                    ),
+                    reverse_sql=f"ALTER TABLE {TABLE} " + ', '.join(
+                        f"ALTER COLUMN {column} TYPE varchar({length}) USING {column}::text"
+                        for column, (_, _, length) in TYPED_COLUMNS.items()
+                    )
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(model_name='recorddetails', name=column, field=field)
+                for column, (_, field, _) in TYPED_COLUMNS.items()
+            ]
+        ),
+    ]
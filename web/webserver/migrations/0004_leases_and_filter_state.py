@@ -0,0 +1,48 @@
+# Generated by Django 4.0.4 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webserver', '0003_typed_record_details'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='records',
+            name='assembly_duration',
+            field=models.DurationField(null=True),
+        ),
+        migrations.AddField(
+            model_name='records',
+            name='assembly_progress',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='records',
+            name='filter_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='records',
+            name='lease_expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='taxons',
+            name='lease_expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='taxons',
+            name='lease_owner',
+            field=models.CharField(max_length=256, null=True),
+        ),
+        migrations.AddField(
+            model_name='taxons',
+            name='pre_assembly_filters',
+            field=models.JSONField(null=True),
+        ),
+    ]
@@ -0,0 +1,116 @@
+"""
+Add webserver_filter_spec_error(spec), the rules for taxons' pre_assembly_filters.
+The web API checks specifications with it before saving them and the crawler before compiling them,
+so both sides apply the same rules. Fields and their types are read from the RecordDetails table,
+so the rules follow the model as it is migrated. Change the rules with a new migration that replaces the function.
+"""
+from django.db import migrations
+
+# Returns NULL for a valid specification, otherwise a description of its first problem
+CREATE_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION webserver_filter_spec_error(spec jsonb) RETURNS text
+LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    -- Filter types the crawler implements (FILTER_TYPES in app/taxon_tracker/filters.py),
+    -- and the arguments each takes besides an optional 'name'
+    filter_arguments CONSTANT jsonb := '{
+        "not_na": ["field"],
+        "match": ["field", "value"],
+        "min_base_count": ["genome_size", "x_depth"],
+        "location_or_date": []
+    }';
+    item jsonb;
+    expected text[];
+    field_type text;
+    match_value jsonb;
+    argument text;
+BEGIN
+    IF jsonb_typeof(spec) IS DISTINCT FROM 'array' THEN
+        RETURN 'pre_assembly_filters must be a list of filters.';
+    END IF;
+
+    FOR item IN SELECT jsonb_array_elements(spec) LOOP
+        IF jsonb_typeof(item) <> 'object' OR NOT COALESCE(filter_arguments ? (item ->> 'type'), FALSE) THEN
+            RETURN format(
+                'Unrecognised filter %s; types are %s.',
+                item, (SELECT string_agg(t, ', ') FROM jsonb_object_keys(filter_arguments) t)
+            );
+        END IF;
+
+        expected := ARRAY(SELECT a FROM jsonb_array_elements_text(filter_arguments -> (item ->> 'type')) a ORDER BY a);
+        IF ARRAY(SELECT k FROM jsonb_object_keys(item - 'type' - 'name') k ORDER BY k) <> expected THEN
+            RETURN format(
+                'Filter %s should have arguments %s.',
+                item, COALESCE(NULLIF(array_to_string(expected, ', '), ''), 'none')
+            );
+        END IF;
+
+        IF item ? 'name' AND jsonb_typeof(item -> 'name') <> 'string' THEN
+            RETURN format('Filter %s should have a string name.', item);
+        END IF;
+
+        IF item ? 'field' THEN
+            SELECT data_type INTO field_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'webserver_recorddetails'
+                AND column_name = item ->> 'field' AND jsonb_typeof(item -> 'field') = 'string';
+            IF field_type IS NULL THEN
+                RETURN format('Filter %s refers to an unknown field.', item);
+            END IF;
+        END IF;
+
+        IF item ? 'value' THEN
+            FOR match_value IN SELECT jsonb_array_elements(
+                CASE WHEN jsonb_typeof(item -> 'value') = 'array' THEN item -> 'value'
+                ELSE jsonb_build_array(item -> 'value') END
+            ) LOOP
+                IF NOT (CASE
+                    WHEN field_type IN ('character varying', 'character', 'text') THEN
+                        jsonb_typeof(match_value) = 'string'
+                    WHEN field_type IN ('bigint', 'integer', 'smallint') THEN
+                        jsonb_typeof(match_value) = 'number' AND match_value #>> '{}' ~ '^-?[0-9]+$'
+                    WHEN field_type IN ('double precision', 'real', 'numeric') THEN
+                        jsonb_typeof(match_value) = 'number'
+                    -- Dates are given as ISO strings, and must be real dates
+                    WHEN field_type = 'date' THEN
+                        jsonb_typeof(match_value) = 'string' AND match_value #>> '{}' ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$'
+                    ELSE FALSE
+                END) THEN
+                    RETURN format('Filter %s has values of the wrong type for its field.', item);
+                END IF;
+                IF field_type = 'date' THEN
+                    BEGIN
+                        PERFORM (match_value #>> '{}')::date;
+                    EXCEPTION WHEN datetime_field_overflow OR invalid_datetime_format THEN
+                        RETURN format('Filter %s has values of the wrong type for its field.', item);
+                    END;
+                END IF;
+            END LOOP;
+        END IF;
+
+        FOREACH argument IN ARRAY ARRAY['genome_size', 'x_depth'] LOOP
+            IF item ? argument AND NOT (CASE
+                WHEN jsonb_typeof(item -> argument) = 'number' AND item ->> argument ~ '^[0-9]+$' THEN
+                    (item ->> argument)::numeric > 0
+                ELSE FALSE
+            END) THEN
+                RETURN format('Filter %s should have a positive integer %s.', item, argument);
+            END IF;
+        END LOOP;
+    END LOOP;
+
+    RETURN NULL;
+END
+$$
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webserver', '0004_leases_and_filter_state'),
+    ]
+
+    operations = [
+        # Given as a list, so Django runs the function body as one statement instead of splitting it at semicolons
+        migrations.RunSQL([CREATE_FUNCTION], reverse_sql=["DROP FUNCTION webserver_filter_spec_error(jsonb)"]),
+    ]
@@ -0,0 +1,43 @@
+"""
+Add the records indexes the crawler and the assembly candidate queries rely on.
+CREATE INDEX CONCURRENTLY builds them without blocking writes to the records table,
+which is busy on a running instance; it cannot run in a transaction, so the migration is not atomic.
+"""
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+WAITING_CANDIDATES = models.Q(assembly_result__isnull=True, passed_filter=True, waiting_since__isnull=False)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('webserver', '0005_filter_spec_rules'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='records',
+            index=models.Index(fields=['taxon', 'id'], name='records_taxon_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='records',
+            index=models.Index(
+                condition=WAITING_CANDIDATES, fields=['waiting_since'], name='records_candidates_idx'
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='records',
+            index=models.Index(
+                condition=WAITING_CANDIDATES, fields=['taxon', 'waiting_since'], name='records_taxon_candidates_idx'
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name='records',
+            index=models.Index(
+                condition=models.Q(lease_expires_at__isnull=False), fields=['lease_expires_at'],
+                name='records_lease_expiry_idx'
+            ),
+        ),
+    ]
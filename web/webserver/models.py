@@ -19,6 +19,18 @@ class Taxons(models.Model):
     last_updated = models.DateTimeField(null=True)
     time_added = models.DateTimeField(auto_now_add=True)
     post_assembly_filters = models.JSONField(null=True)
+    # List of filters records must pass before assembly; null uses the crawler's default filters
+    pre_assembly_filters = models.JSONField(null=True)
+    # Latest ENA last_updated date held locally, and when the full subtree was last listed
+    ena_watermark = models.DateField(null=True)
+    last_full_sync = models.DateTimeField(null=True)
+    # Crawler instance currently syncing the taxon, and when its claim lapses unless renewed
+    lease_owner = models.CharField(null=True, max_length=LENGTH_SHORT)
+    lease_expires_at = models.DateTimeField(null=True)
+
+
+# Records waiting to be claimed for assembly
+CANDIDATE = models.Q(waiting_since__isnull=False, passed_filter=True, assembly_result__isnull=True)
 
 
 class Records(models.Model):
@@ -32,6 +44,8 @@ class Records(models.Model):
     fastq_ftp = models.CharField(null=True, max_length=LENGTH_LONG)
     passed_filter = models.BooleanField(null=True)
     filter_failed = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    # Hash of the filter specification that made the passed_filter decision
+    filter_hash = models.CharField(null=True, max_length=64)
     time_fetched = models.DateTimeField(auto_now_add=True)
     waiting_since = models.DateTimeField(null=True)
     assembly_result = models.CharField(
@@ -41,17 +55,44 @@ class Records(models.Model):
     )
     assembled_genome_url = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     assembly_error_report_url = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    # When a claimed record is released unless confirmed, reported, or renewed
+    lease_expires_at = models.DateTimeField(null=True)
+    # Fraction of the assembly completed, as last reported by the assembler's heartbeat
+    assembly_progress = models.FloatField(null=True)
+    # Time from confirmation to the assembly result being reported
+    assembly_duration = models.DurationField(null=True)
+
+    class Meta:
+        indexes = [
+            # The crawler diffs ENA listings against local records by taxon and run accession
+            models.Index(fields=['taxon', 'run_accession'], name='records_taxon_run_idx'),
+            # A taxon's records are paged through in id order
+            models.Index(fields=['taxon', 'id'], name='records_taxon_id_idx'),
+            # Assembly candidates, in the order they are handed out, overall and per taxon
+            models.Index(fields=['waiting_since'], name='records_candidates_idx', condition=CANDIDATE),
+            models.Index(fields=['taxon', 'waiting_since'], name='records_taxon_candidates_idx', condition=CANDIDATE),
+            # Claimed records, in the order their leases expire
+            models.Index(
+                fields=['lease_expires_at'],
+                name='records_lease_expiry_idx',
+                condition=models.Q(lease_expires_at__isnull=False)
+            )
+        ]
 
 
 class RecordDetails(models.Model):
     record = models.ForeignKey("Records", on_delete=models.DO_NOTHING)
     time_fetched = models.DateTimeField(auto_now_add=True)
     # Fields as retrieved from ENA database
+    # Numeric and date fields use native types so they can be filtered without parsing
+    # Every field here can be named in a taxon's pre_assembly_filters and selected with details.<field>
+    # in the API, so fields stay columns however rarely they are set; only links to copies of the
+    # files held elsewhere, which nothing filters or selects, are kept in extra
     accession = models.CharField(null=True, max_length=LENGTH_ACCESSION)
     altitude = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     assembly_quality = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     assembly_software = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    base_count = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    base_count = models.BigIntegerField(null=True)
     binning_software = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     bio_material = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     broker_name = models.CharField(null=True, max_length=LENGTH_MEDIUM)
@@ -62,12 +103,10 @@ class RecordDetails(models.Model):
     collected_by = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     collection_date = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     collection_date_submitted = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    completeness_score = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    contamination_score = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    completeness_score = models.FloatField(null=True)
+    contamination_score = models.FloatField(null=True)
     country = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     cram_index_ftp = models.CharField(null=True, max_length=LENGTH_LONG)
-    cram_index_aspera = models.CharField(null=True, max_length=LENGTH_LONG)
-    cram_index_galaxy = models.CharField(null=True, max_length=LENGTH_LONG)
     cultivar = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     culture_collection = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     depth = models.CharField(null=True, max_length=LENGTH_MEDIUM)
@@ -87,10 +126,8 @@ class RecordDetails(models.Model):
     fastq_bytes = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     fastq_md5 = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     fastq_ftp = models.CharField(null=True, max_length=LENGTH_LONG)
-    fastq_aspera = models.CharField(null=True, max_length=LENGTH_LONG)
-    fastq_galaxy = models.CharField(null=True, max_length=LENGTH_LONG)
-    first_created = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    first_public = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    first_created = models.DateField(null=True)
+    first_public = models.DateField(null=True)
     germline = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     host = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     host_body_site = models.CharField(null=True, max_length=LENGTH_MEDIUM)
@@ -107,9 +144,9 @@ class RecordDetails(models.Model):
     investigation_type = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     isolate = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     isolation_source = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    last_updated = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    lat = models.CharField(null=True, max_length=LENGTH_ACCESSION)
-    lon = models.CharField(null=True, max_length=LENGTH_ACCESSION)
+    last_updated = models.DateField(null=True)
+    lat = models.FloatField(null=True)
+    lon = models.FloatField(null=True)
     library_construction_protocol = models.CharField(null=True, max_length=LENGTH_LONG)
     library_layout = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     library_name = models.CharField(null=True, max_length=LENGTH_MEDIUM)
@@ -118,13 +155,13 @@ class RecordDetails(models.Model):
     library_strategy = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     location = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     mating_type = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    nominal_length = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    nominal_sdev = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    nominal_length = models.BigIntegerField(null=True)
+    nominal_sdev = models.FloatField(null=True)
     parent_study = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     ph = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     project_name = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     protocol_label = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    read_count = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    read_count = models.BigIntegerField(null=True)
     run_accession = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     run_alias = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     salinity = models.CharField(null=True, max_length=LENGTH_MEDIUM)
@@ -149,8 +186,6 @@ class RecordDetails(models.Model):
     sra_bytes = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     sra_md5 = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     sra_ftp = models.CharField(null=True, max_length=LENGTH_LONG)
-    sra_aspera = models.CharField(null=True, max_length=LENGTH_LONG)
-    sra_galaxy = models.CharField(null=True, max_length=LENGTH_LONG)
     strain = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     study_accession = models.CharField(null=True, max_length=LENGTH_ACCESSION)
     study_alias = models.CharField(null=True, max_length=LENGTH_MEDIUM)
@@ -162,20 +197,26 @@ class RecordDetails(models.Model):
     submitted_bytes = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     submitted_md5 = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     submitted_ftp = models.CharField(null=True, max_length=LENGTH_LONG)
-    submitted_aspera = models.CharField(null=True, max_length=LENGTH_LONG)
-    submitted_galaxy = models.CharField(null=True, max_length=LENGTH_LONG)
     submitted_format = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     submitted_host_sex = models.CharField(null=True, max_length=LENGTH_ACCESSION)
     submitted_sex = models.CharField(null=True, max_length=LENGTH_ACCESSION)
     target_gene = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     taxonomic_classification = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     taxonomic_identity_marker = models.CharField(null=True, max_length=LENGTH_MEDIUM)
-    tax_id = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    tax_id = models.BigIntegerField(null=True)
     taxonomy = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     temperature = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     tissue_lib = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     tissue_type = models.CharField(null=True, max_length=LENGTH_MEDIUM)
     variety = models.CharField(null=True, max_length=LENGTH_MEDIUM)
+    # ENA fields without a column of their own, e.g. the Aspera and Galaxy mirror links
+    extra = models.JSONField(null=True)
+
+    class Meta:
+        constraints = [
+            # One set of ENA details per record, so re-fetched records can be skipped on insert
+            models.UniqueConstraint(fields=['record'], name='recorddetails_unique_record')
+        ]
 
 
 qualifyr_name_map = {
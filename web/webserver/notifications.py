@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import connection, transaction
+from enum import Enum
+import json
+
+
+class Event(Enum):
+    TAXON_ADDED = 'taxon added'
+    RECORD_CLAIMED = 'record claimed'
+    ASSEMBLY_REPORTED = 'assembly reported'
+
+
+def notify(event: Event, **payload) -> None:
+    """
+    Tell the crawler about a change with a Postgres NOTIFY on settings.NOTIFY_CHANNEL.
+    The notification is sent once the current transaction commits, so the crawler never sees
+    an event before the change it describes.
+    """
+    message = json.dumps({'event': event.value, **payload})
+
+    def send() -> None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [settings.NOTIFY_CHANNEL, message])
+
+    transaction.on_commit(send)
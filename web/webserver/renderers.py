@@ -0,0 +1,31 @@
+from django.http import HttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+import json
+
+# orjson is optional; without it responses are encoded with the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data: any) -> bytes:
+    """
+    Encode data as JSON, with orjson if it is installed.
+    Anything orjson cannot encode, such as integers over 64 bits, falls back to DRF's encoder.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data)
+        except TypeError:
+            pass
+    return json.dumps(data, cls=JSONEncoder).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    JsonResponse encoded by dumps.
+    """
+    def __init__(self, data: any, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super(FastJsonResponse, self).__init__(content=dumps(data), **kwargs)
@@ -1,4 +1,9 @@
+import copy
+from django.db import models
+from django.utils import timezone
+from django.utils.duration import duration_string
 from rest_framework import serializers
+from rest_framework.utils import model_meta
 from .models import Taxons, Records, RecordDetails
 
 import logging
@@ -22,3 +27,133 @@ class RecordDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecordDetails
         fields = '__all__'
+
+
+def datetime_representation(value) -> str:
+    # As rest_framework.fields.DateTimeField with the default ISO 8601 format
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+# Conversions for fields whose values are not already JSON-serializable
+REPRESENTATIONS = {
+    models.DateTimeField: datetime_representation,
+    models.DateField: lambda value: value.isoformat(),
+    models.DurationField: duration_string
+}
+
+
+class FastSerializer:
+    """
+    Read-only equivalent of a ModelSerializer with fields = '__all__', for hot endpoints.
+    Field names, columns and conversions are worked out once, rather than on every call,
+    and rows can be serialized straight from QuerySet.values() dicts without building model instances.
+    Foreign keys are represented by their primary keys under the field name, as ModelSerializer does.
+    """
+    def __init__(self, model):
+        info = model_meta.get_field_info(model)
+        fields = [info.pk, *info.fields.values(), *(r.model_field for r in info.forward_relations.values())]
+        self.model = model
+        # (output name, database column attribute, conversion or None) in ModelSerializer's field order
+        self.fields = [
+            (field.name, field.attname, next(
+                (convert for field_type, convert in REPRESENTATIONS.items() if isinstance(field, field_type)),
+                None
+            ))
+            for field in fields
+        ]
+        self.columns = [attname for _, attname, _ in self.fields]
+
+    def select(self, fields: list = None, exclude: list = ()) -> 'FastSerializer':
+        """
+        A serializer for just the named fields, or all fields if fields is None, less those in exclude.
+        Raises FieldSelectionError for names the model does not have.
+        """
+        names = [name for name, _, _ in self.fields]
+        unknown = (set(fields or ()) | set(exclude)) - set(names)
+        if unknown:
+            raise FieldSelectionError(f"Unknown {self.model.__name__} fields: {', '.join(sorted(unknown))}.")
+        selected = copy.copy(self)
+        selected.fields = [
+            field for field in self.fields if (fields is None or field[0] in fields) and field[0] not in exclude
+        ]
+        selected.columns = [attname for _, attname, _ in selected.fields]
+        return selected
+
+    def values(self, queryset: models.QuerySet, *extra: str) -> models.QuerySet:
+        """
+        queryset as dicts holding just the columns this serializer needs, and any extra columns.
+        """
+        columns = self.columns + [column for column in extra if column not in self.columns]
+        # values() with no columns would fetch them all
+        return queryset.values(*(columns or ['pk']))
+
+    def from_values(self, row: dict) -> dict:
+        return {
+            name: row[attname] if convert is None or row[attname] is None else convert(row[attname])
+            for name, attname, convert in self.fields
+        }
+
+    def from_instance(self, instance: models.Model) -> dict:
+        return self.from_values(instance.__dict__)
+
+
+class FieldSelectionError(ValueError):
+    pass
+
+
+class FieldSelection:
+    """
+    Fields requested with the fields= and exclude= query parameters, each a comma-separated list of names.
+    Fields of a nested object are named after its key, e.g. details.base_count;
+    naming the key alone selects or excludes the whole nested object.
+    Without fields= all fields are included.
+    """
+    def __init__(self, fields: list = None, exclude: list = ()):
+        self.fields = fields
+        self.exclude = list(exclude)
+
+    @classmethod
+    def from_request(cls, request) -> 'FieldSelection':
+        fields = request.GET.get('fields')
+        exclude = request.GET.get('exclude')
+        return cls(
+            fields=None if fields is None else [f for f in fields.split(',') if f],
+            exclude=[] if exclude is None else [f for f in exclude.split(',') if f]
+        )
+
+    def includes(self, key: str) -> bool:
+        """
+        Whether the nested object under key is wanted at all.
+        """
+        if key in self.exclude:
+            return False
+        return self.fields is None or any(f == key or f.startswith(f"{key}.") for f in self.fields)
+
+    def nested(self, key: str) -> 'FieldSelection':
+        """
+        The selection of fields within the nested object under key.
+        """
+        prefix = f"{key}."
+        fields = self.fields
+        if fields is not None:
+            fields = None if key in fields else [f[len(prefix):] for f in fields if f.startswith(prefix)]
+        return FieldSelection(fields, [f[len(prefix):] for f in self.exclude if f.startswith(prefix)])
+
+    def serializer(self, serializer: FastSerializer, nested: tuple = ()) -> FastSerializer:
+        """
+        serializer restricted to the selected top-level fields, ignoring the keys of nested objects.
+        """
+        names = (self.fields or []) + self.exclude
+        unknown = {name.split('.')[0] for name in names if '.' in name} - set(nested)
+        if unknown:
+            raise FieldSelectionError(f"{', '.join(sorted(unknown))} have no nested fields.")
+
+        def own(names: list) -> list:
+            return [name for name in names if '.' not in name and name not in nested]
+        return serializer.select(None if self.fields is None else own(self.fields), own(self.exclude))
+
+
+TAXON_SERIALIZER = FastSerializer(Taxons)
+RECORD_SERIALIZER = FastSerializer(Records)
+RECORD_DETAIL_SERIALIZER = FastSerializer(RecordDetails)
@@ -0,0 +1,72 @@
+"""
+Timings of the fast serializers against the DRF serializers they replace.
+Not collected with the tests; run with `python manage.py test webserver.tests.benchmarks`.
+"""
+import timeit
+from django.http import JsonResponse
+from django.test import TestCase
+from ..models import Taxons, Records, RecordDetails
+from ..renderers import FastJsonResponse
+from ..serializers import (
+    TaxonSerializer, RecordSerializer, RecordDetailSerializer,
+    TAXON_SERIALIZER, RECORD_SERIALIZER, RECORD_DETAIL_SERIALIZER
+)
+from ..views import ViewRecord
+from .factories.factories import TaxonFactory, RecordFactory, RecordDetailsFactory
+
+
+class SerializerBenchmarks(TestCase):
+    n_records = 1000
+    repeat = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        taxon = TaxonFactory.create()
+        for record in RecordFactory.create_batch(cls.n_records, taxon=taxon):
+            RecordDetailsFactory.create(record_id=record.id)
+
+    def report(self, name: str, slow, fast) -> None:
+        slow_time = min(timeit.repeat(slow, number=1, repeat=self.repeat))
+        fast_time = min(timeit.repeat(fast, number=1, repeat=self.repeat))
+        print(f"\n{name}: DRF {slow_time * 1000:.1f}ms, fast {fast_time * 1000:.1f}ms ({slow_time / fast_time:.1f}x)")
+
+    def test_serializers(self):
+        for model, serializer, fast in [
+            (Taxons, TaxonSerializer, TAXON_SERIALIZER),
+            (Records, RecordSerializer, RECORD_SERIALIZER),
+            (RecordDetails, RecordDetailSerializer, RECORD_DETAIL_SERIALIZER)
+        ]:
+            self.report(
+                f"{model.__name__} from the database",
+                lambda: serializer(model.objects.all(), many=True).data,
+                lambda: [fast.from_values(row) for row in fast.values(model.objects.all())]
+            )
+            instances = list(model.objects.all())
+            self.report(
+                f"{model.__name__} from instances",
+                lambda: serializer(instances, many=True).data,
+                lambda: [fast.from_instance(instance) for instance in instances]
+            )
+
+    def test_rendering(self):
+        rows = RECORD_DETAIL_SERIALIZER.values(RecordDetails.objects.all())
+        details = [RECORD_DETAIL_SERIALIZER.from_values(row) for row in rows]
+        self.report(
+            "Rendering RecordDetails",
+            lambda: JsonResponse(details, safe=False),
+            lambda: FastJsonResponse(details)
+        )
+
+    def test_record_endpoint(self):
+        record_id = Records.objects.first().id
+        view = ViewRecord()
+        self.report(
+            "ViewRecord.get x100",
+            lambda: [
+                JsonResponse({
+                    **RecordSerializer(Records.objects.get(id=record_id)).data,
+                    'details': RecordDetailSerializer(RecordDetails.objects.filter(record_id=record_id)[0]).data
+                }) for _ in range(100)
+            ],
+            lambda: [FastJsonResponse(view._record_details(record_id=record_id)) for _ in range(100)]
+        )
@@ -1,9 +1,23 @@
+import datetime
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
-from ..models import Taxons, AssemblyStatus
-from .factories.factories import RecordFactory, RecordDetailsFactory
+from rest_framework.test import APIClient, APITestCase
+from ..models import Taxons, Records, RecordDetails, AssemblyStatus
+from ..serializers import (
+    TaxonSerializer, RecordSerializer, RecordDetailSerializer,
+    TAXON_SERIALIZER, RECORD_SERIALIZER, RECORD_DETAIL_SERIALIZER
+)
+from .. import timeouts
+from ..views import claim_candidates_sql
+from .factories.factories import TaxonFactory, RecordFactory, RecordDetailsFactory
 
 logger = logging.getLogger(__file__)
 logger.setLevel(logging.INFO)
@@ -22,6 +36,55 @@ class TaxonTests(APITestCase):
         self.assertEqual(Taxons.objects.get().id, taxon_id)
         self.assertIn('records', response.json().keys())
 
+    def test_add_taxon_notifies(self):
+        """
+        Ensure adding a taxon tells the crawler, once the change is committed.
+        """
+        url = reverse('taxon', args=(755,))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(self.client.put(url).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_taxon_pre_assembly_filters(self):
+        """
+        Ensure a taxon's pre-assembly filters can be set, and are validated.
+        """
+        taxon_id = 755
+        url = reverse('taxon', args=(taxon_id,))
+        spec = [{'type': 'match', 'field': 'library_layout', 'value': 'PAIRED'}]
+        response = self.client.put(url, {'pre_assembly_filters': spec}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['pre_assembly_filters'], spec)
+
+        # Updating other fields keeps the filters
+        self.assertEqual(self.client.put(url).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Taxons.objects.get(id=taxon_id).pre_assembly_filters, spec)
+
+        for invalid in [
+            {'type': 'match'},
+            [{'type': 'matc', 'field': 'library_layout', 'value': 'PAIRED'}],
+            [{'type': 'match', 'field': 'library_layout'}],
+            [{'type': 'match', 'field': 'no_such_field', 'value': 'PAIRED'}],
+            [{'type': 'not_na', 'field': 'lat IS NULL OR TRUE --'}],
+            [{'type': 'match', 'field': 'base_count', 'value': 'large'}],
+            [{'type': 'match', 'field': 'first_public', 'value': 'last week'}],
+            [{'type': 'match', 'field': 'extra', 'value': 'anything'}],
+            [{'type': 'min_base_count', 'genome_size': '5e6', 'x_depth': 30}]
+        ]:
+            with self.subTest(spec=invalid):
+                response = self.client.put(url, {'pre_assembly_filters': invalid}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(Taxons.objects.get(id=taxon_id).pre_assembly_filters, spec)
+
+        typed = [
+            {'type': 'match', 'field': 'base_count', 'value': [100, 200]},
+            {'type': 'match', 'name': 'published', 'field': 'first_public', 'value': '2022-01-01'},
+            {'type': 'min_base_count', 'genome_size': 5_000_000, 'x_depth': 30},
+            {'type': 'location_or_date'}
+        ]
+        response = self.client.put(url, {'pre_assembly_filters': typed}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
 
 class RecordTests(APITestCase):
     def setUp(self):
@@ -58,6 +121,72 @@ class RecordTests(APITestCase):
         j = response.json()
         self.assertGreaterEqual(len(j['records']), 1)
 
+    def test_taxon_records_pages(self):
+        """
+        Ensure a taxon's records can be paged through, and streamed, in id order.
+        """
+        taxon_id = self.records[0].taxon_id
+        expected = list(Records.objects.filter(taxon_id=taxon_id).order_by('id').values_list('id', flat=True))
+        url = reverse('taxon', args=(taxon_id,))
+        paged = []
+        cursor = None
+        while True:
+            params = {'limit': 1} if cursor is None else {'limit': 1, 'cursor': cursor}
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            j = response.json()
+            paged.extend(r['id'] for r in j['records'])
+            cursor = j['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(paged, expected)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {'stream': 'true'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(lines[0]['id'], taxon_id)
+        self.assertEqual([r['id'] for r in lines[1:]], expected)
+        self.assertEqual(lines[1], self.client.get(url).json()['records'][0])
+
+    def test_field_selection(self):
+        """
+        Ensure fields= and exclude= limit both the response and the columns read.
+        """
+        url = reverse('record', args=(self.record_in_progress.id,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,fastq_ftp,details.base_count'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'id': self.record_in_progress.id,
+            'fastq_ftp': self.record_in_progress.fastq_ftp,
+            'details': {'base_count': RecordDetails.objects.get(record_id=self.record_in_progress.id).base_count}
+        })
+        self.assertFalse(any('"accession"' in query['sql'] for query in queries.captured_queries))
+
+        j = self.client.get(url, {'exclude': 'details,waiting_since'}).json()
+        self.assertNotIn('details', j)
+        self.assertNotIn('waiting_since', j)
+        self.assertIn('fastq_ftp', j)
+        j = self.client.get(url, {'exclude': 'details.description'}).json()
+        self.assertNotIn('description', j['details'])
+        self.assertIn('base_count', j['details'])
+        for params in [{'fields': 'id,nonsense'}, {'exclude': 'details.nonsense'}, {'fields': 'taxon.id'}]:
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+        taxon_url = reverse('taxon', args=(self.record_in_progress.taxon_id,))
+        j = self.client.get(taxon_url, {'fields': 'id,records.fastq_ftp'}).json()
+        self.assertEqual(j['records'], [
+            {'fastq_ftp': fastq_ftp} for fastq_ftp in Records.objects.filter(taxon_id=self.record_in_progress.taxon_id)
+            .order_by('id').values_list('fastq_ftp', flat=True)
+        ])
+        self.assertEqual(set(j.keys()), {'id', 'records', 'next_cursor'})
+        self.assertNotIn('records', self.client.get(taxon_url, {'exclude': 'records'}).json())
+        self.assertCountEqual(
+            self.client.get(reverse('taxons'), {'fields': 'id'}).json(),
+            [{'id': taxon_id} for taxon_id in Taxons.objects.values_list('id', flat=True)]
+        )
+
     def record_view_fails(self):
         # Non-existent URLs should 404
         url = reverse('record', args=("BAD007247",))
@@ -88,6 +217,41 @@ class RecordTests(APITestCase):
         j = response.json()
         self.assertEqual(j['assembly_result'], AssemblyStatus.IN_PROGRESS.value)
 
+    def test_assembly_candidates_batch(self):
+        # A taxon outside the factory's id range, so no randomly made records belong to it
+        taxon_id = 99
+        RecordFactory.create_batch(3, taxon=TaxonFactory.create(id=taxon_id), filtered=True, accepted=False)
+        url = reverse('assembly_request_batch')
+        response = self.client.get(url, {'n': 5, 'taxon_id': taxon_id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        candidates = response.json()['candidates']
+        self.assertEqual(len(candidates), 3)
+        self.assertEqual(len({c['id'] for c in candidates}), len(candidates))
+        for candidate in candidates:
+            self.assertEqual(candidate['taxon'], taxon_id)
+            self.assertEqual(candidate['assembly_result'], AssemblyStatus.UNDER_CONSIDERATION.value)
+
+        self.assertEqual(self.client.get(url, {'n': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        # confirm candidates, alongside ids that cannot be confirmed
+        ids = [c['id'] for c in candidates]
+        response = self.client.post(
+            reverse('assembly_confirm_batch'),
+            {'ids': [*ids, self.record_complete.id, 'BAD007247']},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()['results']
+        for record_id in ids:
+            self.assertEqual(results[record_id], 'confirmed')
+            self.assertEqual(Records.objects.get(id=record_id).assembly_result, AssemblyStatus.IN_PROGRESS.value)
+        self.assertEqual(results[self.record_complete.id], 'not under consideration')
+        self.assertEqual(results['BAD007247'], 'not found')
+
+        # confirming again fails
+        response = self.client.post(reverse('assembly_confirm_batch'), {'ids': ids}, format='json')
+        self.assertEqual(set(response.json()['results'].values()), {'not under consideration'})
+
     def test_report_fails(self):
         # We should not be allowed to update an record not in progress
         url = reverse('record', args=(self.record_complete.id,))
@@ -108,3 +272,240 @@ class RecordTests(APITestCase):
         j = response.json()
         for k in self.assembly_payload.keys():
             self.assertEqual(j[k], self.assembly_payload[k])
+
+    def test_lease_heartbeat(self):
+        """
+        Ensure claims are leased, and assemblers can renew their leases until they report.
+        """
+        candidate = self.client.get(reverse('assembly_request')).json()
+        self.assertIsNotNone(Records.objects.get(id=candidate['id']).lease_expires_at)
+        self.client.get(reverse('assembly_confirm', args=(candidate['id'],)))
+        # Pretend the lease is about to run out
+        expiring = timezone.now() - datetime.timedelta(days=1)
+        Records.objects.filter(id=candidate['id']).update(lease_expires_at=expiring)
+
+        url = reverse('record', args=(candidate['id'],))
+        response = self.client.patch(url, {'progress': 0.5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        record = Records.objects.get(id=candidate['id'])
+        self.assertGreater(record.lease_expires_at, expiring)
+        self.assertEqual(record.assembly_progress, 0.5)
+        self.assertEqual(self.client.patch(url, {'progress': 2}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.put(url, self.assembly_payload, format='json')
+        record = Records.objects.get(id=candidate['id'])
+        self.assertIsNone(record.lease_expires_at)
+        self.assertIsNotNone(record.assembly_duration)
+        self.assertEqual(self.client.patch(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.patch(reverse('record', args=('BAD007247',))).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FastSerializerTests(TestCase):
+    def setUp(self):
+        taxon = TaxonFactory.create(
+            pre_assembly_filters=[{'type': 'match', 'field': 'library_layout', 'value': 'PAIRED'}],
+            ena_watermark=datetime.date(2022, 5, 1),
+            last_updated=timezone.now()
+        )
+        record = RecordFactory.create(taxon=taxon, filtered=True, accepted=True, completed=False, assembled=True)
+        Records.objects.filter(id=record.id).update(
+            assembly_duration=datetime.timedelta(hours=1, microseconds=5),
+            lease_expires_at=timezone.now()
+        )
+        RecordDetailsFactory.create(record_id=record.id, base_count=500_000_000)
+
+    def test_matches_model_serializers(self):
+        """
+        Ensure the fast serializers give exactly what the DRF serializers would, from instances and from values().
+        """
+        for fast, serializer in [
+            (TAXON_SERIALIZER, TaxonSerializer),
+            (RECORD_SERIALIZER, RecordSerializer),
+            (RECORD_DETAIL_SERIALIZER, RecordDetailSerializer)
+        ]:
+            queryset = serializer.Meta.model.objects.all()
+            expected = [dict(data) for data in serializer(queryset, many=True).data]
+            self.assertGreater(len(expected), 0)
+            for result in [
+                [fast.from_values(row) for row in fast.values(queryset)],
+                [fast.from_instance(instance) for instance in queryset]
+            ]:
+                self.assertEqual(result, expected)
+                self.assertEqual([list(r.keys()) for r in result], [list(r.keys()) for r in expected])
+
+
+class AssemblyTimeoutTests(APITestCase):
+    def setUp(self):
+        # Ten reported assemblies of records with around 5e8 bases, taking an hour each
+        for record in RecordFactory.create_batch(10, filtered=True, accepted=True, completed=False, assembled=True):
+            RecordDetailsFactory.create(record_id=record.id, base_count=500_000_000)
+            record.assembly_duration = datetime.timedelta(hours=1)
+            record.save()
+        self.small, self.large = [
+            RecordFactory.create(filtered=True, accepted=False, completed=False, assembled=False)
+            for _ in range(2)
+        ]
+        Records.objects.filter(id__in=[self.small.id, self.large.id]).update(
+            assembly_result=AssemblyStatus.UNDER_CONSIDERATION.value
+        )
+        RecordDetailsFactory.create(record_id=self.small.id, base_count=520_000_000)
+        RecordDetailsFactory.create(record_id=self.large.id, base_count=50_000_000_000)
+        timeouts.bucket_timeouts(refresh=True)
+
+    def test_timeouts_follow_observed_durations(self):
+        """
+        Ensure records are leased according to how long similar records took to assemble.
+        """
+        self.assertEqual(
+            timeouts.assembly_timeouts([self.small.id, self.large.id]),
+            {self.small.id: datetime.timedelta(hours=2), self.large.id: settings.ASSEMBLY_PERIOD}
+        )
+
+        self.client.post(reverse('assembly_confirm_batch'), {'ids': [self.small.id, self.large.id]}, format='json')
+        leases = self.leases()
+        self.assertEqual(leases[self.small.id], datetime.timedelta(hours=2))
+        self.assertEqual(leases[self.large.id], settings.ASSEMBLY_PERIOD)
+
+    def test_heartbeats_follow_progress(self):
+        """
+        Ensure heartbeats extend leases by the part of the timeout not yet used up, down to ASSEMBLY_TIMEOUT_MIN.
+        """
+        self.client.post(reverse('assembly_confirm_batch'), {'ids': [self.small.id]}, format='json')
+        url = reverse('record', args=(self.small.id,))
+        self.client.patch(url, {'progress': 0.25}, format='json')
+        self.assertEqual(self.leases()[self.small.id], datetime.timedelta(hours=1, minutes=30))
+        # Heartbeats without progress keep to the last progress reported
+        self.client.patch(url)
+        self.assertEqual(self.leases()[self.small.id], datetime.timedelta(hours=1, minutes=30))
+        self.client.patch(url, {'progress': 0.9}, format='json')
+        self.assertEqual(self.leases()[self.small.id], settings.ASSEMBLY_TIMEOUT_MIN)
+
+    def leases(self) -> dict:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, lease_expires_at - NOW() FROM {Records._meta.db_table} WHERE id = ANY(%s)",
+                [[self.small.id, self.large.id]]
+            )
+            return dict(cursor.fetchall())
+
+
+class CandidateConcurrencyTests(TransactionTestCase):
+    n_candidates = 40
+    n_claimers = 8
+
+    def setUp(self):
+        RecordFactory.create_batch(
+            self.n_candidates,
+            filtered=True,
+            accepted=False,
+            completed=False,
+            assembled=False
+        )
+
+    def claim_all(self) -> list:
+        """
+        Request candidates until none are left, returning the ids received.
+        """
+        client = APIClient()
+        claimed = []
+        try:
+            while True:
+                response = client.get(reverse('assembly_request'))
+                if response.status_code == status.HTTP_204_NO_CONTENT:
+                    return claimed
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                claimed.append(response.json()['id'])
+        finally:
+            connection.close()
+
+    def test_concurrent_claims_are_unique(self):
+        """
+        Ensure parallel assemblers never receive the same candidate.
+        """
+        with ThreadPoolExecutor(max_workers=self.n_claimers) as executor:
+            results = list(executor.map(lambda _: self.claim_all(), range(self.n_claimers)))
+        claimed = [record_id for result in results for record_id in result]
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertEqual(len(claimed), self.n_candidates)
+
+
+class WorkQueueIndexTests(TestCase):
+    """
+    Check the assembly work queue queries use indexes rather than scanning every record.
+    """
+    n_records = 1_000_000
+
+    @classmethod
+    def setUpTestData(cls):
+        TaxonFactory.create(id=1)
+        TaxonFactory.create(id=2)
+        with connection.cursor() as cursor:
+            # 20% candidates, 1% each under consideration and in progress, the rest failed or assembled
+            cursor.execute(
+                f"INSERT INTO {Records._meta.db_table} "
+                f"(id, taxon_id, time_fetched, passed_filter, waiting_since, assembly_result, lease_expires_at) "
+                f"SELECT 'ERR' || i, 1 + i %% 2, NOW(), i %% 10 < 2 OR i %% 100 < 2, NOW() - i * INTERVAL '1 second', "
+                f"CASE i %% 100 WHEN 0 THEN %s WHEN 1 THEN %s WHEN 2 THEN %s END, "
+                f"CASE WHEN i %% 100 < 2 THEN NOW() + (i - %s / 2) * INTERVAL '1 second' END "
+                f"FROM generate_series(1, %s) AS i",
+                [
+                    AssemblyStatus.UNDER_CONSIDERATION.value,
+                    AssemblyStatus.IN_PROGRESS.value,
+                    AssemblyStatus.SUCCESS.value,
+                    cls.n_records,
+                    cls.n_records
+                ]
+            )
+            cursor.execute(f"ANALYZE {Records._meta.db_table}")
+
+    def plan_nodes(self, sql: str, params: list) -> list:
+        """
+        All nodes of the query plan for sql.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = []
+        pending = [plan[0]['Plan']]
+        while pending:
+            node = pending.pop()
+            nodes.append(node)
+            pending.extend(node.get('Plans', []))
+        return nodes
+
+    def assertUsesIndex(self, sql: str, params: list, indexes: list):
+        nodes = self.plan_nodes(sql, params)
+        self.assertFalse(
+            any(n['Node Type'] == 'Seq Scan' and n.get('Relation Name') == Records._meta.db_table for n in nodes),
+            f"Sequential scan of records in {nodes}"
+        )
+        self.assertTrue(any(n.get('Index Name') in indexes for n in nodes), f"None of {indexes} used in {nodes}")
+
+    def test_claim_uses_index(self):
+        self.assertUsesIndex(*claim_candidates_sql(n=1), indexes=['records_candidates_idx'])
+        self.assertUsesIndex(*claim_candidates_sql(n=100), indexes=['records_candidates_idx'])
+
+    def test_taxon_claim_uses_index(self):
+        self.assertUsesIndex(
+            *claim_candidates_sql(n=10, taxon_id=1),
+            indexes=['records_taxon_candidates_idx', 'records_candidates_idx']
+        )
+
+    def test_release_uses_index(self):
+        # As in release_records and next_release in app/taxon_tracker.py
+        self.assertUsesIndex(
+            f"UPDATE {Records._meta.db_table} SET assembly_result = NULL, waiting_since = NOW(), lease_expires_at = NULL "
+            f"WHERE id IN ("
+            f"  SELECT id FROM {Records._meta.db_table} "
+            f"  WHERE lease_expires_at < NOW() ORDER BY lease_expires_at LIMIT %s FOR UPDATE SKIP LOCKED"
+            f")",
+            [1000],
+            indexes=['records_lease_expiry_idx']
+        )
+        self.assertUsesIndex(
+            f"SELECT MIN(lease_expires_at) FROM {Records._meta.db_table} WHERE lease_expires_at > NOW()",
+            [],
+            indexes=['records_lease_expiry_idx']
+        )
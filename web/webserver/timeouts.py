@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.db import connection, transaction
+import threading
+import time
+from .models import Records, RecordDetails, AssemblyStatus
+
+# Records are grouped by base_count into buckets this many to a factor of ten
+BUCKETS_PER_DECADE = 4
+# How long observed assembly durations are cached before being read again
+REFRESH_SECONDS = 600
+
+_TIMEOUTS = None
+_TIMEOUTS_AT = 0
+_TIMEOUTS_LOCK = threading.Lock()
+
+
+def bucket_sql(base_count: str) -> str:
+    """
+    SQL for the bucket of the base_count column, or NULL if it has none.
+    Buckets are only ever computed here, so durations and records are grouped the same way.
+    """
+    return f"CASE WHEN {base_count} > 0 THEN FLOOR({BUCKETS_PER_DECADE} * LOG({base_count})) END"
+
+
+def bucket_timeouts(refresh: bool = False) -> dict:
+    """
+    Timeouts by base_count bucket: the ASSEMBLY_TIMEOUT_QUANTILE of reported assembly durations
+    times ASSEMBLY_TIMEOUT_FACTOR, for buckets with at least ASSEMBLY_TIMEOUT_MIN_SAMPLES reports.
+    Results are cached for REFRESH_SECONDS.
+    """
+    global _TIMEOUTS, _TIMEOUTS_AT
+    with _TIMEOUTS_LOCK:
+        if refresh or _TIMEOUTS is None or time.monotonic() - _TIMEOUTS_AT > REFRESH_SECONDS:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT {bucket_sql('d.base_count')}, "
+                    f"  PERCENTILE_CONT(%s) WITHIN GROUP (ORDER BY r.assembly_duration) "
+                    f"FROM {Records._meta.db_table} r CROSS JOIN LATERAL ("
+                    f"  SELECT base_count FROM {RecordDetails._meta.db_table} "
+                    f"  WHERE record_id = r.id ORDER BY time_fetched DESC LIMIT 1"
+                    f") d "
+                    f"WHERE r.assembly_duration IS NOT NULL AND d.base_count > 0 "
+                    f"GROUP BY 1 HAVING COUNT(*) >= %s",
+                    [settings.ASSEMBLY_TIMEOUT_QUANTILE, settings.ASSEMBLY_TIMEOUT_MIN_SAMPLES]
+                )
+                _TIMEOUTS = {
+                    int(bucket): duration * settings.ASSEMBLY_TIMEOUT_FACTOR for bucket, duration in cursor.fetchall()
+                }
+            _TIMEOUTS_AT = time.monotonic()
+        return _TIMEOUTS
+
+
+def record_buckets(record_ids: list) -> dict:
+    """
+    The bucket of the latest base_count fetched for each record, or None if it has none.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT ON (record_id) record_id, {bucket_sql('base_count')} "
+            f"FROM {RecordDetails._meta.db_table} WHERE record_id = ANY(%s) "
+            f"ORDER BY record_id, time_fetched DESC",
+            [list(record_ids)]
+        )
+        return {record_id: None if bucket is None else int(bucket) for record_id, bucket in cursor.fetchall()}
+
+
+def assembly_timeouts(record_ids: list) -> dict:
+    """
+    How long each record may take to assemble, between ASSEMBLY_TIMEOUT_MIN and ASSEMBLY_PERIOD.
+    Records in buckets without enough reported assemblies get the full ASSEMBLY_PERIOD.
+    """
+    buckets = record_buckets(record_ids)
+    timeouts = bucket_timeouts()
+    result = {}
+    for record_id in record_ids:
+        timeout = timeouts.get(buckets.get(record_id))
+        if timeout is None:
+            result[record_id] = settings.ASSEMBLY_PERIOD
+        else:
+            result[record_id] = min(max(timeout, settings.ASSEMBLY_TIMEOUT_MIN), settings.ASSEMBLY_PERIOD)
+    return result
+
+
+def renew_assembly_leases(record_ids: list, progress: float = None) -> dict:
+    """
+    Extend the leases of records in progress by the part of their assembly timeouts not yet used up,
+    according to their latest reported progress, and no less than ASSEMBLY_TIMEOUT_MIN.
+    A record halfway through gets half its timeout, so a stalled assembly is released sooner near its end.
+    progress, if given, is recorded first.
+    Returns a dict of record id to new lease expiry for the records renewed.
+    """
+    by_timeout = {}
+    for record_id, timeout in assembly_timeouts(record_ids).items():
+        by_timeout.setdefault(timeout, []).append(record_id)
+    renewed = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for timeout, ids in by_timeout.items():
+            cursor.execute(
+                f"UPDATE {Records._meta.db_table} "
+                f"SET assembly_progress = COALESCE(%(progress)s, assembly_progress), "
+                f"  lease_expires_at = NOW() + GREATEST("
+                f"    %(min)s, %(timeout)s * (1 - COALESCE(%(progress)s, assembly_progress, 0))"
+                f"  ) "
+                f"WHERE id = ANY(%(ids)s) AND assembly_result = %(status)s RETURNING id, lease_expires_at",
+                {
+                    'progress': progress,
+                    'min': min(settings.ASSEMBLY_TIMEOUT_MIN, timeout),
+                    'timeout': timeout,
+                    'ids': ids,
+                    'status': AssemblyStatus.IN_PROGRESS.value
+                }
+            )
+            renewed.update(cursor.fetchall())
+    return renewed
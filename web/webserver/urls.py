@@ -28,5 +28,15 @@ urlpatterns = [
         views.AcceptAssemblyCandidate.as_view(),
         name='assembly_confirm'
     ),
+    path(
+        'api/request_assembly_candidates/',
+        views.RequestAssemblyCandidates.as_view(),
+        name='assembly_request_batch'
+    ),
+    path(
+        'api/confirm_assembly_candidates/',
+        views.AcceptAssemblyCandidates.as_view(),
+        name='assembly_confirm_batch'
+    ),
     path('api/qualifyr_report_fields/', views.QualifyrReportFields.as_view(), name='qualifyr_report_fields')
 ]
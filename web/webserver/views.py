@@ -1,14 +1,21 @@
 from django.utils.datastructures import MultiValueDictKeyError
-from django.http import HttpRequest, HttpResponse, JsonResponse, Http404
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse, Http404
 from django.urls import reverse
+from django.conf import settings
 from django.shortcuts import render, redirect
+from django.db import connection, transaction
 from django.utils import timezone
 from django_db_logger.models import StatusLog
 import rest_framework.views
 import json
 import logging
 from .models import Taxons, Records, RecordDetails, AssemblyStatus, QualifyrReport, name_map, qualifyr_name_map
-from .serializers import TaxonSerializer, RecordSerializer, RecordDetailSerializer
+from .serializers import (
+    TAXON_SERIALIZER, RECORD_SERIALIZER, RECORD_DETAIL_SERIALIZER, FastSerializer, FieldSelection, FieldSelectionError
+)
+from .renderers import FastJsonResponse, dumps
+from .notifications import Event, notify
+from .timeouts import renew_assembly_leases
 
 logger = logging.getLogger(__file__)
 
@@ -47,7 +54,8 @@ def index(request: HttpRequest) -> HttpResponse:
 
 def add_taxon_id(taxon_id: int) -> None:
     try:
-        Taxons.objects.update_or_create(taxon_id=int(taxon_id))
+        Taxons.objects.get_or_create(id=int(taxon_id))
+        notify(Event.TAXON_ADDED, taxon_id=int(taxon_id))
         logger.info(f"Added taxon id {taxon_id}")
     except ValueError:
         logger.warning(f"Invalid taxon id '{taxon_id}' NOT ADDED.")
@@ -61,15 +69,50 @@ def post(request: HttpRequest) -> HttpResponse:
     return redirect(reverse("index"))
 
 
+def check_filter_spec(spec: any) -> None:
+    """
+    Check a pre-assembly filter specification will compile in the crawler.
+    The rules are the database function webserver_filter_spec_error (see migration 0005),
+    which the crawler checks specifications with too. Raises ValidationError describing the first problem.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT webserver_filter_spec_error(%s::jsonb)", [json.dumps(spec)])
+        error = cursor.fetchone()[0]
+    if error is not None:
+        raise ValidationError(error)
+
+
 class ListTaxons(rest_framework.views.APIView):
 
-    def get(self, request: HttpRequest) -> JsonResponse:
+    def get(self, request: HttpRequest) -> [FastJsonResponse, JsonResponse]:
         """
         View all tracked taxons.
+
+        **fields**: Comma-separated fields to include (default all)
+
+        **exclude**: Comma-separated fields to leave out
         """
-        taxons = Taxons.objects.all()
-        serializer = TaxonSerializer(taxons, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        try:
+            serializer = FieldSelection.from_request(request).serializer(TAXON_SERIALIZER)
+        except FieldSelectionError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return FastJsonResponse([serializer.from_values(taxon) for taxon in serializer.values(Taxons.objects.all())])
+
+
+# Records per page of a taxon's records, by default and at most
+RECORDS_PAGE_SIZE = 1000
+MAX_RECORDS_PAGE_SIZE = 10000
+# Records fetched from the database at a time when streaming
+RECORDS_CHUNK_SIZE = 2000
+
+
+def stream_taxon(taxon: dict, records: iter, serializer: FastSerializer) -> iter:
+    """
+    A taxon followed by its records, as newline-delimited JSON.
+    """
+    yield dumps(taxon) + b"\n"
+    for record in records:
+        yield dumps(serializer.from_values(record)) + b"\n"
 
 
 class ViewTaxon(rest_framework.views.APIView):
@@ -78,16 +121,25 @@ class ViewTaxon(rest_framework.views.APIView):
         Add a new id for tracking.
 
         **id**: Taxonomic identifier (will include subtree)
+
+        **pre_assembly_filters**: List of filters records must pass to be offered for assembly,
+        e.g. [{"type": "match", "field": "library_layout", "value": "PAIRED"}].
+        Omit to keep the current filters; null uses the default filters.
         """
         try:
+            taxon_fields = {}
             if "filters" in request.data.keys() and 'filters' in request.data['filters'].keys():
-                filters = {"filters": request.data['filters']}
-            else:
-                filters = None
-            Taxons.objects.update_or_create(
-                id=int(taxon_id),
-                post_assembly_filters=filters
-            )
+                taxon_fields['post_assembly_filters'] = {"filters": request.data['filters']}
+            if 'pre_assembly_filters' in request.data.keys():
+                pre_assembly_filters = request.data['pre_assembly_filters']
+                if pre_assembly_filters is not None:
+                    try:
+                        check_filter_spec(pre_assembly_filters)
+                    except ValidationError as e:
+                        return JsonResponse({'error': str(e)}, status=400)
+                taxon_fields['pre_assembly_filters'] = pre_assembly_filters
+            Taxons.objects.update_or_create(id=int(taxon_id), defaults=taxon_fields)
+            notify(Event.TAXON_ADDED, taxon_id=int(taxon_id))
             logger.info(f"Added taxon id {taxon_id} via API call")
         except (ValueError, MultiValueDictKeyError) as e:
             logger.warning(f"Invalid taxon id '{taxon_id}' NOT ADDED.")
@@ -96,31 +148,86 @@ class ViewTaxon(rest_framework.views.APIView):
 
     def get(self, request: HttpRequest, taxon_id: str, status: int = 200, **kwargs):
         """
-        View details of a id.
+        View details of a id, with a page of its records in id order.
+        To get the next page, pass the next_cursor from the response as the cursor.
 
         **id**: Taxonomic identifier (will include subtree)
+
+        **cursor**: Only include records with ids after this one
+
+        **limit**: Number of records per page (default 1000, at most 10000)
+
+        **stream**: If 'true', return the taxon and all of its records after the cursor as
+        newline-delimited JSON, one object per line, instead of a page
+
+        **fields**: Comma-separated fields to include (default all);
+        records' fields are named records.<field>, and 'records' alone includes all of them
+
+        **exclude**: Comma-separated fields to leave out, named as for fields
         """
-        taxon = Taxons.objects.get(id=taxon_id)
-        records = Records.objects.filter(taxon_id=taxon_id)
-        taxon_serialized = TaxonSerializer(taxon)
-        records_serialized = RecordSerializer(records, many=True)
-        return JsonResponse({
-            **taxon_serialized.data,
-            'records': records_serialized.data
+        try:
+            selection = FieldSelection.from_request(request)
+            taxon_serializer = selection.serializer(TAXON_SERIALIZER, nested=('records',))
+            record_serializer = selection.nested('records').serializer(RECORD_SERIALIZER)
+        except FieldSelectionError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        taxon = taxon_serializer.from_values(taxon_serializer.values(Taxons.objects.filter(id=taxon_id)).get())
+        # Record ids are always fetched for the cursor
+        records = record_serializer.values(Records.objects.filter(taxon_id=taxon_id).order_by('id'), 'id')
+        cursor = request.GET.get('cursor')
+        if cursor is not None:
+            records = records.filter(id__gt=cursor)
+
+        if request.GET.get('stream') == 'true':
+            return StreamingHttpResponse(
+                stream_taxon(
+                    taxon,
+                    records.iterator(chunk_size=RECORDS_CHUNK_SIZE) if selection.includes('records') else [],
+                    record_serializer
+                ),
+                content_type='application/x-ndjson',
+                status=status
+            )
+        if not selection.includes('records'):
+            return FastJsonResponse(taxon, status=status)
+
+        try:
+            limit = int(request.GET.get('limit', RECORDS_PAGE_SIZE))
+            if not 0 < limit <= MAX_RECORDS_PAGE_SIZE:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({
+                'error': f"limit must be a whole number from 1 to {MAX_RECORDS_PAGE_SIZE}."
+            }, status=400)
+        # Fetch one extra record to tell whether there is another page
+        page = list(records[:limit + 1])
+        return FastJsonResponse({
+            **taxon,
+            'records': [record_serializer.from_values(record) for record in page[:limit]],
+            'next_cursor': page[limit - 1]['id'] if len(page) > limit else None
         }, status=status)
 
 
 class ViewRecord(rest_framework.views.APIView):
 
-    def _record_details(self, record_id: str) -> object:
+    def _record_details(self, record_id: str, selection: FieldSelection = None) -> object:
+        """
+        A record with its details, limited to the selected fields.
+        Only the selected columns are read from the database, and details are not read at all if not selected.
+        """
+        selection = selection or FieldSelection()
+        record_serializer = selection.serializer(RECORD_SERIALIZER, nested=('details',))
+        detail_serializer = selection.nested('details').serializer(RECORD_DETAIL_SERIALIZER)
         try:
-            accession = Records.objects.get(id=record_id)
-            details = RecordDetails.objects.filter(record_id=record_id)
-        except (Records.DoesNotExist, RecordDetails.DoesNotExist):
+            record = record_serializer.values(Records.objects.filter(id=record_id)).get()
+        except Records.DoesNotExist:
             raise Http404
+        if not selection.includes('details'):
+            return record_serializer.from_values(record)
+        details = detail_serializer.values(RecordDetails.objects.filter(record_id=record_id)).first()
         return {
-            **RecordSerializer(accession).data,
-            'details': RecordDetailSerializer(details[0]).data
+            **record_serializer.from_values(record),
+            'details': None if details is None else detail_serializer.from_values(details)
         }
 
     def get(self, request: HttpRequest, record_id: str, **kwargs):
@@ -128,8 +235,17 @@ class ViewRecord(rest_framework.views.APIView):
         View metadata for an ENA record.
 
         **id**: Record identifier
+
+        **fields**: Comma-separated fields to include (default all);
+        details' fields are named details.<field>, and 'details' alone includes all of them,
+        e.g. fields=id,fastq_ftp,details.base_count
+
+        **exclude**: Comma-separated fields to leave out, named as for fields
         """
-        return JsonResponse(self._record_details(record_id=record_id))
+        try:
+            return FastJsonResponse(self._record_details(record_id, FieldSelection.from_request(request)))
+        except FieldSelectionError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
     def put(self, request: HttpRequest, record_id: str, **kwargs):
         """
@@ -155,11 +271,15 @@ class ViewRecord(rest_framework.views.APIView):
             return JsonResponse({'error': errors}, status=400)
 
         record.assembly_result = data['assembly_result']
+        record.lease_expires_at = None
+        # waiting_since was set when the record was confirmed
+        record.assembly_duration = timezone.now() - record.waiting_since
         if 'assembled_genome_url' in data.keys():
             record.assembled_genome_url = data['assembled_genome_url']
         if 'assembly_error_report_url' in data.keys():
             record.assembly_error_report_url = data['assembly_error_report_url']
         record.save()
+        notify(Event.ASSEMBLY_REPORTED, record_id=record.id, taxon_id=record.taxon_id)
 
         # Map the qualifyr_report to a database entry if it exists
         if 'qualifyr_report' in data.keys() and data['qualifyr_report']:
@@ -172,6 +292,135 @@ class ViewRecord(rest_framework.views.APIView):
 
         return HttpResponse(status=204)
 
+    def patch(self, request: HttpRequest, record_id: str, **kwargs):
+        """
+        Heartbeat from an assembler working on a record, optionally reporting its progress.
+        Assemblers should call this periodically while an assembly runs; each call extends
+        the record's lease by the rest of the time records of its size usually take to assemble,
+        going by the progress reported, so the record is released soon after its assembler stops responding.
+
+        **id**: Record identifier
+        **progress**: Fraction of the assembly completed, from 0 to 1 (optional)
+        """
+        progress = request.data.get('progress')
+        try:
+            if progress is not None:
+                progress = float(progress)
+                if not 0 <= progress <= 1:
+                    raise ValueError
+        except (TypeError, ValueError):
+            return JsonResponse({'error': ['Field progress must be a number from 0 to 1.']}, status=400)
+
+        renewed = renew_assembly_leases([record_id], progress=progress)
+        if record_id not in renewed:
+            if not Records.objects.filter(id=record_id).exists():
+                raise Http404
+            return JsonResponse({'error': [f'Record {record_id} is not marked for assembly.']}, status=400)
+        return JsonResponse({'lease_expires_at': renewed[record_id]})
+
+
+# Largest number of candidates that can be claimed in one request
+MAX_CANDIDATES = 100
+
+# Per-record results of confirming candidates
+CONFIRMED = 'confirmed'
+NOT_UNDER_CONSIDERATION = 'not under consideration'
+NOT_FOUND = 'not found'
+
+
+def claim_candidates_sql(n: int = 1, taxon_id: int = None) -> tuple:
+    """
+    SQL and parameters for claim_candidates.
+    The candidate search matches the records_candidates_idx and records_taxon_candidates_idx partial indexes.
+    """
+    params = [AssemblyStatus.UNDER_CONSIDERATION.value, settings.CONSIDERATION_PERIOD]
+    taxon_condition = ""
+    if taxon_id is not None:
+        taxon_condition = "AND taxon_id = %s "
+        params.append(taxon_id)
+    params.append(n)
+    return (
+        f"UPDATE {Records._meta.db_table} "
+        f"SET assembly_result = %s, waiting_since = NOW(), lease_expires_at = NOW() + %s "
+        f"WHERE id IN ("
+        f"  SELECT id FROM {Records._meta.db_table} "
+        f"  WHERE waiting_since IS NOT NULL AND passed_filter AND assembly_result IS NULL {taxon_condition}"
+        f"  ORDER BY waiting_since LIMIT %s FOR UPDATE SKIP LOCKED"
+        f") RETURNING *",
+        params
+    )
+
+
+def claim_candidates(n: int = 1, taxon_id: int = None) -> list:
+    """
+    Mark up to n of the longest-waiting assembly candidates as under consideration and return them.
+    If taxon_id is given, only candidates for that taxon are claimed.
+    Records are chosen and claimed in a single statement; rows locked by a concurrent claim are skipped,
+    so simultaneous requests never receive the same record and never wait on each other.
+    """
+    return list(Records.objects.raw(*claim_candidates_sql(n=n, taxon_id=taxon_id)))
+
+
+def confirm_candidates(record_ids: list) -> dict:
+    """
+    Mark records under consideration as in progress with a single UPDATE,
+    leasing them to the requester for their assembly timeouts.
+    Returns a dict of record id to CONFIRMED, NOT_UNDER_CONSIDERATION, or NOT_FOUND.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {Records._meta.db_table} "
+                f"SET assembly_result = %s, waiting_since = NOW(), assembly_progress = NULL "
+                f"WHERE id = ANY(%s) AND assembly_result = %s RETURNING id",
+                [AssemblyStatus.IN_PROGRESS.value, list(record_ids), AssemblyStatus.UNDER_CONSIDERATION.value]
+            )
+            confirmed = {row[0] for row in cursor.fetchall()}
+        renew_assembly_leases(list(confirmed))
+    unconfirmed = set(Records.objects.filter(id__in=set(record_ids) - confirmed).values_list('id', flat=True))
+    return {
+        record_id: CONFIRMED if record_id in confirmed else
+        NOT_UNDER_CONSIDERATION if record_id in unconfirmed else
+        NOT_FOUND
+        for record_id in record_ids
+    }
+
+
+def candidate_details(candidate: Records, filters: dict) -> dict:
+    """
+    Serialize a claimed candidate along with the links needed to confirm it and upload the results.
+    """
+    return {
+        **RECORD_SERIALIZER.from_instance(candidate),
+        'post_assembly_filters': filters,
+        'accept_url': reverse('assembly_confirm', args=(candidate.id,)),
+        'upload_url': reverse('record', args=(candidate.id,))
+    }
+
+
+def upload_fields() -> dict:
+    return {
+        'assembly_result': {
+            'description': f"'{AssemblyStatus.FAIL.value}' or '{AssemblyStatus.SUCCESS.value}'.",
+            'required': True
+        },
+        'assembled_genome_url': {
+            'description': "URL of the assembled genomic data, if applicable.",
+            'required': False
+        },
+        'assembly_error_report_url': {
+            'description': "URL of the nextflow pipeline error log for failed runs.",
+            'required': False
+        },
+        'qualifyr_report': {
+            'description': (
+                "JSON representation of the assembly qualifyr_report.tsv file. "
+                f"For a full list of compatible fields, GET {reverse('qualifyr_report_fields')}."
+            ),
+            'required': False
+        }
+    }
+
 
 class RequestAssemblyCandidate(rest_framework.views.APIView):
     def get(self, request: HttpRequest, **kwargs) -> [JsonResponse, HttpResponse]:
@@ -187,48 +436,16 @@ class RequestAssemblyCandidate(rest_framework.views.APIView):
         Checking out a record in this way obliges you to attempt to assemble the genome and
         report the result using this API.
         """
-        candidates = Records.objects.filter(
-            waiting_since__isnull=False,
-            passed_filter=True,
-            assembly_result__isnull=True
-        )
+        candidates = claim_candidates()
         if len(candidates) > 0:
-            candidate = candidates.order_by('waiting_since')[0]
-            candidate.assembly_result = AssemblyStatus.UNDER_CONSIDERATION.value
-            candidate.waiting_since = timezone.now()
-            candidate.save()
-            serializer = RecordSerializer(candidate)
-            try:
-                filters = Taxons.objects.get(taxon_id=candidate.taxon_id_id).post_assembly_filters
-            except BaseException:
-                filters = None
-
-            return JsonResponse({
-                **serializer.data,
-                'post_assembly_filters': filters,
-                'accept_url': reverse('assembly_confirm', args=(candidate.id,)),
-                'upload_url': reverse('record', args=(candidate.id,)),
-                'upload_fields': {
-                    'assembly_result': {
-                        'description': f"'{AssemblyStatus.FAIL.value}' or '{AssemblyStatus.SUCCESS.value}'.",
-                        'required': True
-                    },
-                    'assembled_genome_url': {
-                        'description': "URL of the assembled genomic data, if applicable.",
-                        'required': False
-                    },
-                    'assembly_error_report_url': {
-                        'description': "URL of the nextflow pipeline error log for failed runs.",
-                        'required': False
-                    },
-                    'qualifyr_report': {
-                        'description': (
-                            "JSON representation of the assembly qualifyr_report.tsv file. "
-                            f"For a full list of compatible fields, GET {reverse('qualifyr_report_fields')}."
-                        ),
-                        'required': False
-                    }
-                },
+            candidate = candidates[0]
+            notify(Event.RECORD_CLAIMED, record_id=candidate.id)
+            filters = Taxons.objects.filter(id=candidate.taxon_id)\
+                .values_list('post_assembly_filters', flat=True).first()
+
+            return FastJsonResponse({
+                **candidate_details(candidate, filters),
+                'upload_fields': upload_fields(),
                 'note': (
                     "This record number is temporarily held for you. "
                     "If you do not send a GET request to the accept_url "
@@ -246,6 +463,48 @@ class RequestAssemblyCandidate(rest_framework.views.APIView):
             return HttpResponse(status=204)
 
 
+class RequestAssemblyCandidates(rest_framework.views.APIView):
+    def get(self, request: HttpRequest, **kwargs) -> [JsonResponse, HttpResponse]:
+        """
+        NON-RESTFUL - Claim several records for assembly at once.
+        Works as request_assembly_candidate, for up to n records.
+
+        **n**: Number of records to claim (default 1, at most 100)
+
+        **taxon_id**: Only claim records for this taxonomic identifier
+        """
+        try:
+            n = int(request.query_params.get('n', 1))
+            taxon_id = request.query_params.get('taxon_id')
+            taxon_id = int(taxon_id) if taxon_id is not None else None
+        except ValueError:
+            return JsonResponse({'error': 'n and taxon_id must be integers.'}, status=400)
+        if not 1 <= n <= MAX_CANDIDATES:
+            return JsonResponse({'error': f"n must be between 1 and {MAX_CANDIDATES}."}, status=400)
+
+        candidates = claim_candidates(n=n, taxon_id=taxon_id)
+        if len(candidates) == 0:
+            return HttpResponse(status=204)
+        notify(Event.RECORD_CLAIMED, n_records=len(candidates))
+        filters = dict(
+            Taxons.objects.filter(id__in={c.taxon_id for c in candidates}).values_list('id', 'post_assembly_filters')
+        )
+        return FastJsonResponse({
+            'candidates': [candidate_details(c, filters.get(c.taxon_id)) for c in candidates],
+            'accept_url': reverse('assembly_confirm_batch'),
+            'upload_fields': upload_fields(),
+            'note': (
+                "These record numbers are temporarily held for you. "
+                "Send the ids you decide to assemble to the accept_url within 10 minutes "
+                "as a JSON POST request of the form {\"ids\": [...]}; "
+                "records not confirmed by then are made available to others.\n"
+                "Confirming a record means you also promise to upload your "
+                "results to the API by sending the data via PUT request to its upload_url. "
+                "The PUT request payload should be JSON; see upload_fields for the fields."
+            )
+        })
+
+
 class AcceptAssemblyCandidate(rest_framework.views.APIView):
     def get(self, request: HttpRequest, record_id: str, **kwargs) -> [JsonResponse, HttpResponse]:
         """
@@ -253,15 +512,30 @@ class AcceptAssemblyCandidate(rest_framework.views.APIView):
 
         **id**: Record identifier
         """
-        accession = Records.objects.get(id=record_id)
-        if accession.assembly_result == AssemblyStatus.UNDER_CONSIDERATION.value:
-            accession.assembly_result = AssemblyStatus.IN_PROGRESS.value
-            accession.waiting_since = timezone.now()
-            accession.save()
+        if confirm_candidates([record_id])[record_id] == CONFIRMED:
+            notify(Event.RECORD_CLAIMED, record_id=record_id)
             return HttpResponse(status=204)
         return JsonResponse({'error': 'Invalid confirm candidate.'}, status=400)
 
 
+class AcceptAssemblyCandidates(rest_framework.views.APIView):
+    def post(self, request: HttpRequest, **kwargs) -> JsonResponse:
+        """
+        Confirm assembly will proceed on several ids at once.
+        The JSON payload should hold a list of record identifiers as {"ids": [...]}.
+        The response gives the result for each id:
+        'confirmed', 'not under consideration', or 'not found'.
+        """
+        record_ids = request.data.get('ids') if hasattr(request.data, 'get') else None
+        if not isinstance(record_ids, list) or not all(isinstance(i, str) for i in record_ids):
+            return JsonResponse({'error': 'ids must be a list of record identifiers.'}, status=400)
+        results = confirm_candidates(record_ids)
+        n_confirmed = sum(1 for r in results.values() if r == CONFIRMED)
+        if n_confirmed > 0:
+            notify(Event.RECORD_CLAIMED, n_records=n_confirmed)
+        return JsonResponse({'results': results})
+
+
 class QualifyrReportFields(rest_framework.views.APIView):
     def get(self, request: HttpRequest, **kwargs) -> JsonResponse:
         """